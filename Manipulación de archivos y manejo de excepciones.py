@@ -47,46 +47,427 @@ class Producto:
 
 
 # inventario.py
+import contextlib
+import csv
+import gc
+import itertools
+import multiprocessing
 import os
+import struct
+import sys
+import threading
+
+class ProductosDiferidos(dict):
+    """
+    Diccionario id -> Producto que guarda los productos cargados como tuplas (nombre, cantidad, precio)
+    y solo crea el objeto Producto la primera vez que se pide.
+    """
+    def __getitem__(self, id_prod):
+        valor = dict.__getitem__(self, id_prod)
+        if type(valor) is tuple:
+            valor = Producto(id_prod, *valor)
+            dict.__setitem__(self, id_prod, valor)
+        return valor
+
+    def get(self, id_prod, defecto=None):
+        return self[id_prod] if id_prod in self else defecto
+
+    def pop(self, id_prod, *defecto):
+        if id_prod not in self:
+            if defecto:
+                return defecto[0]
+            raise KeyError(id_prod)
+        valor = self[id_prod]
+        dict.__delitem__(self, id_prod)
+        return valor
+
+    def values(self):
+        return (self[id_prod] for id_prod in list(dict.keys(self)))
+
+    def items(self):
+        return ((id_prod, self[id_prod]) for id_prod in list(dict.keys(self)))
+
+    def filas(self):
+        """Genera tuplas (id, nombre, cantidad, precio) sin crear los productos pendientes"""
+        for id_prod, valor in list(dict.items(self)):
+            if type(valor) is tuple:
+                yield (id_prod,) + valor
+            else:
+                yield valor.id, valor.nombre, valor.cantidad, valor.precio
+
+
+class AlmacenBinario:
+    """
+    Inventario en registros binarios de ancho fijo, que permiten actualizar un producto en su sitio.
+    El archivo principal tiene una cabecera (firma y generación) seguida de un registro por producto:
+    activo, id, cantidad, precio y la posición y longitud de su nombre. Los nombres se guardan en un
+    montón aparte (archivo + '.nombres.<generación>') al que solo se añade. Los huecos de los productos
+    eliminados se reutilizan; reescribir() crea una generación nueva sin nombres huérfanos.
+    """
+    FIRMA = b'INVBIN01'
+    CABECERA = struct.Struct('<8sQ')  # Firma y generación del montón de nombres
+    REGISTRO = struct.Struct('<BqqdQI')  # Activo, id, cantidad, precio, posición y longitud del nombre
+    CANTIDAD_PRECIO = struct.Struct('<qd')
+    DESPLAZAMIENTO_CANTIDAD = 9  # Posición de la cantidad dentro del registro
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._generacion = 0
+        self._registros = None
+        self._nombres = None
+        self._posiciones = {}  # Diccionario id -> (número de registro, nombre)
+        self._huecos = []  # Registros de productos eliminados, disponibles para reutilizar
+        self._total_registros = 0
+
+    def _ruta_nombres(self, generacion):
+        return f"{self.ruta}.nombres.{generacion}"
+
+    def _posicion(self, numero):
+        return self.CABECERA.size + numero * self.REGISTRO.size
+
+    def cargar(self):
+        """Abre (o crea) los archivos y retorna la lista de filas (id, nombre, cantidad, precio)"""
+        if not os.path.exists(self.ruta):
+            with open(self.ruta, 'wb') as f:
+                f.write(self.CABECERA.pack(self.FIRMA, 0))
+        with open(self.ruta, 'rb') as f:
+            contenido = f.read()
+        firma, self._generacion = self.CABECERA.unpack_from(contenido)
+        if firma != self.FIRMA:
+            raise ValueError(f"{self.ruta} no es un inventario binario")
+        ruta_nombres = self._ruta_nombres(self._generacion)
+        if not os.path.exists(ruta_nombres):
+            open(ruta_nombres, 'wb').close()
+        with open(ruta_nombres, 'rb') as f:
+            nombres = f.read()
+        # Un registro escrito a medias al final del archivo se descarta
+        fin = len(contenido) - (len(contenido) - self.CABECERA.size) % self.REGISTRO.size
+        if fin != len(contenido):
+            print("Advertencia: Se descartó un registro incompleto al final del inventario binario")
+        filas = []
+        self._posiciones = {}
+        self._huecos = []
+        for numero, (activo, id_prod, cantidad, precio, inicio, longitud) in enumerate(
+                self.REGISTRO.iter_unpack(memoryview(contenido)[self.CABECERA.size:fin])):
+            if not activo or inicio + longitud > len(nombres):
+                self._huecos.append(numero)
+                continue
+            nombre = nombres[inicio:inicio + longitud].decode('utf-8')
+            self._posiciones[id_prod] = (numero, nombre)
+            filas.append((id_prod, nombre, cantidad, precio))
+        self._total_registros = (fin - self.CABECERA.size) // self.REGISTRO.size
+        self._registros = open(self.ruta, 'r+b')
+        self._registros.truncate(fin)
+        self._nombres = open(ruta_nombres, 'ab')
+        return filas
+
+    def _agregar_nombre(self, nombre):
+        datos = nombre.encode('utf-8')
+        inicio = self._nombres.tell()
+        self._nombres.write(datos)
+        return inicio, len(datos)
+
+    def aplicar(self, registros, sincronizar=False):
+        """Aplica registros ('P', id, nombre, cantidad, precio) o ('E', id) escribiendo solo lo que cambia"""
+        for registro in registros:
+            if registro[0] == 'E':
+                actual = self._posiciones.get(registro[1])
+                if actual is not None:
+                    self._registros.seek(self._posicion(actual[0]))
+                    self._registros.write(b'\x00')
+                    del self._posiciones[registro[1]]
+                    self._huecos.append(actual[0])
+                continue
+            _, id_prod, nombre, cantidad, precio = registro
+            actual = self._posiciones.get(id_prod)
+            if actual is not None and actual[1] == nombre:
+                # Solo cambian cantidad y precio: 16 bytes en su sitio
+                self._registros.seek(self._posicion(actual[0]) + self.DESPLAZAMIENTO_CANTIDAD)
+                self._registros.write(self.CANTIDAD_PRECIO.pack(cantidad, precio))
+                continue
+            inicio, longitud = self._agregar_nombre(nombre)
+            self._nombres.flush()  # El nombre debe estar escrito antes que el registro que lo señala
+            if actual is not None:
+                numero = actual[0]
+            elif self._huecos:
+                numero = self._huecos[-1]
+            else:
+                numero = self._total_registros
+            self._registros.seek(self._posicion(numero))
+            self._registros.write(self.REGISTRO.pack(1, id_prod, cantidad, precio, inicio, longitud))
+            if actual is None:
+                if self._huecos and numero == self._huecos[-1]:
+                    self._huecos.pop()
+                else:
+                    self._total_registros += 1
+            self._posiciones[id_prod] = (numero, nombre)
+        self._registros.flush()
+        if sincronizar:
+            self.sincronizar()
+
+    def sincronizar(self):
+        for archivo in (self._nombres, self._registros):
+            if archivo is not None:
+                archivo.flush()
+                os.fsync(archivo.fileno())
+
+    def reescribir(self, filas):
+        """
+        Escribe todos los productos en una generación nueva de archivos, sin huecos ni nombres huérfanos.
+        El archivo principal se reemplaza de forma atómica: hasta entonces sigue valiendo la generación anterior.
+        """
+        generacion = self._generacion + 1
+        temporal = self.ruta + '.tmp'
+        with open(self._ruta_nombres(generacion), 'wb') as nombres, open(temporal, 'wb') as registros:
+            registros.write(self.CABECERA.pack(self.FIRMA, generacion))
+            inicio = 0
+            for id_prod, nombre, cantidad, precio in filas:
+                datos = nombre.encode('utf-8')
+                nombres.write(datos)
+                registros.write(self.REGISTRO.pack(1, id_prod, cantidad, precio, inicio, len(datos)))
+                inicio += len(datos)
+            for archivo in (nombres, registros):
+                archivo.flush()
+                os.fsync(archivo.fileno())
+        self.cerrar()
+        os.replace(temporal, self.ruta)
+        anterior = self._ruta_nombres(self._generacion)
+        if os.path.exists(anterior):
+            os.remove(anterior)
+        self.cargar()
+
+    def cerrar(self):
+        for archivo in (self._nombres, self._registros):
+            if archivo is not None:
+                archivo.close()
+        self._nombres = self._registros = None
+
 
 class Inventario:
-    def __init__(self, archivo='inventario.txt'):
+    """
+    Inventario guardado en un archivo de texto (una línea id,nombre,cantidad,precio por producto).
+    Con diario=True cada cambio se añade como una línea al final de un diario en lugar de
+    reescribir el archivo completo; el diario se compacta en segundo plano en un archivo base nuevo.
+    Con diferido=True los cambios se acumulan en memoria y se escriben juntos cuando hay
+    lote_maximo pendientes o han pasado ventana_durabilidad segundos desde el primero.
+    Con formato='binario' se usa un AlmacenBinario, que actualiza cada producto en su sitio.
+    Los nombres con comas, comillas o saltos de línea se guardan entre comillas, como en CSV;
+    los archivos así escritos empiezan con MARCA_CSV. Los que no la tienen son del formato anterior
+    y se leen sin comillas, dividiendo cada línea por comas.
+    """
+    TAMANO_BLOQUE = 65536  # Filas que se leen y convierten juntas al cargar
+    MARCA_CSV = "#inventario-csv-entrecomillado\n"  # Primera línea de los archivos con campos entre comillas
+
+    def __init__(self, archivo='inventario.txt', diario=False, sincronizar_cada=100, compactar_cada=10000,
+                 diferido=False, lote_maximo=1000, ventana_durabilidad=1.0, formato='csv'):
+        if formato not in ('csv', 'binario'):
+            raise ValueError("El formato debe ser 'csv' o 'binario'")
+        if formato == 'binario' and diario:
+            raise ValueError("El formato binario ya actualiza en el sitio y no usa diario")
         self.archivo = archivo
-        self.productos = {}
+        self.productos = ProductosDiferidos()
         self._ultimo_id = 0
+        self._usar_diario = diario
+        self._archivo_diario = archivo + '.diario'
+        self._archivo_compactando = archivo + '.diario.compactando'
+        self._archivo_respaldo = archivo + '.bak'  # Versión anterior del archivo, conservada en cada guardado
+        self._sincronizar_cada = sincronizar_cada  # Registros escritos entre dos fsync del diario
+        self._compactar_cada = compactar_cada  # Registros del diario que provocan una compactación
+        self._diario = None
+        self._registros_diario = 0
+        self._sin_sincronizar = 0
+        self._compactacion = None
+        self._cerrojo = threading.Lock()
+        # Escritura diferida: registros pendientes y temporizador que los vacía al cumplirse la ventana
+        self._diferido = diferido
+        self._lote_maximo = lote_maximo
+        self._ventana_durabilidad = ventana_durabilidad  # Segundos que un cambio puede esperar en memoria
+        self._pendientes = []
+        self._lotes_abiertos = 0
+        self._temporizador = None
+        self._cerrojo_vaciado = threading.Lock()  # Evita que dos vaciados escriban desordenados
+        self._binario = AlmacenBinario(archivo) if formato == 'binario' else None
         self._cargar_inventario()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self.cerrar()
+        return False
+
     def _cargar_inventario(self):
-        """Carga el inventario desde el archivo"""
+        """Carga el inventario desde el archivo y, en modo diario, aplica después los cambios del diario"""
         try:
+            if self._binario is not None:
+                filas = self._binario.cargar()
+                dict.update(self.productos, ((fila[0], fila[1:]) for fila in filas))
+                self._ultimo_id = max((fila[0] for fila in filas), default=0)
+                return
+            ruta = self.archivo
             if not os.path.exists(self.archivo):
-                open(self.archivo, 'w').close()
+                if os.path.exists(self._archivo_respaldo):
+                    # Un guardado se interrumpió entre el respaldo y el reemplazo
+                    print("Advertencia: No se encontró el inventario; se carga la copia de seguridad")
+                    ruta = self._archivo_respaldo
+                else:
+                    open(self.archivo, 'w').close()
                 
-            with open(self.archivo, 'r') as f:
-                for linea in f:
-                    datos = linea.strip().split(',')
-                    if len(datos) != 4:
-                        continue
-                    try:
-                        id_prod = int(datos[0])
-                        nombre = datos[1]
-                        cantidad = int(datos[2])
-                        precio = float(datos[3])
-                        self.productos[id_prod] = Producto(id_prod, nombre, cantidad, precio)
-                        self._ultimo_id = max(self._ultimo_id, id_prod)
-                    except (ValueError, IndexError):
-                        print(f"Advertencia: Formato inválido en línea: {linea}")
+            invalidas = []
+            # El recolector de ciclos no aporta nada mientras se crean millones de tuplas y las ralentiza
+            recolector_activo = gc.isenabled()
+            gc.disable()
+            try:
+                with open(ruta, 'r', newline='', buffering=1 << 20) as f:
+                    entrecomillado = f.readline() == self.MARCA_CSV
+                    if entrecomillado:
+                        lector = csv.reader(f)
+                        numero_linea = 1
+                    else:
+                        # Formato anterior: cada línea se divide por comas igual que con split(',')
+                        f.seek(0)
+                        lector = csv.reader(f, quoting=csv.QUOTE_NONE)
+                        numero_linea = 0
+                    while True:
+                        bloque = list(itertools.islice(lector, self.TAMANO_BLOQUE))
+                        if not bloque:
+                            break
+                        self._cargar_bloque(bloque, numero_linea, invalidas)
+                        numero_linea += len(bloque)
+            finally:
+                if recolector_activo:
+                    gc.enable()
+            self._avisar_invalidas(invalidas, "filas con formato inválido en el inventario")
+            if self._usar_diario:
+                # Un diario de una compactación interrumpida es anterior al diario actual
+                diarios = [ruta for ruta in (self._archivo_compactando, self._archivo_diario)
+                           if os.path.exists(ruta)]
+                anteriores = [ruta for ruta in diarios if not self._aplicar_diario(ruta)]
+                if anteriores:
+                    # Los diarios del formato anterior se incorporan al archivo base, para que
+                    # los registros nuevos, entre comillas, no se añadan a un diario sin marca
+                    self._reemplazar_archivo(self._linea_csv(fila) for fila in self.productos.filas())
+                    for ruta in diarios:
+                        os.remove(ruta)
+                    self._registros_diario = 0
         except PermissionError:
             print("Error: Sin permisos para leer el archivo de inventario")
         except Exception as e:
             print(f"Error inesperado al cargar inventario: {str(e)}")
 
+    def _cargar_bloque(self, bloque, primera_linea, invalidas):
+        """
+        Convierte un bloque de filas columna a columna. Si alguna fila no es válida,
+        el bloque se repite fila a fila para descartar solo las erróneas.
+        """
+        filas = [fila for fila in bloque if len(fila) == 4]
+        try:
+            ids = list(map(int, (fila[0] for fila in filas)))
+            cantidades = list(map(int, (fila[2] for fila in filas)))
+            precios = list(map(float, (fila[3] for fila in filas)))
+        except ValueError:
+            for numero, fila in enumerate(bloque, primera_linea + 1):
+                try:
+                    self._cargar_producto(fila)
+                except (ValueError, IndexError):
+                    if any(campo.strip() for campo in fila):
+                        invalidas.append(numero)
+            return
+        if len(filas) != len(bloque):
+            invalidas.extend(numero for numero, fila in enumerate(bloque, primera_linea + 1)
+                             if len(fila) != 4 and any(campo.strip() for campo in fila))
+        dict.update(self.productos, zip(ids, zip((fila[1] for fila in filas), cantidades, precios)))
+        if ids:
+            self._ultimo_id = max(self._ultimo_id, max(ids))
+
+    def _cargar_producto(self, datos):
+        if len(datos) != 4:
+            raise ValueError(datos)
+        id_prod = int(datos[0])
+        nombre = datos[1]
+        cantidad = int(datos[2])
+        precio = float(datos[3])
+        dict.__setitem__(self.productos, id_prod, (nombre, cantidad, precio))
+        self._ultimo_id = max(self._ultimo_id, id_prod)
+
+    @staticmethod
+    def _avisar_invalidas(invalidas, descripcion):
+        """Muestra un único aviso con el número de filas descartadas y las primeras de ellas"""
+        if invalidas:
+            primeras = ", ".join(str(numero) for numero in invalidas[:10])
+            print(f"Advertencia: {len(invalidas)} {descripcion} (filas {primeras}"
+                  f"{', ...' if len(invalidas) > 10 else ''})")
+
+    def _aplicar_diario(self, ruta):
+        """
+        Aplica los registros del diario: 'P,id,nombre,cantidad,precio' guarda un producto y 'E,id' lo elimina.
+        Un registro final incompleto (por un corte durante la escritura) se recorta del archivo,
+        para que los registros que se añadan después no queden pegados a él.
+        Retorna False si el diario no está vacío y es del formato anterior, sin comillas.
+        """
+        with open(ruta, 'rb') as f:
+            datos = f.read()
+        entrecomillado = datos.startswith(self.MARCA_CSV.encode())
+        fin = self._fin_registros_completos(datos, entrecomillado)
+        if fin < len(datos):
+            print(f"Advertencia: Se descartó un registro incompleto al final del diario {ruta}")
+            with open(ruta, 'r+b') as f:
+                f.truncate(fin)
+                f.flush()
+                os.fsync(f.fileno())
+        invalidas = []
+        with open(ruta, 'r', newline='') as f:
+            if entrecomillado:
+                f.readline()
+                lector = csv.reader(f)
+            else:
+                lector = csv.reader(f, quoting=csv.QUOTE_NONE)
+            for numero, datos in enumerate(lector, 2 if entrecomillado else 1):
+                try:
+                    if datos[0] == 'P' and len(datos) == 5:
+                        self._cargar_producto(datos[1:])
+                    elif datos[0] == 'E' and len(datos) == 2:
+                        dict.pop(self.productos, int(datos[1]), None)
+                    else:
+                        raise ValueError(datos)
+                    self._registros_diario += 1
+                except (ValueError, IndexError):
+                    invalidas.append(numero)
+        self._avisar_invalidas(invalidas, f"registros inválidos en el diario {ruta}")
+        return entrecomillado or not fin
+
+    @staticmethod
+    def _fin_registros_completos(datos, entrecomillado=True):
+        """Retorna la posición tras el último salto de línea que cierra un registro (fuera de comillas)"""
+        fin = posicion = 0
+        comillas = 0
+        for linea in datos.split(b'\n')[:-1]:
+            posicion += len(linea) + 1
+            if entrecomillado:
+                comillas += linea.count(b'"')
+            if comillas % 2 == 0:
+                fin = posicion
+        return fin
+
+    @staticmethod
+    def _linea_csv(campos):
+        """Codifica los campos como una línea CSV, entre comillas los que contienen comas, comillas o saltos de línea"""
+        partes = []
+        for campo in campos:
+            texto = str(campo)
+            if ',' in texto or '"' in texto or '\n' in texto or '\r' in texto:
+                texto = '"' + texto.replace('"', '""') + '"'
+            partes.append(texto)
+        return ",".join(partes) + "\n"
+
     def _guardar_inventario(self):
         """Guarda todo el inventario en el archivo"""
         try:
-            with open(self.archivo, 'w') as f:
-                for producto in self.productos.values():
-                    f.write(f"{producto.id},{producto.nombre},{producto.cantidad},{producto.precio}\n")
+            if self._binario is not None:
+                with self._cerrojo:
+                    self._binario.reescribir(self.productos.filas())
+                return True
+            self._reemplazar_archivo(self._linea_csv(fila) for fila in self.productos.filas())
             return True
         except PermissionError:
             print("Error: Sin permisos para escribir en el archivo")
@@ -95,6 +476,212 @@ class Inventario:
             print(f"Error al guardar inventario: {str(e)}")
             return False
 
+    def _reemplazar_archivo(self, lineas):
+        """
+        Escribe el archivo de forma atómica: primero en un temporal sincronizado con fsync y después
+        lo pone en su lugar con os.replace. El archivo anterior se conserva como copia de seguridad.
+        Un fallo a mitad de escritura deja intacto el archivo anterior.
+        """
+        temporal = self.archivo + '.tmp'
+        with open(temporal, 'w', newline='') as f:
+            f.write(self.MARCA_CSV)
+            f.writelines(lineas)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(self.archivo):
+            os.replace(self.archivo, self._archivo_respaldo)
+        os.replace(temporal, self.archivo)
+        # Sincroniza el directorio para que los renombrados sobrevivan a un corte de corriente
+        if hasattr(os, 'O_DIRECTORY'):
+            descriptor = os.open(os.path.dirname(os.path.abspath(self.archivo)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
+
+    def _registrar(self, registro):
+        """
+        Persiste un cambio: en modo diario lo añade al diario, si no reescribe todo el archivo.
+        En escritura diferida o dentro de lote() solo lo encola; el cambio se da por bueno
+        y, si luego falla la escritura, queda pendiente para el siguiente vaciado.
+        """
+        if self._diferido or self._lotes_abiertos:
+            with self._cerrojo:
+                self._pendientes.append(registro)
+                pendientes = len(self._pendientes)
+                self._programar_vaciado()
+            if pendientes >= self._lote_maximo:
+                self.flush()
+            return True
+        return self._escribir([registro])
+
+    def _escribir(self, registros, sincronizar=False):
+        """Escribe los registros con una sola escritura (o una sola reescritura del archivo completo)"""
+        if self._binario is not None:
+            try:
+                with self._cerrojo:
+                    self._sin_sincronizar += len(registros)
+                    sincronizar = sincronizar or self._sin_sincronizar >= self._sincronizar_cada
+                    self._binario.aplicar(registros, sincronizar)
+                    if sincronizar:
+                        self._sin_sincronizar = 0
+                return True
+            except Exception as e:
+                print(f"Error al escribir en el inventario binario: {str(e)}")
+                return False
+        if not self._usar_diario:
+            return self._guardar_inventario()
+        try:
+            with self._cerrojo:
+                if self._diario is None:
+                    self._diario = open(self._archivo_diario, 'a', newline='')
+                posicion = self._diario.tell()
+                marca = self.MARCA_CSV if posicion == 0 else ""
+                try:
+                    self._diario.write(marca + "".join(self._linea_csv(registro) for registro in registros))
+                    self._diario.flush()
+                    self._sin_sincronizar += len(registros)
+                    if sincronizar or self._sin_sincronizar >= self._sincronizar_cada:
+                        os.fsync(self._diario.fileno())
+                        self._sin_sincronizar = 0
+                except Exception:
+                    # Se descartan los registros escritos a medias para no corromper los siguientes
+                    self._diario.truncate(posicion)
+                    raise
+                self._registros_diario += len(registros)
+            if self._registros_diario >= self._compactar_cada:
+                self.compactar()
+            return True
+        except PermissionError:
+            print("Error: Sin permisos para escribir en el diario")
+            return False
+        except Exception as e:
+            print(f"Error al escribir en el diario: {str(e)}")
+            return False
+
+    def flush(self):
+        """Escribe de una vez los cambios pendientes; si falla, siguen pendientes y retorna False"""
+        with self._cerrojo_vaciado:
+            with self._cerrojo:
+                registros = self._pendientes
+                self._pendientes = []
+                if self._temporizador is not None:
+                    self._temporizador.cancel()
+                    self._temporizador = None
+            if not registros:
+                return True
+            if self._escribir(registros, sincronizar=True):
+                return True
+            with self._cerrojo:
+                self._pendientes = registros + self._pendientes
+                # Se reintenta cuando se cumpla otra ventana, sin esperar a lote_maximo
+                self._programar_vaciado()
+            return False
+
+    def _programar_vaciado(self):
+        """Arranca el temporizador de la ventana de durabilidad si hay cambios pendientes y no hay uno en marcha"""
+        if (self._pendientes and self._temporizador is None and self._diferido
+                and self._ventana_durabilidad is not None):
+            self._temporizador = threading.Timer(self._ventana_durabilidad, self.flush)
+            self._temporizador.daemon = True
+            self._temporizador.start()
+
+    @contextlib.contextmanager
+    def lote(self):
+        """Agrupa los cambios hechos dentro del bloque with en una sola escritura al salir"""
+        self._lotes_abiertos += 1
+        try:
+            yield self
+        finally:
+            self._lotes_abiertos -= 1
+            if not self._lotes_abiertos:
+                self.flush()
+
+    @staticmethod
+    def _registro_producto(producto):
+        return ('P', producto.id, producto.nombre, producto.cantidad, producto.precio)
+
+    def sincronizar(self):
+        """Fuerza a disco los registros del diario pendientes de fsync"""
+        with self._cerrojo:
+            if self._binario is not None:
+                self._binario.sincronizar()
+                self._sin_sincronizar = 0
+            elif self._diario is not None and self._sin_sincronizar:
+                os.fsync(self._diario.fileno())
+                self._sin_sincronizar = 0
+
+    def compactar(self, esperar=False):
+        """
+        Inicia la compactación del diario: el estado actual se escribe en segundo plano como
+        nuevo archivo base y los cambios siguientes van a un diario nuevo.
+        En formato binario reescribe el archivo sin huecos ni nombres huérfanos.
+        """
+        if self._binario is not None:
+            return self._guardar_inventario()
+        if not self._usar_diario or (self._compactacion is not None and self._compactacion.is_alive()):
+            return False
+        with self._cerrojo:
+            if self._diario is not None:
+                self._diario.flush()
+                os.fsync(self._diario.fileno())
+                self._diario.close()
+                self._diario = None
+            self._sin_sincronizar = 0
+            if not os.path.exists(self._archivo_diario):
+                return False
+            if os.path.exists(self._archivo_compactando):
+                # Una compactación anterior falló y su diario no está en ningún otro sitio: se le añade
+                # el diario actual. Si hay un corte antes de borrarlo, repetir sus registros no cambia nada.
+                with open(self._archivo_diario, 'rb') as origen:
+                    datos = origen.read()
+                marca = self.MARCA_CSV.encode()
+                if datos.startswith(marca):
+                    datos = datos[len(marca):]
+                with open(self._archivo_compactando, 'ab') as destino:
+                    destino.write(datos)
+                    destino.flush()
+                    os.fsync(destino.fileno())
+                os.remove(self._archivo_diario)
+            else:
+                os.replace(self._archivo_diario, self._archivo_compactando)
+            self._registros_diario = 0
+            lineas = [self._linea_csv(fila) for fila in self.productos.filas()]
+        self._compactacion = threading.Thread(target=self._escribir_base, args=(lineas,), daemon=True)
+        self._compactacion.start()
+        if esperar:
+            self._compactacion.join()
+        return True
+
+    def _escribir_base(self, lineas):
+        """Escribe el nuevo archivo base y solo entonces descarta el diario ya incluido en él"""
+        try:
+            self._reemplazar_archivo(lineas)
+            os.remove(self._archivo_compactando)
+        except Exception as e:
+            # El diario en compactación se conserva y se vuelve a aplicar al cargar
+            print(f"Error al compactar el inventario: {str(e)}")
+
+    def cerrar(self):
+        """Escribe los cambios pendientes, espera a la compactación en curso y cierra el diario"""
+        self.flush()
+        if self._compactacion is not None:
+            self._compactacion.join()
+        with self._cerrojo:
+            # Si el último vaciado falló, los cambios siguen en _pendientes pero ya no se reintentan solos
+            if self._temporizador is not None:
+                self._temporizador.cancel()
+                self._temporizador = None
+            if self._binario is not None:
+                self._binario.sincronizar()
+                self._binario.cerrar()
+            if self._diario is not None:
+                self._diario.flush()
+                os.fsync(self._diario.fileno())
+                self._diario.close()
+                self._diario = None
+                self._sin_sincronizar = 0
+
     def generar_id(self):
         self._ultimo_id += 1
         return self._ultimo_id
@@ -104,7 +691,7 @@ class Inventario:
             id_producto = self.generar_id()
             nuevo_producto = Producto(id_producto, nombre, cantidad, precio)
             self.productos[id_producto] = nuevo_producto
-            if self._guardar_inventario():
+            if self._registrar(self._registro_producto(nuevo_producto)):
                 return id_producto
             else:
                 del self.productos[id_producto]
@@ -117,7 +704,7 @@ class Inventario:
     def eliminar_producto(self, id_producto):
         if id_producto in self.productos:
             producto = self.productos.pop(id_producto)
-            if self._guardar_inventario():
+            if self._registrar(('E', id_producto)):
                 return True
             else:
                 self.productos[id_producto] = producto
@@ -138,7 +725,7 @@ class Inventario:
                 print(f"Error: {str(e)}")
                 return False
             
-            if self._guardar_inventario():
+            if self._registrar(self._registro_producto(producto)):
                 return True
             else:
                 producto.cantidad, producto.precio = original
@@ -146,12 +733,81 @@ class Inventario:
         return False
 
     def buscar_por_nombre(self, nombre):
-        return [p for p in self.productos.values() if nombre.lower() in p.nombre.lower()]
+        nombre = nombre.lower()
+        return [self.productos[fila[0]] for fila in self.productos.filas() if nombre in fila[1].lower()]
 
     def mostrar_inventario(self):
         return list(self.productos.values())
 
 
+PUNTOS_DE_FALLO = ("escritura", "fsync", "respaldo", "renombrado")
+
+def _guardar_con_fallo(archivo, punto):
+    """Proceso hijo: añade un producto (lo que reescribe el archivo) y termina de golpe en el punto indicado"""
+    inventario = Inventario(archivo)
+    if punto == "escritura":
+        # Muere tras convertir la mitad de las filas, con el temporal escrito a medias
+        linea_csv = Inventario._linea_csv
+        filas = []
+
+        def linea_con_fallo(campos):
+            filas.append(campos)
+            if len(filas) > len(inventario.productos) // 2:
+                os._exit(1)
+            return linea_csv(campos)
+        inventario._linea_csv = linea_con_fallo
+    elif punto == "fsync":
+        os.fsync = lambda descriptor: os._exit(1)
+    else:
+        # "respaldo": muere antes de apartar el archivo anterior; "renombrado": entre los dos renombrados
+        reemplazar = os.replace
+        llamadas = []
+
+        def replace(origen, destino):
+            llamadas.append(origen)
+            if punto == "respaldo" and len(llamadas) == 1:
+                os._exit(1)
+            reemplazar(origen, destino)
+            if punto == "renombrado" and len(llamadas) == 1:
+                os._exit(1)
+        os.replace = replace
+    inventario.agregar_producto("Producto nuevo", 1, 1.0)
+    os._exit(0)
+
+def probar_fallos_guardado(archivo='prueba_fallos.txt', num_productos=1000):
+    """
+    Inyección de fallos: un proceso hijo reescribe el inventario y termina de golpe en cada punto
+    del guardado; después debe cargarse completo el inventario anterior o el nuevo.
+    Retorna un diccionario punto -> (código de salida del hijo, resultado de la comprobación).
+    """
+    rutas = (archivo, archivo + '.bak', archivo + '.tmp')
+    resultados = {}
+    for punto in PUNTOS_DE_FALLO:
+        for ruta in rutas:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        anterior = Inventario(archivo)
+        with anterior.lote():
+            for i in range(num_productos):
+                anterior.agregar_producto(f"Producto {i}", i, 1.0)
+        esperado = sorted(anterior.productos.filas())
+        hijo = multiprocessing.Process(target=_guardar_con_fallo, args=(archivo, punto))
+        hijo.start()
+        hijo.join()
+        cargado = sorted(Inventario(archivo).productos.filas())
+        if cargado == esperado:
+            estado = "anterior"
+        elif cargado[:-1] == esperado and cargado[-1][1] == "Producto nuevo":
+            estado = "nuevo"
+        else:
+            estado = f"PERDIDO ({len(cargado)} productos)"
+        resultados[punto] = (hijo.exitcode, estado)
+    for ruta in rutas:
+        if os.path.exists(ruta):
+            os.remove(ruta)
+    return resultados
+
+
 # main.py
 def mostrar_menu():
     print("\n=== SISTEMA DE INVENTARIO DE PRODUCTOS DE BELLEZA PARA UÑAS ===")
@@ -228,6 +884,7 @@ def main():
                 print("El inventario está vacío")
 
         elif opcion == "6":
+            inventario.cerrar()
             print("¡Gracias por usar el sistema!")
             break
 
@@ -235,4 +892,8 @@ def main():
             print("Opción inválida")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "--probar-fallos":
+        for punto, (codigo, estado) in probar_fallos_guardado().items():
+            print(f"Fallo en {punto:<10} (salida del hijo {codigo}): se recupera el inventario {estado}")
+    else:
+        main()
\ No newline at end of file
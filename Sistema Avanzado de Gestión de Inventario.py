@@ -1,5 +1,7 @@
 import json
+import multiprocessing
 import os
+import sys
 
 class Producto:
     def __init__(self, id, nombre, cantidad, precio):
@@ -49,23 +51,107 @@ class Inventario:
         return [p.get_info() for p in self.productos.values()]
 
 def guardar_datos(inventario, archivo="inventario.json"):
-    with open(archivo, 'w') as f:
+    # Se escribe en un temporal y se reemplaza de una vez: un corte a mitad no deja el archivo truncado.
+    # La versión anterior queda como copia de seguridad en archivo + ".bak".
+    temporal = archivo + ".tmp"
+    with open(temporal, 'w') as f:
         datos = [vars(p) for p in inventario.productos.values()]
         json.dump(datos, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    if os.path.exists(archivo):
+        os.replace(archivo, archivo + ".bak")
+    os.replace(temporal, archivo)
+    # Sincroniza el directorio para que los renombrados sobrevivan a un corte de corriente
+    if hasattr(os, 'O_DIRECTORY'):
+        descriptor = os.open(os.path.dirname(os.path.abspath(archivo)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
 
 def cargar_datos(archivo="inventario.json"):
     inventario = Inventario()
-    if os.path.exists(archivo):
-        with open(archivo, 'r') as f:
-            try:
-                datos = json.load(f)
-                for item in datos:
-                    producto = Producto(**item)
-                    inventario.añadir_producto(producto)
-            except json.JSONDecodeError:
-                pass
+    # Si falta el archivo o está dañado, se recurre a la copia de seguridad
+    for ruta in (archivo, archivo + ".bak"):
+        if os.path.exists(ruta):
+            with open(ruta, 'r') as f:
+                try:
+                    datos = json.load(f)
+                    for item in datos:
+                        producto = Producto(**item)
+                        inventario.añadir_producto(producto)
+                    break
+                except json.JSONDecodeError:
+                    inventario = Inventario()
     return inventario
 
+PUNTOS_DE_FALLO = ("escritura", "fsync", "respaldo", "renombrado")
+
+def _guardar_con_fallo(archivo, punto, num_productos):
+    """Proceso hijo: guarda un inventario nuevo y termina de golpe (os._exit) en el punto indicado"""
+    inventario = Inventario()
+    for i in range(num_productos):
+        inventario.añadir_producto(Producto(f"N{i}", f"Nuevo {i}", i, 2.0))
+    if punto == "escritura":
+        # Escribe la mitad del JSON y muere, como un corte a mitad de escritura
+        def dump(datos, f, **opciones):
+            texto = json.dumps(datos, **opciones)
+            f.write(texto[:len(texto) // 2])
+            f.flush()
+            os._exit(1)
+        json.dump = dump
+    elif punto == "fsync":
+        os.fsync = lambda descriptor: os._exit(1)
+    else:
+        # "respaldo": muere antes de apartar el archivo anterior; "renombrado": entre los dos renombrados
+        reemplazar = os.replace
+        llamadas = []
+
+        def replace(origen, destino):
+            llamadas.append(origen)
+            if punto == "respaldo" and len(llamadas) == 1:
+                os._exit(1)
+            reemplazar(origen, destino)
+            if punto == "renombrado" and len(llamadas) == 1:
+                os._exit(1)
+        os.replace = replace
+    guardar_datos(inventario, archivo)
+    os._exit(0)
+
+def probar_fallos_guardado(archivo="prueba_fallos.json", num_productos=1000):
+    """
+    Inyección de fallos: guarda un inventario en un proceso hijo que termina de golpe en cada
+    punto del guardado y comprueba que después se carga completo el inventario anterior o el nuevo.
+    Retorna un diccionario punto -> (código de salida del hijo, resultado de la comprobación).
+    """
+    anterior = Inventario()
+    for i in range(num_productos):
+        anterior.añadir_producto(Producto(f"A{i}", f"Anterior {i}", i, 1.0))
+    esperados = (sorted(p["ID"] for p in anterior.mostrar_todo()),
+                 sorted(f"N{i}" for i in range(num_productos)))
+    resultados = {}
+    for punto in PUNTOS_DE_FALLO:
+        for ruta in (archivo, archivo + ".bak", archivo + ".tmp"):
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        guardar_datos(anterior, archivo)
+        hijo = multiprocessing.Process(target=_guardar_con_fallo, args=(archivo, punto, num_productos))
+        hijo.start()
+        hijo.join()
+        cargado = sorted(p["ID"] for p in cargar_datos(archivo).mostrar_todo())
+        if cargado == esperados[0]:
+            estado = "anterior"
+        elif cargado == esperados[1]:
+            estado = "nuevo"
+        else:
+            estado = f"PERDIDO ({len(cargado)} productos)"
+        resultados[punto] = (hijo.exitcode, estado)
+    for ruta in (archivo, archivo + ".bak", archivo + ".tmp"):
+        if os.path.exists(ruta):
+            os.remove(ruta)
+    return resultados
+
 def menu():
     inventario = cargar_datos()
     
@@ -129,4 +215,8 @@ def menu():
             print(f"Error: {str(e)}")
 
 if __name__ == "__main__":
-    menu()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "--probar-fallos":
+        for punto, (codigo, estado) in probar_fallos_guardado().items():
+            print(f"Fallo en {punto:<10} (salida del hijo {codigo}): se recupera el inventario {estado}")
+    else:
+        menu()
\ No newline at end of file
@@ -6,25 +6,57 @@ gestionando libros, usuarios, préstamos y devoluciones.
 Especializado en libros que han sido adaptados a series de TV o películas.
 """
 
+import array
+import asyncio
+import bisect
+import collections
+import contextlib
+import csv
+import functools
+import heapq
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import types
+import unicodedata
+import zlib
+from multiprocessing import resource_tracker, shared_memory
+
+
 class Libro:
     """
     Clase que representa un libro en la biblioteca.
-    Utiliza tuplas para almacenar datos inmutables como autor y título.
+    Autor y título son de solo lectura. Usa __slots__ para evitar el diccionario
+    por instancia, ya que un catálogo grande puede tener millones de libros.
     """
+    __slots__ = ("__titulo", "__autor", "__categoria", "__isbn", "__disponible", "__adaptacion", "__biblioteca")
+
     def __init__(self, titulo, autor, categoria, isbn, adaptacion=None):
-        self.__datos_inmutables = (titulo, autor)  # Tupla para datos que no cambiarán
+        self.__titulo = titulo  # Datos que no cambiarán: solo tienen getter
+        self.__autor = autor
         self.__categoria = categoria
         self.__isbn = isbn
         self.__disponible = True
         self.__adaptacion = adaptacion  # Información sobre la adaptación a serie/película
+        self.__biblioteca = None  # Biblioteca a la que se notifican los cambios
 
     @property
     def titulo(self):
-        return self.__datos_inmutables[0]
+        return self.__titulo
     
     @property
     def autor(self):
-        return self.__datos_inmutables[1]
+        return self.__autor
     
     @property
     def categoria(self):
@@ -32,7 +64,10 @@ class Libro:
     
     @categoria.setter
     def categoria(self, nueva_categoria):
+        anterior = self.__categoria
         self.__categoria = nueva_categoria
+        if self.__biblioteca is not None:
+            self.__biblioteca._libro_modificado(self, "categoria", anterior)
         
     @property
     def isbn(self):
@@ -44,7 +79,10 @@ class Libro:
     
     @disponible.setter
     def disponible(self, estado):
+        anterior = self.__disponible
         self.__disponible = estado
+        if self.__biblioteca is not None:
+            self.__biblioteca._libro_modificado(self, "disponible", anterior)
         
     @property
     def adaptacion(self):
@@ -52,7 +90,25 @@ class Libro:
     
     @adaptacion.setter
     def adaptacion(self, info_adaptacion):
+        anterior = self.__adaptacion
         self.__adaptacion = info_adaptacion
+        if self.__biblioteca is not None:
+            self.__biblioteca._libro_modificado(self, "adaptacion", anterior)
+
+    def _compartir_valores(self, categoria, adaptacion):
+        """Sustituye categoría y adaptación por copias compartidas con el mismo valor"""
+        self.__categoria = categoria
+        self.__adaptacion = adaptacion
+
+    def _vincular(self, biblioteca):
+        """Asocia el libro a la biblioteca que mantiene sus índices (None para desvincular)"""
+        self.__biblioteca = biblioteca
+
+    def _comprobar_vinculo(self, biblioteca):
+        """Lanza ValueError si el libro ya pertenece a otra biblioteca, cuyos índices dejarían de actualizarse"""
+        if self.__biblioteca is not None and self.__biblioteca is not biblioteca:
+            raise ValueError(f"El libro con ISBN {self.__isbn} ya pertenece a la biblioteca "
+                             f"{self.__biblioteca.nombre}")
         
     def __str__(self):
         estado = "Disponible" if self.__disponible else "Prestado"
@@ -60,181 +116,2696 @@ class Libro:
         return f"'{self.titulo}' por {self.autor} - {self.categoria} - ISBN: {self.isbn}{adaptacion_info} - {estado}"
 
 
-class Usuario:
+class Usuario:
+    """
+    Clase que representa a un usuario de la biblioteca.
+    Mantiene un registro de los libros prestados al usuario.
+    """
+    def __init__(self, nombre, id_usuario):
+        self.__nombre = nombre
+        self.__id_usuario = id_usuario
+        self.__libros_prestados = {}  # Diccionario ISBN -> libro prestado, en orden de préstamo
+        
+    @property
+    def nombre(self):
+        return self.__nombre
+    
+    @property
+    def id_usuario(self):
+        return self.__id_usuario
+    
+    @property
+    def libros_prestados(self):
+        """Vista de solo lectura de los libros prestados, en orden de préstamo"""
+        return self.__libros_prestados.values()
+    
+    def prestar_libro(self, libro):
+        """Añade un libro a los libros prestados del usuario"""
+        self.__libros_prestados[libro.isbn] = libro
+        
+    def devolver_libro(self, isbn):
+        """Elimina un libro de los libros prestados del usuario y lo retorna (None si no lo tenía)"""
+        return self.__libros_prestados.pop(isbn, None)
+
+    def tiene_libro(self, isbn):
+        """Indica si el usuario tiene prestado el libro con el ISBN indicado"""
+        return isbn in self.__libros_prestados
+    
+    def listar_libros_prestados(self):
+        """Retorna una lista de los libros prestados al usuario"""
+        return list(self.__libros_prestados.values())
+    
+    def __str__(self):
+        return f"Usuario: {self.__nombre} (ID: {self.__id_usuario}) - Libros prestados: {len(self.__libros_prestados)}"
+
+
+class SecuenciaOrdenada:
+    """
+    Registro del orden de alta de un conjunto de claves (ISBNs o IDs de usuario).
+    Cada clave recibe un número creciente que sirve como cursor estable para paginar:
+    un recorrido puede reanudarse desde el último número visto aunque haya altas o bajas.
+    """
+    def __init__(self):
+        self.__numeros = {}  # Diccionario clave -> número de alta
+        self.__lista_numeros = []  # Números de alta en orden creciente (incluye bajas pendientes de limpiar)
+        self.__lista_claves = []  # Clave correspondiente a cada número de la lista
+        self.__ultimo = 0
+
+    def __len__(self):
+        return len(self.__numeros)
+
+    def agregar(self, clave):
+        """Asigna a la clave el siguiente número de alta y lo retorna"""
+        self.__ultimo += 1
+        self.__numeros[clave] = self.__ultimo
+        self.__lista_numeros.append(self.__ultimo)
+        self.__lista_claves.append(clave)
+        return self.__ultimo
+
+    def eliminar(self, clave):
+        """Da de baja la clave; su hueco en las listas se limpia cuando abundan las bajas"""
+        del self.__numeros[clave]
+        if len(self.__lista_numeros) > 2 * len(self.__numeros) + 1024:
+            vigentes = sorted((numero, clave) for clave, numero in self.__numeros.items())
+            self.__lista_numeros = [numero for numero, _ in vigentes]
+            self.__lista_claves = [clave for _, clave in vigentes]
+
+    def numero(self, clave):
+        """Retorna el número de alta de la clave"""
+        return self.__numeros[clave]
+
+    def recorrer(self, cursor=None):
+        """
+        Genera pares (número, clave) en orden de alta, a partir del siguiente al cursor.
+        Admite altas y bajas durante el recorrido: si una baja compacta las listas,
+        el recorrido se reanuda tras el último número visto.
+        """
+        numeros = self.__lista_numeros
+        i = 0 if cursor is None else bisect.bisect_right(numeros, cursor)
+        while True:
+            if self.__lista_numeros is not numeros:
+                numeros = self.__lista_numeros
+                i = 0 if cursor is None else bisect.bisect_right(numeros, cursor)
+            if i >= len(numeros):
+                return
+            numero, clave = numeros[i], self.__lista_claves[i]
+            i += 1
+            cursor = numero
+            if self.__numeros.get(clave) == numero:
+                yield numero, clave
+
+
+class IndiceISBN:
+    """
+    Índice ordenado de ISBNs para consultas por prefijo y por rango en O(log n + k).
+    Los ISBN-10 y ISBN-13 se normalizan a un único entero (el ISBN-13 sin guiones),
+    guardado en un array compacto ordenado. Los ISBNs que no se pueden normalizar
+    se mantienen aparte en una lista ordenada de textos.
+    Varios ISBNs escritos de distinta forma pueden tener la misma clave (ISBN-10 y ISBN-13
+    del mismo libro, o con otros guiones): todos aparecen en las consultas de esa clave.
+    """
+    def __init__(self):
+        self.__claves = array.array("q")  # Claves enteras ordenadas
+        self.__isbns = {}  # Diccionario clave -> ISBN tal como se registró
+        self.__repetidos = {}  # Diccionario clave -> ISBNs registrados después con la misma clave
+        self.__otros = []  # ISBNs no normalizables, ordenados
+
+    @staticmethod
+    def normalizar(isbn):
+        """Retorna la clave entera del ISBN (como ISBN-13), o None si no es un ISBN válido"""
+        digitos = isbn.replace("-", "").replace(" ", "").upper()
+        if len(digitos) == 10 and digitos[:9].isdigit() and (digitos[9].isdigit() or digitos[9] == "X"):
+            # ISBN-10 -> ISBN-13: prefijo 978 y nuevo dígito de control
+            base = "978" + digitos[:9]
+            suma = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(base))
+            return int(base + str((10 - suma % 10) % 10))
+        if len(digitos) == 13 and digitos.isdigit():
+            return int(digitos)
+        return None
+
+    def agregar(self, isbn):
+        clave = self.normalizar(isbn)
+        if clave is None:
+            bisect.insort(self.__otros, isbn)
+            return
+        if clave in self.__isbns:
+            self.__repetidos.setdefault(clave, []).append(isbn)
+            return
+        bisect.insort(self.__claves, clave)
+        self.__isbns[clave] = isbn
+
+    def agregar_lote(self, isbns):
+        """Añade varios ISBNs reordenando las claves una sola vez"""
+        nuevas = []
+        for isbn in isbns:
+            clave = self.normalizar(isbn)
+            if clave is None:
+                bisect.insort(self.__otros, isbn)
+                continue
+            if clave in self.__isbns:
+                self.__repetidos.setdefault(clave, []).append(isbn)
+                continue
+            nuevas.append(clave)
+            self.__isbns[clave] = isbn
+        if nuevas:
+            nuevas.extend(self.__claves)
+            self.__claves = array.array("q", sorted(nuevas))
+
+    def eliminar(self, isbn):
+        clave = self.normalizar(isbn)
+        if clave is not None:
+            repetidos = self.__repetidos.get(clave)
+            if self.__isbns.get(clave) == isbn:
+                if repetidos:
+                    # La clave sigue en uso: pasa a representarla el siguiente ISBN con esa clave
+                    self.__isbns[clave] = repetidos.pop(0)
+                else:
+                    del self.__claves[bisect.bisect_left(self.__claves, clave)]
+                    del self.__isbns[clave]
+            elif repetidos and isbn in repetidos:
+                repetidos.remove(isbn)
+            if repetidos is not None and not repetidos:
+                del self.__repetidos[clave]
+            return
+        i = bisect.bisect_left(self.__otros, isbn)
+        if i < len(self.__otros) and self.__otros[i] == isbn:
+            del self.__otros[i]
+
+    def rango(self, desde, hasta):
+        """Retorna los ISBNs con clave en [desde, hasta], en orden creciente"""
+        i = bisect.bisect_left(self.__claves, desde)
+        j = bisect.bisect_right(self.__claves, hasta)
+        resultado = []
+        for clave in self.__claves[i:j]:
+            resultado.append(self.__isbns[clave])
+            if clave in self.__repetidos:
+                resultado.extend(self.__repetidos[clave])
+        return resultado
+
+    def prefijo(self, prefijo):
+        """
+        Retorna los ISBNs que empiezan por el prefijo indicado (ignorando guiones), en orden.
+        Un prefijo de ISBN-10 (hasta 9 dígitos, sin 978 ni 979) también encuentra los ISBN-10
+        registrados con él, que se guardan con la clave 978 + prefijo.
+        """
+        prefijo = prefijo.replace("-", "").replace(" ", "")
+        resultado = []
+        if prefijo.isdigit() and len(prefijo) <= 13:
+            # Todas las claves de 13 dígitos que empiezan por el prefijo forman un rango contiguo
+            prefijos = [prefijo]
+            if len(prefijo) <= 9 and not prefijo.startswith(("978", "979")):
+                prefijos.append("978" + prefijo)
+            for inicio in sorted(prefijos):
+                relleno = 10 ** (13 - len(inicio))
+                resultado.extend(self.rango(int(inicio) * relleno, (int(inicio) + 1) * relleno - 1))
+        i = bisect.bisect_left(self.__otros, prefijo)
+        while i < len(self.__otros) and self.__otros[i].startswith(prefijo):
+            resultado.append(self.__otros[i])
+            i += 1
+        return resultado
+
+
+class DiccionarioCodigos:
+    """
+    Codificación por diccionario de valores repetidos (categorías, adaptaciones).
+    Cada valor distinto recibe un código entero y se guarda una única copia del texto,
+    que comparten todos los libros con ese valor.
+    """
+    def __init__(self):
+        self.__codigos = {}  # Diccionario valor -> código
+        self.__valores = []  # Lista código -> valor
+        self.__minusculas = {}  # Diccionario valor en minúsculas -> lista de códigos
+
+    def codificar(self, valor):
+        """Retorna el código del valor, asignándole uno nuevo si no lo tenía"""
+        codigo = self.__codigos.get(valor)
+        if codigo is None:
+            codigo = self.__codigos[valor] = len(self.__valores)
+            self.__valores.append(valor)
+            self.__minusculas.setdefault(valor.lower(), []).append(codigo)
+        return codigo
+
+    def codigo(self, valor):
+        """Retorna el código del valor, o None si no está registrado"""
+        return self.__codigos.get(valor)
+
+    def valor(self, codigo):
+        """Retorna el valor correspondiente a un código"""
+        return self.__valores[codigo]
+
+    def internar(self, valor):
+        """Retorna la copia compartida del valor (None se mantiene como None)"""
+        if not valor:
+            return valor
+        return self.__valores[self.codificar(valor)]
+
+    def codigos_sin_mayusculas(self, valor):
+        """Retorna los códigos de los valores iguales al indicado sin distinguir mayúsculas"""
+        return self.__minusculas.get(valor.lower(), [])
+
+
+class IndiceTexto:
+    """
+    Índice invertido de palabras normalizadas (minúsculas y sin tildes) a ISBNs.
+    Mantiene además los sufijos ordenados del vocabulario, de modo que una
+    subcadena se resuelve con búsqueda binaria en lugar de recorrer el catálogo.
+    """
+    PALABRA = re.compile(r"[^\W_]+")  # Secuencia de letras o dígitos (como str.isalnum)
+
+    def __init__(self):
+        self.__publicaciones = {}  # Diccionario palabra -> conjunto de ISBNs
+        self.__sufijos = {}  # Diccionario sufijo -> conjunto de palabras que lo contienen
+        self.__sufijos_ordenados = []  # Lista ordenada de sufijos para búsqueda binaria
+
+    @staticmethod
+    def normalizar(texto):
+        """Convierte el texto a minúsculas y elimina las tildes"""
+        if texto.isascii():
+            return texto.lower()
+        descompuesto = unicodedata.normalize("NFKD", texto.lower())
+        return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+    @classmethod
+    def palabras(cls, texto):
+        """Divide el texto normalizado en secuencias alfanuméricas (lista vacía si no hay texto)"""
+        if not texto:
+            return []
+        return cls.PALABRA.findall(cls.normalizar(texto))
+
+    def agregar(self, isbn, texto, nuevos_sufijos=None, palabras=None):
+        """
+        Indexa las palabras del texto para el ISBN indicado.
+        Si se pasa la lista nuevos_sufijos, los sufijos nuevos se acumulan en ella
+        en lugar de insertarse ordenados (ver agregar_lote).
+        palabras permite reutilizar las palabras del texto ya calculadas con palabras().
+        """
+        if not texto:
+            return
+        for palabra in set(self.palabras(texto) if palabras is None else palabras):
+            isbns = self.__publicaciones.get(palabra)
+            if isbns is None:
+                isbns = self.__publicaciones[palabra] = set()
+                self.__registrar_sufijos(palabra, nuevos_sufijos)
+            isbns.add(isbn)
+
+    def agregar_lote(self, pares):
+        """
+        Indexa una secuencia de pares (ISBN, texto), o de ternas (ISBN, texto, palabras),
+        reordenando los sufijos una sola vez.
+        """
+        nuevos_sufijos = []
+        for isbn, texto, *palabras in pares:
+            self.agregar(isbn, texto, nuevos_sufijos, palabras[0] if palabras else None)
+        if nuevos_sufijos:
+            self.__sufijos_ordenados.extend(nuevos_sufijos)
+            self.__sufijos_ordenados.sort()
+
+    def eliminar(self, isbn, texto, palabras=None):
+        """Quita el ISBN de las palabras del texto indicado"""
+        if not texto:
+            return
+        for palabra in set(self.palabras(texto) if palabras is None else palabras):
+            isbns = self.__publicaciones.get(palabra)
+            if isbns is None:
+                continue
+            isbns.discard(isbn)
+            if not isbns:
+                del self.__publicaciones[palabra]
+                self.__retirar_sufijos(palabra)
+
+    def candidatos(self, consulta):
+        """
+        Retorna el conjunto de ISBNs que podrían contener la consulta como subcadena,
+        o None si la consulta no tiene caracteres alfanuméricos y el índice no sirve.
+        El resultado es un superconjunto: el llamador debe verificar cada candidato.
+        """
+        fragmentos = self.palabras(consulta)
+        if not fragmentos:
+            return None
+        resultado = None
+        # Los fragmentos más largos suelen ser los más selectivos
+        for fragmento in sorted(set(fragmentos), key=len, reverse=True):
+            isbns = set()
+            for palabra in self.__palabras_con(fragmento):
+                isbns |= self.__publicaciones[palabra]
+            resultado = isbns if resultado is None else resultado & isbns
+            if not resultado:
+                break
+        return resultado
+
+    def __palabras_con(self, fragmento):
+        """Palabras del vocabulario que contienen el fragmento"""
+        palabras = set()
+        i = bisect.bisect_left(self.__sufijos_ordenados, fragmento)
+        while i < len(self.__sufijos_ordenados) and self.__sufijos_ordenados[i].startswith(fragmento):
+            palabras |= self.__sufijos[self.__sufijos_ordenados[i]]
+            i += 1
+        return palabras
+
+    def __registrar_sufijos(self, palabra, nuevos_sufijos=None):
+        for i in range(len(palabra)):
+            sufijo = palabra[i:]
+            palabras = self.__sufijos.get(sufijo)
+            if palabras is None:
+                palabras = self.__sufijos[sufijo] = set()
+                if nuevos_sufijos is None:
+                    bisect.insort(self.__sufijos_ordenados, sufijo)
+                else:
+                    nuevos_sufijos.append(sufijo)
+            palabras.add(palabra)
+
+    def __retirar_sufijos(self, palabra):
+        for i in range(len(palabra)):
+            sufijo = palabra[i:]
+            palabras = self.__sufijos.get(sufijo)
+            if palabras is None:
+                continue
+            palabras.discard(palabra)
+            if not palabras:
+                del self.__sufijos[sufijo]
+                del self.__sufijos_ordenados[bisect.bisect_left(self.__sufijos_ordenados, sufijo)]
+
+
+class IndiceTrigramas:
+    """
+    Índice de trigramas para búsquedas aproximadas, tolerantes a errores de escritura y tildes.
+    La puntuación de un libro es la fracción de trigramas de la consulta que aparecen en su texto
+    (desempatando por la similitud de Dice, que favorece textos de longitud parecida).
+    """
+    def __init__(self):
+        self.__publicaciones = {}  # Diccionario trigrama -> conjunto de ISBNs
+        self.__tamanos = {}  # Diccionario ISBN -> número de trigramas distintos de su texto
+
+    @staticmethod
+    def trigramas(texto, palabras=None):
+        """Trigramas de cada palabra normalizada, con relleno para marcar inicio y final"""
+        resultado = set()
+        for palabra in IndiceTexto.palabras(texto) if palabras is None else palabras:
+            resultado.update(IndiceTrigramas.__trigramas_palabra(palabra))
+        return resultado
+
+    @staticmethod
+    @functools.lru_cache(maxsize=65536)
+    def __trigramas_palabra(palabra):
+        # Las palabras se repiten mucho entre libros: cada una se descompone una sola vez
+        relleno = f"  {palabra} "
+        return tuple(relleno[i:i + 3] for i in range(len(relleno) - 2))
+
+    def agregar(self, isbn, texto, palabras=None):
+        if not texto:
+            return
+        trigramas = self.trigramas(texto, palabras)
+        self.__tamanos[isbn] = len(trigramas)
+        for trigrama in trigramas:
+            self.__publicaciones.setdefault(trigrama, set()).add(isbn)
+
+    def eliminar(self, isbn, texto, palabras=None):
+        if not texto:
+            return
+        self.__tamanos.pop(isbn, None)
+        for trigrama in self.trigramas(texto, palabras):
+            isbns = self.__publicaciones.get(trigrama)
+            if isbns is not None:
+                isbns.discard(isbn)
+                if not isbns:
+                    del self.__publicaciones[trigrama]
+
+    def puntuar(self, consulta, umbral=0.5):
+        """
+        Retorna un diccionario ISBN -> (cobertura, dice) con los libros cuya cobertura
+        de los trigramas de la consulta alcanza el umbral.
+        """
+        trigramas = self.trigramas(consulta)
+        if not trigramas:
+            return {}
+        vacio = set()
+        listas = sorted((self.__publicaciones.get(t, vacio) for t in trigramas), key=len)
+        minimo = max(1, math.ceil(umbral * len(listas)))
+        # Un libro con al menos 'minimo' aciertos aparece en alguna de las len - minimo + 1 listas más cortas
+        candidatos = set().union(*listas[:len(listas) - minimo + 1])
+        puntuaciones = {}
+        for isbn in candidatos:
+            aciertos = sum(1 for isbns in listas if isbn in isbns)
+            if aciertos >= minimo:
+                dice = 2 * aciertos / (len(listas) + self.__tamanos[isbn])
+                puntuaciones[isbn] = (aciertos / len(listas), dice)
+        return puntuaciones
+
+
+class SegmentoHistorial:
+    """
+    Bloque de eventos consecutivos del historial, almacenado en arrays compactos.
+    Un segmento cerrado puede volcarse a disco y se vuelve a leer solo cuando se consulta.
+    """
+    COLUMNAS = (("fechas", "d"), ("tipos", "B"), ("usuarios", "l"), ("libros", "l"))
+
+    def __init__(self, primer_evento, inicio, cantidad=0, ruta=None):
+        self.primer_evento = primer_evento  # Número global del primer evento del segmento
+        self.inicio = inicio  # Marca de tiempo del primer evento
+        self.cantidad = cantidad
+        self.ruta = ruta  # Archivo en disco si el segmento se ha volcado
+        self.__columnas = None if ruta else {nombre: array.array(tipo) for nombre, tipo in self.COLUMNAS}
+
+    def agregar(self, fecha, tipo, usuario, libro):
+        columnas = self.columnas()
+        columnas["fechas"].append(fecha)
+        columnas["tipos"].append(tipo)
+        columnas["usuarios"].append(usuario)
+        columnas["libros"].append(libro)
+        self.cantidad += 1
+
+    def columnas(self):
+        """Retorna las columnas del segmento, leyéndolas de disco si estaba volcado"""
+        if self.__columnas is not None:
+            return self.__columnas
+        columnas = {}
+        with open(self.ruta, "rb") as f:
+            for nombre, tipo in self.COLUMNAS:
+                columna = array.array(tipo)
+                columna.fromfile(f, self.cantidad)
+                columnas[nombre] = columna
+        return columnas
+
+    @property
+    def nombre_archivo(self):
+        """
+        Nombre del archivo con el contenido actual del segmento. Incluye la cantidad de eventos,
+        así que un archivo nunca se reescribe con otro contenido aunque el segmento crezca.
+        """
+        return f"segmento_{self.primer_evento}_{self.cantidad}.bin"
+
+    def copiar_columnas(self):
+        """Copia de las columnas, para escribirlas sin bloquear los eventos nuevos"""
+        return {nombre: columna[:] for nombre, columna in self.columnas().items()}
+
+    @classmethod
+    def escribir(cls, ruta, columnas):
+        """Escribe las columnas en un archivo de forma atómica y lo sincroniza con el disco"""
+        temporal = ruta + ".tmp"
+        with open(temporal, "wb") as f:
+            for nombre, _ in cls.COLUMNAS:
+                columnas[nombre].tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+
+    def volcar(self, ruta):
+        """Escribe el segmento en disco (si no lo estaba ya) y libera su memoria"""
+        if not os.path.exists(ruta):
+            self.escribir(ruta, self.__columnas)
+        self.ruta = ruta
+        self.__columnas = None
+
+    def cargar(self):
+        """Vuelve a traer a memoria un segmento volcado, para poder añadirle eventos"""
+        self.__columnas = self.columnas()
+        self.ruta = None
+
+    @property
+    def en_memoria(self):
+        return self.__columnas is not None
+
+
+class HistorialPrestamos:
+    """
+    Historial de préstamos y devoluciones de solo inserción.
+    Los eventos se guardan con marca de tiempo, tipo codificado e identificadores enteros,
+    repartidos en segmentos por intervalo de tiempo. Los índices por usuario y por ISBN
+    guardan los números de evento, de modo que las consultas no recorren todo el historial.
+    Los eventos con fecha anterior al último registrado (por ejemplo, préstamos anotados
+    a posteriori) se guardan aparte, ordenados por fecha, y las consultas los combinan con el resto.
+    """
+    TIPOS = ("préstamo", "devolución")
+
+    def __init__(self, duracion_segmento=86400, directorio=None, concurrente=False):
+        self.__duracion_segmento = duracion_segmento  # Segundos que abarca cada segmento
+        self.__directorio = directorio  # Directorio donde se vuelcan los segmentos antiguos
+        self.__segmentos = []
+        self.__inicios = []  # Primer número de evento de cada segmento, para búsqueda binaria
+        self.__fechas_inicio = []  # Fecha del primer evento de cada segmento
+        self.__total = 0
+        self.__ultima_fecha = float("-inf")
+        self.__ids_usuarios, self.__usuarios = {}, []  # ID de usuario <-> entero
+        self.__ids_libros, self.__libros = {}, []  # ISBN <-> entero
+        self.__por_usuario = {}  # Diccionario entero de usuario -> array de números de evento
+        self.__por_libro = {}  # Diccionario entero de libro -> array de números de evento
+        # Eventos fuera de orden: tuplas (fecha, llegada, tipo, usuario, libro) ordenadas por fecha
+        self.__atrasados = []
+        self.__atrasados_usuario = {}  # Diccionario entero de usuario -> lista de tuplas ordenada
+        self.__atrasados_libro = {}  # Diccionario entero de libro -> lista de tuplas ordenada
+        # En modo concurrente, un cerrojo propio protege los eventos y sus índices
+        self.__cerrojo = threading.RLock() if concurrente else contextlib.nullcontext()
+        # Los archivos se vuelcan y se borran también desde el hilo de compactación del almacén
+        self.__cerrojo_archivos = threading.Lock()
+
+    def __len__(self):
+        return self.__total + len(self.__atrasados)
+
+    @staticmethod
+    def __codificar(codigos, valores, valor):
+        codigo = codigos.get(valor)
+        if codigo is None:
+            codigo = codigos[valor] = len(valores)
+            valores.append(valor)
+        return codigo
+
+    def registrar(self, tipo, isbn, id_usuario, fecha=None):
+        """Añade un evento al historial"""
+        if fecha is None:
+            fecha = time.time()
+        with self.__cerrojo:
+            self.__registrar(tipo, isbn, id_usuario, fecha)
+
+    def __registrar(self, tipo, isbn, id_usuario, fecha):
+        usuario = self.__codificar(self.__ids_usuarios, self.__usuarios, id_usuario)
+        libro = self.__codificar(self.__ids_libros, self.__libros, isbn)
+        if fecha < self.__ultima_fecha:
+            # Los segmentos exigen fechas crecientes: el evento se inserta en su posición entre los atrasados
+            self.__agregar_atrasado((fecha, len(self.__atrasados), self.TIPOS.index(tipo), usuario, libro))
+            return
+        self.__ultima_fecha = fecha
+        segmento = self.__segmentos[-1] if self.__segmentos else None
+        if segmento is None or fecha >= segmento.inicio + self.__duracion_segmento:
+            segmento = SegmentoHistorial(self.__total, fecha)
+            self.__agregar_segmento(segmento)
+        segmento.agregar(fecha, self.TIPOS.index(tipo), usuario, libro)
+        self.__por_usuario.setdefault(usuario, array.array("q")).append(self.__total)
+        self.__por_libro.setdefault(libro, array.array("q")).append(self.__total)
+        self.__total += 1
+
+    def __agregar_segmento(self, segmento):
+        self.__segmentos.append(segmento)
+        self.__inicios.append(segmento.primer_evento)
+        self.__fechas_inicio.append(segmento.inicio)
+
+    def __agregar_atrasado(self, atrasado):
+        bisect.insort(self.__atrasados, atrasado)
+        bisect.insort(self.__atrasados_usuario.setdefault(atrasado[3], []), atrasado)
+        bisect.insort(self.__atrasados_libro.setdefault(atrasado[4], []), atrasado)
+
+    def registrar_lote(self, tipo, isbns, id_usuario, fecha=None):
+        """Añade con la misma marca de tiempo un evento por cada ISBN de un lote de un usuario"""
+        if fecha is None:
+            fecha = time.time()
+        with self.__cerrojo:
+            for isbn in isbns:
+                self.__registrar(tipo, isbn, id_usuario, fecha)
+
+    def __evento(self, numero, columnas=None, segmento=None):
+        if segmento is None:
+            segmento = self.__segmentos[bisect.bisect_right(self.__inicios, numero) - 1]
+            columnas = segmento.columnas()
+        i = numero - segmento.primer_evento
+        return {
+            "tipo": self.TIPOS[columnas["tipos"][i]],
+            "isbn": self.__libros[columnas["libros"][i]],
+            "id_usuario": self.__usuarios[columnas["usuarios"][i]],
+            "fecha": columnas["fechas"][i],
+        }
+
+    def __rango(self, desde, hasta):
+        """Retorna los números de evento [primero, ultimo) con fecha en [desde, hasta)"""
+        def posicion(fecha):
+            if fecha is None:
+                return None
+            s = bisect.bisect_right(self.__fechas_inicio, fecha) - 1
+            if s < 0:
+                return 0
+            segmento = self.__segmentos[s]
+            return segmento.primer_evento + bisect.bisect_left(segmento.columnas()["fechas"], fecha)
+        primero = posicion(desde)
+        ultimo = posicion(hasta)
+        return (0 if primero is None else primero), (self.__total if ultimo is None else ultimo)
+
+    def __eventos(self, numeros):
+        """Genera los eventos indicados (en orden creciente), leyendo cada segmento una sola vez"""
+        segmento = columnas = None
+        for numero in numeros:
+            if segmento is None or not segmento.primer_evento <= numero < segmento.primer_evento + segmento.cantidad:
+                segmento = self.__segmentos[bisect.bisect_right(self.__inicios, numero) - 1]
+                columnas = segmento.columnas()
+            yield self.__evento(numero, columnas, segmento)
+
+    def __eventos_atrasados(self, atrasados, desde, hasta):
+        """Genera los eventos atrasados de la lista (ordenada) con fecha en [desde, hasta)"""
+        i = 0 if desde is None else bisect.bisect_left(atrasados, (desde,))
+        j = len(atrasados) if hasta is None else bisect.bisect_left(atrasados, (hasta,))
+        for fecha, _, tipo, usuario, libro in atrasados[i:j]:
+            yield {"tipo": self.TIPOS[tipo], "isbn": self.__libros[libro],
+                   "id_usuario": self.__usuarios[usuario], "fecha": fecha}
+
+    def __combinar(self, eventos, atrasados, desde, hasta):
+        """Intercala por fecha los eventos de los segmentos con los atrasados del mismo rango"""
+        if not atrasados:
+            return eventos
+        # A igual fecha, primero el evento de los segmentos, que se registró antes
+        return heapq.merge(eventos, self.__eventos_atrasados(atrasados, desde, hasta),
+                           key=lambda evento: evento["fecha"])
+
+    def eventos(self, desde=None, hasta=None):
+        """Genera los eventos con fecha en [desde, hasta), en orden cronológico"""
+        primero, ultimo = self.__rango(desde, hasta)
+        return self.__combinar(self.__eventos(range(primero, ultimo)), self.__atrasados, desde, hasta)
+
+    def eventos_usuario(self, id_usuario, desde=None, hasta=None):
+        """Retorna los eventos de un usuario con fecha en [desde, hasta)"""
+        with self.__cerrojo:
+            codigo = self.__ids_usuarios.get(id_usuario)
+            return self.__filtrar(self.__por_usuario, self.__atrasados_usuario, codigo, desde, hasta)
+
+    def eventos_libro(self, isbn, desde=None, hasta=None):
+        """Retorna los eventos de un libro con fecha en [desde, hasta)"""
+        with self.__cerrojo:
+            return self.__filtrar(self.__por_libro, self.__atrasados_libro, self.__ids_libros.get(isbn), desde, hasta)
+
+    def __filtrar(self, indice, atrasados, codigo, desde, hasta):
+        numeros = indice.get(codigo, ())
+        primero, ultimo = self.__rango(desde, hasta)
+        i = bisect.bisect_left(numeros, primero)
+        j = bisect.bisect_left(numeros, ultimo)
+        return list(self.__combinar(self.__eventos(numeros[i:j]), atrasados.get(codigo), desde, hasta))
+
+    def volcar_segmentos(self, conservar=1):
+        """
+        Vuelca a disco los segmentos antiguos, dejando en memoria los últimos indicados.
+        El último segmento recibe los eventos nuevos, por lo que siempre se conserva.
+        Retorna el número de segmentos volcados.
+        """
+        if self.__directorio is None:
+            return 0
+        os.makedirs(self.__directorio, exist_ok=True)
+        volcados = 0
+        with self.__cerrojo, self.__cerrojo_archivos:
+            for segmento in self.__segmentos[:max(len(self.__segmentos) - max(conservar, 1), 0)]:
+                if segmento.en_memoria:
+                    segmento.volcar(os.path.join(self.__directorio, segmento.nombre_archivo))
+                    volcados += 1
+        return volcados
+
+    def exportar(self):
+        """
+        Retorna (estado, escrituras). El estado solo referencia los archivos de los segmentos,
+        sin copiar sus eventos; escrituras es la lista de (ruta, columnas) de los segmentos que
+        aún no tienen archivo, que deben escribirse con escribir_segmentos() antes de guardar el estado.
+        """
+        if self.__directorio is None:
+            raise ValueError("El historial no tiene directorio donde guardar sus segmentos")
+        os.makedirs(self.__directorio, exist_ok=True)
+        with self.__cerrojo:
+            segmentos = []
+            escrituras = []
+            for segmento in self.__segmentos:
+                nombre = segmento.nombre_archivo
+                ruta = os.path.join(self.__directorio, nombre)
+                if segmento.en_memoria and not os.path.exists(ruta):
+                    escrituras.append((ruta, segmento.copiar_columnas()))
+                segmentos.append([segmento.primer_evento, segmento.inicio, segmento.cantidad, nombre])
+            estado = {
+                "segmentos": segmentos,
+                "usuarios": list(self.__usuarios),
+                "libros": list(self.__libros),
+                "atrasados": [[fecha, tipo, self.__libros[libro], self.__usuarios[usuario]]
+                              for fecha, _, tipo, usuario, libro in self.__atrasados],
+            }
+            return estado, escrituras
+
+    def escribir_segmentos(self, escrituras):
+        """Escribe los segmentos pendientes de exportar() y sincroniza el directorio"""
+        for ruta, columnas in escrituras:
+            SegmentoHistorial.escribir(ruta, columnas)
+        if escrituras and hasattr(os, "O_DIRECTORY"):
+            descriptor = os.open(self.__directorio, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
+
+    def restaurar(self, estado):
+        """
+        Reconstruye el historial a partir de un estado de exportar(). Los segmentos quedan en
+        disco salvo el último, que sigue recibiendo eventos; solo se leen sus columnas de
+        usuario y libro para reconstruir los índices.
+        """
+        self.__usuarios = list(estado["usuarios"])
+        self.__ids_usuarios = {id_usuario: codigo for codigo, id_usuario in enumerate(self.__usuarios)}
+        self.__libros = list(estado["libros"])
+        self.__ids_libros = {isbn: codigo for codigo, isbn in enumerate(self.__libros)}
+        for primer_evento, inicio, cantidad, nombre in estado["segmentos"]:
+            segmento = SegmentoHistorial(primer_evento, inicio, cantidad, os.path.join(self.__directorio, nombre))
+            self.__agregar_segmento(segmento)
+            columnas = segmento.columnas()
+            for numero, usuario, libro in zip(itertools.count(primer_evento), columnas["usuarios"], columnas["libros"]):
+                self.__por_usuario.setdefault(usuario, array.array("q")).append(numero)
+                self.__por_libro.setdefault(libro, array.array("q")).append(numero)
+            self.__total = primer_evento + cantidad
+        if self.__segmentos:
+            ultimo = self.__segmentos[-1]
+            ultimo.cargar()
+            self.__ultima_fecha = ultimo.columnas()["fechas"][-1] if ultimo.cantidad else ultimo.inicio
+        for llegada, (fecha, tipo, isbn, id_usuario) in enumerate(estado["atrasados"]):
+            usuario = self.__codificar(self.__ids_usuarios, self.__usuarios, id_usuario)
+            libro = self.__codificar(self.__ids_libros, self.__libros, isbn)
+            self.__agregar_atrasado((fecha, llegada, tipo, usuario, libro))
+
+    def limpiar_archivos(self, conservar=()):
+        """
+        Borra del directorio los archivos de segmento que ya no usa ni el historial en memoria
+        ni el estado guardado, cuyos nombres se indican en 'conservar'.
+        """
+        if self.__directorio is None or not os.path.isdir(self.__directorio):
+            return 0
+        borrados = 0
+        with self.__cerrojo_archivos:
+            usados = set(conservar)
+            usados.update(os.path.basename(segmento.ruta) for segmento in list(self.__segmentos) if segmento.ruta)
+            for nombre in os.listdir(self.__directorio):
+                if nombre.startswith("segmento_") and nombre not in usados:
+                    os.remove(os.path.join(self.__directorio, nombre))
+                    borrados += 1
+        return borrados
+
+
+class AlmacenBiblioteca:
+    """
+    Almacenamiento persistente de una biblioteca.
+    Cada modificación se añade a un registro de escritura anticipada (WAL) en formato
+    JSON Lines y, periódicamente, el estado completo se compacta en una instantánea.
+    Al compactar, el registro se rota: las operaciones nuevas van a un registro vacío mientras
+    la instantánea se escribe en un hilo aparte, y el registro anterior se borra al terminar.
+    Al arrancar se carga la instantánea y solo se reproduce la cola de los registros.
+    """
+    def __init__(self, directorio, compactar_cada=10000, sincronizar=False, en_segundo_plano=True):
+        self.__directorio = directorio
+        self.__ruta_instantanea = os.path.join(directorio, "biblioteca.json")
+        self.__ruta_registro = os.path.join(directorio, "biblioteca.wal")
+        self.__ruta_registro_anterior = self.__ruta_registro + ".anterior"  # Registro rotado pendiente de compactar
+        self.__compactar_cada = compactar_cada  # Número de operaciones entre instantáneas
+        self.__sincronizar = sincronizar  # Si es True se hace fsync tras cada operación
+        self.__en_segundo_plano = en_segundo_plano  # Si es False, compactar() espera a la instantánea
+        self.__secuencia = 0  # Número de la última operación registrada
+        self.__pendientes = 0  # Operaciones registradas desde la última instantánea
+        self.__registro = None
+        self.__compactacion = None  # Hilo que escribe la instantánea en curso
+        self.__error_compactacion = None  # Excepción de la última compactación en segundo plano
+        # Cerrojos propios: el de escritura ordena las líneas del registro, el de sincronización
+        # agrupa los fsync de varios hilos y el de compactación evita dos compactaciones a la vez.
+        # Orden de adquisición: compactación, sincronización, escritura.
+        self.__cerrojo_escritura = threading.Lock()
+        self.__cerrojo_sincronizacion = threading.Lock()
+        self.__cerrojo_compactacion = threading.Lock()
+        self.__sincronizada = 0  # Última secuencia que se sabe en disco
+        os.makedirs(directorio, exist_ok=True)
+
+    @property
+    def directorio(self):
+        return self.__directorio
+
+    def existe(self):
+        """Indica si hay datos guardados en el directorio"""
+        return any(os.path.exists(ruta) for ruta in
+                   (self.__ruta_instantanea, self.__ruta_registro, self.__ruta_registro_anterior))
+
+    def cargar(self, biblioteca):
+        """Restaura la instantánea y reproduce las operaciones posteriores de los registros"""
+        secuencia_instantanea = 0
+        if os.path.exists(self.__ruta_instantanea):
+            with open(self.__ruta_instantanea, "r", encoding="utf-8") as f:
+                estado = json.load(f)
+            secuencia_instantanea = estado["secuencia"]
+            biblioteca._restaurar_estado(estado)
+        self.__secuencia = secuencia_instantanea
+        # Si se cayó durante una compactación, el registro rotado aún contiene operaciones necesarias
+        for ruta in (self.__ruta_registro_anterior, self.__ruta_registro):
+            if os.path.exists(ruta):
+                self.__reproducir(ruta, biblioteca, secuencia_instantanea)
+
+    def __reproducir(self, ruta, biblioteca, secuencia_instantanea):
+        valido = 0  # Posición del final de la última línea completa
+        with open(ruta, "rb") as f:
+            for linea in f:
+                try:
+                    secuencia, operacion, argumentos = json.loads(linea)
+                except ValueError:
+                    break  # Última línea incompleta por una caída durante la escritura
+                valido += len(linea)
+                if secuencia <= secuencia_instantanea:
+                    continue
+                biblioteca._reproducir(operacion, argumentos)
+                self.__secuencia = secuencia
+                self.__pendientes += 1
+        if valido < os.path.getsize(ruta):
+            # Descartar la línea incompleta para que las nuevas operaciones no se mezclen con ella
+            os.truncate(ruta, valido)
+
+    def registrar(self, operacion, *argumentos):
+        """
+        Añade una operación al final del registro. Puede llamarse desde varios hilos: la línea
+        se serializa fuera del cerrojo y, con sincronizar=True, un solo fsync cubre las
+        operaciones que otros hilos hayan escrito mientras tanto.
+        """
+        with self.__cerrojo_escritura:
+            if self.__registro is None:
+                self.__registro = open(self.__ruta_registro, "a", encoding="utf-8")
+            self.__secuencia += 1
+            secuencia = self.__secuencia
+            self.__registro.write(json.dumps([secuencia, operacion, argumentos], ensure_ascii=False) + "\n")
+            self.__registro.flush()
+            self.__pendientes += 1
+        if self.__sincronizar:
+            self.__sincronizar_hasta(secuencia)
+
+    def __sincronizar_hasta(self, secuencia):
+        """Hace fsync del registro salvo que otro hilo ya haya llevado a disco esa secuencia"""
+        with self.__cerrojo_sincronizacion:
+            if self.__sincronizada >= secuencia:
+                return
+            with self.__cerrojo_escritura:
+                registro, ultima = self.__registro, self.__secuencia
+            # Sin registro abierto, la rotación ya lo sincronizó
+            if registro is not None:
+                os.fsync(registro.fileno())
+            self.__sincronizada = ultima
+
+    def necesita_compactar(self):
+        """
+        Indica si se ha alcanzado el umbral de operaciones para crear una instantánea.
+        Mientras se escribe una instantánea no se pide otra.
+        """
+        return self.__pendientes >= self.__compactar_cada and not self.compactando()
+
+    def compactando(self):
+        """Indica si hay una instantánea escribiéndose en segundo plano"""
+        return self.__compactacion is not None and self.__compactacion.is_alive()
+
+    def compactar(self, exportar, detener=contextlib.nullcontext, esperar=False, exportar_en_segundo_plano=False):
+        """
+        Guarda una nueva instantánea y rota el registro.
+        exportar() retorna (estado, antes, despues): una copia del estado, y dos funciones (o None)
+        que se llaman justo antes de escribir la instantánea y cuando ya está en disco.
+        Se llama dentro de detener(), que debe impedir que se registren operaciones mientras
+        tanto, para que el estado corresponda exactamente a la última secuencia registrada.
+        La escritura se hace en un hilo aparte (salvo con esperar=True o en_segundo_plano=False),
+        así que las operaciones siguientes no esperan a la serialización ni al fsync; con
+        exportar_en_segundo_plano=True también la copia se hace en ese hilo.
+        Sin esperar=True, si ya hay una compactación en curso no se hace nada y retorna False.
+        """
+        if not self.__cerrojo_compactacion.acquire(blocking=esperar):
+            return False
+        try:
+            if esperar:
+                self.esperar()
+            elif self.compactando():
+                return False
+            self.__relanzar_error()
+            if exportar_en_segundo_plano and not esperar:
+                tarea = lambda: self.__escribir_instantanea(*self.__preparar(exportar, detener))
+            else:
+                preparada = self.__preparar(exportar, detener)
+                if esperar or not self.__en_segundo_plano:
+                    self.__escribir_instantanea(*preparada)
+                    return True
+                tarea = lambda: self.__escribir_instantanea(*preparada)
+            self.__compactacion = threading.Thread(target=self.__compactar_en_segundo_plano, args=(tarea,),
+                                                   name="compactacion")
+            self.__compactacion.start()
+            return True
+        finally:
+            self.__cerrojo_compactacion.release()
+
+    def __preparar(self, exportar, detener):
+        """Copia el estado y rota el registro sin que entre ambos se registre ninguna operación"""
+        with detener():
+            estado, antes, despues = exportar()
+            with self.__cerrojo_sincronizacion, self.__cerrojo_escritura:
+                estado["secuencia"] = self.__secuencia
+                self.__rotar_registro()
+                self.__sincronizada = self.__secuencia
+                self.__pendientes = 0
+        return estado, antes, despues
+
+    def __compactar_en_segundo_plano(self, tarea):
+        try:
+            tarea()
+        except Exception as e:
+            # El registro rotado se conserva, así que no se pierde nada; se avisa en la próxima llamada
+            self.__error_compactacion = e
+
+    def __escribir_instantanea(self, estado, antes, despues):
+        if antes is not None:
+            antes()
+        temporal = self.__ruta_instantanea + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(estado, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.__ruta_instantanea)
+        self.__sincronizar_directorio()
+        # Si se cae aquí, las operaciones del registro rotado ya incluidas se descartan por su secuencia
+        if os.path.exists(self.__ruta_registro_anterior):
+            os.remove(self.__ruta_registro_anterior)
+        if despues is not None:
+            despues()
+
+    def __rotar_registro(self):
+        """Aparta el registro actual para que las operaciones nuevas empiecen uno vacío"""
+        if self.__registro is not None and self.__sincronizar:
+            os.fsync(self.__registro.fileno())
+        self.__cerrar_registro()
+        if not os.path.exists(self.__ruta_registro):
+            return
+        if os.path.exists(self.__ruta_registro_anterior):
+            # Una compactación anterior falló: se añade a su registro para no perder operaciones
+            with open(self.__ruta_registro_anterior, "ab") as destino, open(self.__ruta_registro, "rb") as origen:
+                destino.write(origen.read())
+                destino.flush()
+                os.fsync(destino.fileno())
+            os.remove(self.__ruta_registro)
+        else:
+            os.replace(self.__ruta_registro, self.__ruta_registro_anterior)
+        self.__sincronizar_directorio()
+
+    def __sincronizar_directorio(self):
+        """Sincroniza el directorio para que los renombrados sobrevivan a un corte de corriente"""
+        if hasattr(os, "O_DIRECTORY"):
+            descriptor = os.open(self.__directorio, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
+
+    def esperar(self):
+        """Espera a que termine la compactación en curso y relanza su error, si lo hubo"""
+        compactacion = self.__compactacion
+        if compactacion is not None:
+            compactacion.join()
+        self.__relanzar_error()
+
+    def __relanzar_error(self):
+        if self.__error_compactacion is not None:
+            error, self.__error_compactacion = self.__error_compactacion, None
+            raise error
+
+    def __cerrar_registro(self):
+        if self.__registro is not None:
+            self.__registro.close()
+            self.__registro = None
+
+    def cerrar(self):
+        """Espera a la compactación en curso y cierra el archivo de registro"""
+        try:
+            self.esperar()
+        finally:
+            with self.__cerrojo_escritura:
+                self.__cerrar_registro()
+
+
+class Instrumentacion:
+    """
+    Medición de las llamadas a los métodos de un objeto: número de llamadas, tiempo acumulado,
+    percentiles de latencia (sobre las últimas MUESTRAS llamadas) y tamaño de los resultados.
+    Solo actúa sobre los métodos envueltos con envolver(); sin envolver no tiene coste.
+    Las llamadas que un método medido hace a otros métodos medidos no se cuentan aparte.
+    """
+    MUESTRAS = 10000  # Duraciones recientes que se conservan por método para los percentiles
+
+    def __init__(self):
+        self.__metodos = {}  # Diccionario nombre -> [llamadas, tiempo total, elementos devueltos, duraciones]
+        self.__cerrojo = threading.Lock()
+        self.__local = threading.local()  # Indica si el hilo está dentro de un método medido
+
+    def envolver(self, nombre, metodo, posicion_datos=None):
+        """
+        Retorna una función que llama al método y registra su duración y el tamaño del resultado.
+        Si el método retorna una tupla como (exito, resultados) o (pagina, cursor),
+        posicion_datos indica qué elemento se mide.
+        """
+        with self.__cerrojo:
+            datos = self.__metodos.setdefault(nombre, [0, 0.0, 0, collections.deque(maxlen=self.MUESTRAS)])
+        reloj = time.perf_counter
+        local = self.__local
+
+        def medido(*argumentos, **opciones):
+            if getattr(local, "midiendo", False):
+                # Llamada interna: su tiempo ya cuenta en el método que la hace
+                return metodo(*argumentos, **opciones)
+            local.midiendo = True
+            resultado = None
+            inicio = reloj()
+            try:
+                resultado = metodo(*argumentos, **opciones)
+                return resultado
+            finally:
+                duracion = reloj() - inicio
+                local.midiendo = False
+                if posicion_datos is not None and isinstance(resultado, tuple):
+                    resultado = resultado[posicion_datos]
+                with self.__cerrojo:
+                    datos[0] += 1
+                    datos[1] += duracion
+                    datos[3].append(duracion)
+                    if isinstance(resultado, (list, tuple, dict, set)):
+                        datos[2] += len(resultado)
+
+        medido.__wrapped__ = metodo
+        return medido
+
+    def informe(self):
+        """Retorna las mediciones de cada método llamado al menos una vez, listas para JSON"""
+        informe = {}
+        with self.__cerrojo:
+            for nombre, (llamadas, total, elementos, duraciones) in sorted(self.__metodos.items()):
+                if not llamadas:
+                    continue
+                ordenadas = sorted(duraciones)
+
+                def percentil(p):
+                    return ordenadas[min(int(len(ordenadas) * p), len(ordenadas) - 1)] * 1e6
+
+                informe[nombre] = {
+                    "llamadas": llamadas,
+                    "total_ms": round(total * 1e3, 3),
+                    "media_us": round(total / llamadas * 1e6, 3),
+                    "p50_us": round(percentil(0.50), 3),
+                    "p95_us": round(percentil(0.95), 3),
+                    "p99_us": round(percentil(0.99), 3),
+                    "elementos_medios": round(elementos / llamadas, 2),
+                }
+        return informe
+
+    def informe_texto(self):
+        """Retorna el informe como tabla de texto, de mayor a menor tiempo acumulado"""
+        filas = sorted(self.informe().items(), key=lambda par: par[1]["total_ms"], reverse=True)
+        lineas = [f"{'Método':<34}{'Llamadas':>9}{'Total ms':>11}{'Media µs':>11}"
+                  f"{'p50 µs':>10}{'p99 µs':>10}{'Elem.':>8}"]
+        for nombre, datos in filas:
+            lineas.append(f"{nombre:<34}{datos['llamadas']:>9}{datos['total_ms']:>11.1f}{datos['media_us']:>11.1f}"
+                          f"{datos['p50_us']:>10.1f}{datos['p99_us']:>10.1f}{datos['elementos_medios']:>8.1f}")
+        return "\n".join(lineas)
+
+
+class CacheConsultas:
+    """
+    Caché LRU de resultados de búsqueda, con capacidad limitada.
+    Cada resultado se guarda junto a la versión del catálogo en que se calculó;
+    invalidar() incrementa la versión, de modo que cualquier cambio del catálogo
+    deja obsoletas todas las entradas sin tener que recorrerlas.
+    """
+    def __init__(self, capacidad=256):
+        self.__capacidad = capacidad
+        self.__entradas = collections.OrderedDict()  # Clave -> (versión, resultado), de menos a más reciente
+        self.__version = 0
+        self.__aciertos = 0
+        self.__fallos = 0
+        self.__expulsiones = 0
+
+    def obtener(self, clave):
+        """Retorna el resultado guardado para la clave, o None si no existe o está obsoleto"""
+        entrada = self.__entradas.get(clave)
+        if entrada is None or entrada[0] != self.__version:
+            self.__fallos += 1
+            return None
+        self.__entradas.move_to_end(clave)
+        self.__aciertos += 1
+        return entrada[1]
+
+    def guardar(self, clave, resultado):
+        """Guarda el resultado, expulsando el menos usado recientemente si se supera la capacidad"""
+        if self.__capacidad <= 0:
+            return
+        self.__entradas[clave] = (self.__version, resultado)
+        self.__entradas.move_to_end(clave)
+        if len(self.__entradas) > self.__capacidad:
+            self.__entradas.popitem(last=False)
+            self.__expulsiones += 1
+
+    def invalidar(self):
+        """Marca como obsoletos todos los resultados guardados"""
+        self.__version += 1
+
+    def estadisticas(self):
+        return {
+            "aciertos": self.__aciertos,
+            "fallos": self.__fallos,
+            "expulsiones": self.__expulsiones,
+            "entradas": len(self.__entradas),
+            "capacidad": self.__capacidad,
+            "version": self.__version,
+        }
+
+
+class Biblioteca:
+    """
+    Clase principal que gestiona toda la biblioteca digital.
+    Utiliza diccionarios para almacenar y acceder eficientemente a los libros.
+    Utiliza conjuntos para asegurar IDs de usuario únicos.
+    """
+    NUM_CERROJOS = 64  # Número de cerrojos repartidos por ISBN e ID de usuario en modo concurrente
+    DIAS_PRESTAMO = 14  # Plazo de devolución por defecto, en días
+    METODOS_SIN_MEDIR = ("activar_instrumentacion", "desactivar_instrumentacion")
+    # Métodos que retornan una tupla: posición del elemento cuyo tamaño se mide
+    POSICION_DATOS = {"prestar_lote": 1, "devolver_lote": 1,
+                      "paginar_libros": 0, "paginar_usuarios": 0, "paginar_busqueda": 0}
+
+    def __init__(self, nombre, almacen=None, concurrente=False, tamano_cache=256):
+        self.__nombre = nombre
+        self.__almacen = almacen  # AlmacenBiblioteca opcional para persistir los cambios
+        self.__reproduciendo = False
+        # En modo concurrente, cada ISBN e ID de usuario se protege con uno de varios cerrojos.
+        # Cada grupo de estructuras compartidas tiene además su propio cerrojo, que solo se retiene
+        # mientras se actualiza; cuando se necesitan varios se adquieren en este orden:
+        # catálogo, usuarios, préstamos. El historial y el almacén tienen los suyos propios,
+        # y el registro en el almacén se hace fuera de todos ellos.
+        self.__concurrente = concurrente
+        self.__cerrojos = [threading.Lock() for _ in range(self.NUM_CERROJOS)] if concurrente else []
+        # Libros, orden, índices de búsqueda, códigos y caché
+        self.__cerrojo_catalogo = threading.RLock() if concurrente else contextlib.nullcontext()
+        # Usuarios y su orden de registro
+        self.__cerrojo_usuarios = threading.RLock() if concurrente else contextlib.nullcontext()
+        # Prestados, prestatarios, vencimientos, reservas y contadores
+        self.__cerrojo_prestamos = threading.RLock() if concurrente else contextlib.nullcontext()
+        self.__libros = {}  # Diccionario para almacenar libros (clave: ISBN, valor: objeto Libro)
+        self.__usuarios = {}  # Diccionario para almacenar usuarios (clave: ID, valor: objeto Usuario)
+        self.__ids_usuario = set()  # Conjunto para garantizar IDs únicos
+        # Historial indexado de préstamos y devoluciones; los segmentos antiguos se vuelcan junto al almacén
+        directorio_historial = os.path.join(almacen.directorio, "historial") if almacen is not None else None
+        self.__historial_prestamos = HistorialPrestamos(directorio=directorio_historial, concurrente=concurrente)
+        self.__orden = SecuenciaOrdenada()  # Orden de alta de los libros, para listar y paginar
+        self.__orden_usuarios = SecuenciaOrdenada()  # Orden de alta de los usuarios
+        self.__indice_isbn = IndiceISBN()  # ISBNs ordenados para consultas por prefijo y rango
+        # Índices invertidos para las búsquedas por texto
+        self.__indice_titulos = IndiceTexto()
+        self.__indice_autores = IndiceTexto()
+        self.__indice_adaptaciones = IndiceTexto()
+        # Índices de trigramas para la búsqueda aproximada
+        self.__trigramas = {"titulo": IndiceTrigramas(), "autor": IndiceTrigramas(), "adaptacion": IndiceTrigramas()}
+        # Categorías y adaptaciones codificadas como enteros
+        self.__codigos_categorias = DiccionarioCodigos()
+        self.__codigos_adaptaciones = DiccionarioCodigos()
+        # Índices secundarios para categorías, adaptaciones y estado de préstamo
+        self.__categorias = {}  # Diccionario código de categoría -> conjunto de ISBNs
+        self.__adaptaciones = {}  # Diccionario código de adaptación -> conjunto de ISBNs
+        self.__prestados = set()  # Conjunto de ISBNs de libros prestados
+        self.__prestatarios = {}  # Diccionario ISBN -> ID del usuario que lo tiene prestado
+        # Vencimientos de los préstamos activos y montículo de vencimientos para localizar los vencidos.
+        # Las entradas del montículo de préstamos ya devueltos se descartan al consultarlo o al compactarlo.
+        self.__vencimientos = {}  # Diccionario ISBN -> (vencimiento, número de préstamo)
+        self.__monticulo_vencimientos = []  # Tuplas (vencimiento, número de préstamo, ISBN)
+        self.__numero_prestamo = 0
+        self.__reservas = {}  # Diccionario ISBN -> cola (deque) de IDs de usuario en espera
+        # Contadores mantenidos de forma incremental para las estadísticas
+        self.__total_prestamos = 0
+        self.__total_devoluciones = 0
+        # Resultados recientes de búsqueda; cualquier cambio que altere los resultados los invalida
+        self.__cache = CacheConsultas(tamano_cache)
+        self.__instrumentacion = None  # Instrumentacion activa, o None si los métodos no están envueltos
+        
+    @property
+    def nombre(self):
+        return self.__nombre
+    
+    def agregar_libro(self, libro):
+        """
+        Añade un nuevo libro a la biblioteca.
+        Si ya existe un libro con el mismo ISBN, devuelve False.
+        Lanza ValueError si el libro ya pertenece a otra biblioteca.
+        """
+        libro._comprobar_vinculo(self)
+        with self.__bloquear(libro.isbn):
+            if libro.isbn in self.__libros:
+                return False
+            with self.__cerrojo_catalogo:
+                self.__libros[libro.isbn] = libro
+                self.__indexar(libro)
+            self.__registrar("agregar_libro", libro.titulo, libro.autor, libro.categoria, libro.isbn,
+                             libro.adaptacion)
+            return True
+    
+    def agregar_libros_lote(self, libros):
+        """
+        Añade varios libros a la vez, actualizando los índices de texto una sola vez por lote.
+        Retorna la lista de libros rechazados por tener un ISBN ya existente.
+        Lanza ValueError, sin añadir ninguno, si alguno ya pertenece a otra biblioteca.
+        """
+        libros = list(libros)
+        for libro in libros:
+            libro._comprobar_vinculo(self)
+        aceptados = []
+        palabras = []
+        rechazados = []
+        with self.__bloquear(*(libro.isbn for libro in libros)):
+            with self.__cerrojo_catalogo:
+                for libro in libros:
+                    if libro.isbn in self.__libros:
+                        rechazados.append(libro)
+                        continue
+                    self.__libros[libro.isbn] = libro
+                    palabras.append(self.__indexar(libro, por_lote=True))
+                    aceptados.append(libro)
+                if aceptados:
+                    self.__indice_titulos.agregar_lote((libro.isbn, libro.titulo, p["titulo"])
+                                                       for libro, p in zip(aceptados, palabras))
+                    self.__indice_autores.agregar_lote((libro.isbn, libro.autor, p["autor"])
+                                                       for libro, p in zip(aceptados, palabras))
+                    self.__indice_adaptaciones.agregar_lote((libro.isbn, libro.adaptacion, p["adaptacion"])
+                                                            for libro, p in zip(aceptados, palabras))
+                    self.__indice_isbn.agregar_lote(libro.isbn for libro in aceptados)
+            if aceptados and self.__almacen is not None and not self.__reproduciendo:
+                self.__registrar("agregar_libros_lote", [[libro.titulo, libro.autor, libro.categoria,
+                                                          libro.isbn, libro.adaptacion] for libro in aceptados])
+        return rechazados
+
+    def eliminar_libro(self, isbn):
+        """Elimina un libro de la biblioteca por su ISBN"""
+        with self.__bloquear(isbn):
+            if isbn in self.__libros and self.__libros[isbn].disponible:
+                with self.__cerrojo_catalogo:
+                    libro = self.__libros.pop(isbn)
+                    self.__desindexar(libro)
+                with self.__cerrojo_prestamos:
+                    self.__reservas.pop(isbn, None)
+                self.__registrar("eliminar_libro", isbn)
+                return True
+        return False
+
+    def __bloquear(self, *claves):
+        """
+        Adquiere los cerrojos de las claves indicadas (ISBNs o IDs de usuario).
+        Se adquieren siempre en orden creciente para evitar interbloqueos.
+        Sin modo concurrente no hace nada.
+        """
+        if not self.__concurrente:
+            return contextlib.nullcontext()
+        pila = contextlib.ExitStack()
+        for posicion in sorted({hash(clave) % self.NUM_CERROJOS for clave in claves}):
+            pila.enter_context(self.__cerrojos[posicion])
+        return pila
+
+    @contextlib.contextmanager
+    def __detener(self):
+        """
+        Detiene todas las modificaciones: adquiere todos los cerrojos de clave y los de las estructuras.
+        Como cada operación registra en el almacén antes de soltar los cerrojos de sus claves,
+        mientras dura el estado coincide exactamente con el registro.
+        """
+        with contextlib.ExitStack() as pila:
+            for cerrojo in self.__cerrojos:
+                pila.enter_context(cerrojo)
+            for cerrojo in (self.__cerrojo_catalogo, self.__cerrojo_usuarios, self.__cerrojo_prestamos):
+                pila.enter_context(cerrojo)
+            yield
+
+    def __indexar(self, libro, por_lote=False):
+        """
+        Registra el libro en todos los índices de búsqueda.
+        Con por_lote=True se omiten los índices ordenados (texto e ISBN), que el llamador
+        actualiza una sola vez para todo el lote.
+        Retorna las palabras de cada campo de texto, que se calculan una sola vez para ambos índices.
+        """
+        palabras = self.__palabras_libro(libro)
+        self.__orden.agregar(libro.isbn)
+        if not por_lote:
+            self.__indice_isbn.agregar(libro.isbn)
+            self.__indice_titulos.agregar(libro.isbn, libro.titulo, palabras=palabras["titulo"])
+            self.__indice_autores.agregar(libro.isbn, libro.autor, palabras=palabras["autor"])
+            self.__indice_adaptaciones.agregar(libro.isbn, libro.adaptacion, palabras=palabras["adaptacion"])
+        for campo, indice in self.__trigramas.items():
+            indice.agregar(libro.isbn, getattr(libro, campo), palabras[campo])
+        # El libro pasa a compartir la copia única de su categoría y adaptación
+        libro._compartir_valores(self.__codigos_categorias.internar(libro.categoria),
+                                 self.__codigos_adaptaciones.internar(libro.adaptacion))
+        self.__agregar_publicacion(self.__categorias, self.__codigos_categorias, libro.isbn, libro.categoria)
+        # Una adaptación vacía equivale a no tener adaptación, como en las búsquedas y estadísticas
+        self.__agregar_publicacion(self.__adaptaciones, self.__codigos_adaptaciones, libro.isbn, libro.adaptacion or None)
+        if not libro.disponible:
+            self.__prestados.add(libro.isbn)
+        libro._vincular(self)
+        self.__cache.invalidar()
+        return palabras
+
+    def __palabras_libro(self, libro):
+        """Palabras normalizadas de cada campo de texto del libro"""
+        return {campo: IndiceTexto.palabras(getattr(libro, campo)) for campo in self.__trigramas}
+
+    def __desindexar(self, libro):
+        """Retira el libro de todos los índices de búsqueda"""
+        libro._vincular(None)
+        self.__cache.invalidar()
+        palabras = self.__palabras_libro(libro)
+        self.__orden.eliminar(libro.isbn)
+        self.__indice_isbn.eliminar(libro.isbn)
+        self.__indice_titulos.eliminar(libro.isbn, libro.titulo, palabras["titulo"])
+        self.__indice_autores.eliminar(libro.isbn, libro.autor, palabras["autor"])
+        self.__indice_adaptaciones.eliminar(libro.isbn, libro.adaptacion, palabras["adaptacion"])
+        for campo, indice in self.__trigramas.items():
+            indice.eliminar(libro.isbn, getattr(libro, campo), palabras[campo])
+        self.__retirar_publicacion(self.__categorias, self.__codigos_categorias, libro.isbn, libro.categoria)
+        self.__retirar_publicacion(self.__adaptaciones, self.__codigos_adaptaciones, libro.isbn, libro.adaptacion)
+        self.__prestados.discard(libro.isbn)
+
+    @staticmethod
+    def __agregar_publicacion(indice, codigos, isbn, valor):
+        """Añade el ISBN al conjunto del código del valor indicado (None no se indexa)"""
+        if valor is not None:
+            indice.setdefault(codigos.codificar(valor), set()).add(isbn)
+
+    @staticmethod
+    def __retirar_publicacion(indice, codigos, isbn, valor):
+        """Quita el ISBN del conjunto del código del valor indicado"""
+        codigo = codigos.codigo(valor)
+        isbns = indice.get(codigo)
+        if isbns is not None:
+            isbns.discard(isbn)
+            if not isbns:
+                del indice[codigo]
+
+    def _libro_modificado(self, libro, campo, anterior):
+        """Actualiza los índices cuando cambia un atributo mutable de un libro"""
+        if campo == "disponible":
+            # La disponibilidad no se registra: la reconstruyen los préstamos y devoluciones.
+            # Solo cambia dentro de préstamos y devoluciones, que ya tienen el cerrojo de su ISBN.
+            with self.__cerrojo_prestamos:
+                if libro.disponible:
+                    self.__prestados.discard(libro.isbn)
+                else:
+                    self.__prestados.add(libro.isbn)
+            return
+        with self.__bloquear(libro.isbn):
+            with self.__cerrojo_catalogo:
+                self.__actualizar_indices(libro, campo, anterior)
+            self.__registrar("modificar_libro", libro.isbn, campo, getattr(libro, campo))
+
+    def __actualizar_indices(self, libro, campo, anterior):
+        self.__cache.invalidar()
+        if campo == "adaptacion":
+            palabras_anteriores = IndiceTexto.palabras(anterior)
+            palabras = IndiceTexto.palabras(libro.adaptacion)
+            self.__indice_adaptaciones.eliminar(libro.isbn, anterior, palabras_anteriores)
+            self.__indice_adaptaciones.agregar(libro.isbn, libro.adaptacion, palabras=palabras)
+            self.__trigramas["adaptacion"].eliminar(libro.isbn, anterior, palabras_anteriores)
+            self.__trigramas["adaptacion"].agregar(libro.isbn, libro.adaptacion, palabras)
+            self.__retirar_publicacion(self.__adaptaciones, self.__codigos_adaptaciones, libro.isbn, anterior)
+            self.__agregar_publicacion(self.__adaptaciones, self.__codigos_adaptaciones, libro.isbn,
+                                       libro.adaptacion or None)
+        elif campo == "categoria":
+            self.__retirar_publicacion(self.__categorias, self.__codigos_categorias, libro.isbn, anterior)
+            self.__agregar_publicacion(self.__categorias, self.__codigos_categorias, libro.isbn, libro.categoria)
+
+    def __libros_en_orden(self, isbns):
+        """Retorna los libros de los ISBNs indicados en el orden del catálogo"""
+        return [self.__libros[isbn] for isbn in sorted(isbns, key=self.__orden.numero)]
+    
+    def registrar_usuario(self, nombre, id_usuario):
+        """
+        Registra un nuevo usuario en la biblioteca.
+        Si ya existe un usuario con el mismo ID, devuelve False.
+        """
+        with self.__bloquear(id_usuario):
+            if id_usuario in self.__ids_usuario:
+                return False
+            nuevo_usuario = Usuario(nombre, id_usuario)
+            with self.__cerrojo_usuarios:
+                self.__usuarios[id_usuario] = nuevo_usuario
+                self.__ids_usuario.add(id_usuario)
+                self.__orden_usuarios.agregar(id_usuario)
+            self.__registrar("registrar_usuario", nombre, id_usuario)
+            return True
+    
+    def dar_baja_usuario(self, id_usuario):
+        """
+        Da de baja a un usuario de la biblioteca.
+        Solo si no tiene libros prestados.
+        """
+        with self.__bloquear(id_usuario):
+            if id_usuario in self.__usuarios:
+                usuario = self.__usuarios[id_usuario]
+                if not usuario.libros_prestados:
+                    with self.__cerrojo_usuarios:
+                        del self.__usuarios[id_usuario]
+                        self.__ids_usuario.remove(id_usuario)
+                        self.__orden_usuarios.eliminar(id_usuario)
+                    self.__registrar("dar_baja_usuario", id_usuario)
+                    return True
+        return False
+    
+    def prestar_libro(self, isbn, id_usuario, fecha=None, vencimiento=None):
+        """
+        Realiza el préstamo de un libro a un usuario.
+        fecha es la marca de tiempo del préstamo (por defecto, el momento actual) y vencimiento
+        la fecha límite de devolución (por defecto, DIAS_PRESTAMO días después).
+        Si el libro tiene reservas, solo puede prestarse al primero de la cola.
+        Retorna True si el préstamo fue exitoso, False en caso contrario.
+        """
+        with self.__bloquear(isbn, id_usuario):
+            if isbn in self.__libros and id_usuario in self.__usuarios:
+                libro = self.__libros[isbn]
+                usuario = self.__usuarios[id_usuario]
+                
+                if libro.disponible and self.__turno_reserva(isbn, id_usuario):
+                    fecha = time.time() if fecha is None else fecha
+                    usuario.prestar_libro(libro)
+                    with self.__cerrojo_prestamos:
+                        libro.disponible = False
+                        self.__prestatarios[isbn] = id_usuario
+                        vencimiento = self.__anotar_vencimiento(isbn, fecha, vencimiento)
+                        self.__total_prestamos += 1
+                    # Registrar préstamo en el historial
+                    self.__historial_prestamos.registrar("préstamo", isbn, id_usuario, fecha)
+                    self.__registrar("prestar_libro", isbn, id_usuario, fecha, vencimiento)
+                    return True
+        return False
+    
+    def devolver_libro(self, isbn, id_usuario, fecha=None):
+        """
+        Procesa la devolución de un libro prestado.
+        fecha es la marca de tiempo de la devolución (por defecto, el momento actual).
+        Retorna True si la devolución fue exitosa, False en caso contrario.
+        """
+        with self.__bloquear(isbn, id_usuario):
+            if isbn in self.__libros and id_usuario in self.__usuarios:
+                libro = self.__libros[isbn]
+                usuario = self.__usuarios[id_usuario]
+                
+                if usuario.tiene_libro(isbn):
+                    fecha = time.time() if fecha is None else fecha
+                    usuario.devolver_libro(isbn)
+                    with self.__cerrojo_prestamos:
+                        libro.disponible = True
+                        del self.__prestatarios[isbn]
+                        del self.__vencimientos[isbn]
+                        self.__total_devoluciones += 1
+                    # Registrar devolución en el historial
+                    self.__historial_prestamos.registrar("devolución", isbn, id_usuario, fecha)
+                    self.__registrar("devolver_libro", isbn, id_usuario, fecha)
+                    devuelto = True
+                else:
+                    devuelto = False
+            else:
+                devuelto = False
+        if devuelto:
+            self.__asignar_reserva(isbn)
+        return devuelto
+    
+    def prestar_lote(self, isbns, id_usuario, fecha=None):
+        """
+        Presta varios libros a un usuario como una sola operación: o se prestan todos o ninguno.
+        Retorna (exito, resultados), donde resultados es una lista de (isbn, exito, motivo)
+        en el orden recibido; motivo es None para los libros prestados.
+        """
+        isbns = list(isbns)
+        with self.__bloquear(id_usuario, *isbns):
+            usuario = self.__usuarios.get(id_usuario)
+            vistos = set()
+            motivos = []
+            for isbn in isbns:
+                libro = self.__libros.get(isbn)
+                if usuario is None:
+                    motivos.append("Usuario no encontrado")
+                elif isbn in vistos:
+                    motivos.append("ISBN repetido en el lote")
+                elif libro is None:
+                    motivos.append("Libro no encontrado")
+                elif not libro.disponible:
+                    motivos.append("Libro no disponible")
+                else:
+                    with self.__cerrojo_prestamos:
+                        primero = self.__primera_reserva(isbn)
+                    motivos.append(None if primero in (None, id_usuario) else "Libro reservado por otro usuario")
+                vistos.add(isbn)
+            if not self.__lote_valido(isbns, motivos):
+                return False, self.__resultados_lote(isbns, motivos)
+            fecha = time.time() if fecha is None else fecha
+            with self.__cerrojo_prestamos:
+                for isbn in isbns:
+                    libro = self.__libros[isbn]
+                    libro.disponible = False
+                    usuario.prestar_libro(libro)
+                    self.__prestatarios[isbn] = id_usuario
+                    self.__turno_reserva(isbn, id_usuario)
+                    self.__anotar_vencimiento(isbn, fecha)
+                self.__total_prestamos += len(isbns)
+            self.__historial_prestamos.registrar_lote("préstamo", isbns, id_usuario, fecha)
+            self.__registrar("prestar_lote", isbns, id_usuario, fecha)
+            return True, self.__resultados_lote(isbns, motivos)
+
+    def devolver_lote(self, isbns, id_usuario, fecha=None):
+        """
+        Procesa la devolución de varios libros de un usuario: o se devuelven todos o ninguno.
+        Retorna (exito, resultados) con el mismo formato que prestar_lote.
+        """
+        isbns = list(isbns)
+        with self.__bloquear(id_usuario, *isbns):
+            usuario = self.__usuarios.get(id_usuario)
+            vistos = set()
+            motivos = []
+            for isbn in isbns:
+                if usuario is None:
+                    motivos.append("Usuario no encontrado")
+                elif isbn in vistos:
+                    motivos.append("ISBN repetido en el lote")
+                elif isbn not in self.__libros:
+                    motivos.append("Libro no encontrado")
+                elif not usuario.tiene_libro(isbn):
+                    motivos.append("El libro no está prestado a este usuario")
+                else:
+                    motivos.append(None)
+                vistos.add(isbn)
+            if not self.__lote_valido(isbns, motivos):
+                return False, self.__resultados_lote(isbns, motivos)
+            fecha = time.time() if fecha is None else fecha
+            with self.__cerrojo_prestamos:
+                for isbn in isbns:
+                    usuario.devolver_libro(isbn)
+                    self.__libros[isbn].disponible = True
+                    del self.__prestatarios[isbn]
+                    del self.__vencimientos[isbn]
+                self.__total_devoluciones += len(isbns)
+            self.__historial_prestamos.registrar_lote("devolución", isbns, id_usuario, fecha)
+            self.__registrar("devolver_lote", isbns, id_usuario, fecha)
+        for isbn in isbns:
+            self.__asignar_reserva(isbn)
+        return True, self.__resultados_lote(isbns, motivos)
+
+    def __anotar_vencimiento(self, isbn, fecha, vencimiento=None):
+        """Guarda el vencimiento del préstamo activo del libro y lo retorna"""
+        if vencimiento is None:
+            vencimiento = fecha + self.DIAS_PRESTAMO * 86400
+        self.__numero_prestamo += 1
+        self.__vencimientos[isbn] = (vencimiento, self.__numero_prestamo)
+        heapq.heappush(self.__monticulo_vencimientos, (vencimiento, self.__numero_prestamo, isbn))
+        # Se reconstruye el montículo cuando las entradas de préstamos devueltos son mayoría
+        if len(self.__monticulo_vencimientos) > 2 * len(self.__vencimientos) + 1024:
+            self.__compactar_vencimientos()
+        return vencimiento
+
+    def __compactar_vencimientos(self):
+        """Reconstruye el montículo solo con los préstamos activos"""
+        self.__monticulo_vencimientos = [(vencimiento, numero, isbn) for isbn, (vencimiento, numero)
+                                         in self.__vencimientos.items()]
+        heapq.heapify(self.__monticulo_vencimientos)
+
+    def vencimiento_prestamo(self, isbn):
+        """Retorna la fecha límite de devolución del libro prestado, o None si no está prestado"""
+        entrada = self.__vencimientos.get(isbn)
+        return entrada[0] if entrada else None
+
+    def prestamos_vencidos(self, ahora=None):
+        """
+        Lista los préstamos vencidos como tuplas (libro, id_usuario, vencimiento), del más antiguo al más reciente.
+        Solo recorre la parte del montículo con vencimientos anteriores a 'ahora', sin revisar el resto de préstamos.
+        """
+        ahora = time.time() if ahora is None else ahora
+        with self.__cerrojo_prestamos:
+            monticulo = self.__monticulo_vencimientos
+            while monticulo and self.__vencimientos.get(monticulo[0][2]) != monticulo[0][:2]:
+                heapq.heappop(monticulo)
+            vencidos = []
+            descartados = 0
+            pendientes = [0] if monticulo else []
+            while pendientes:
+                posicion = pendientes.pop()
+                vencimiento, numero, isbn = monticulo[posicion]
+                if vencimiento >= ahora:
+                    continue  # Los hijos de esta posición vencen aún más tarde
+                if self.__vencimientos.get(isbn) == (vencimiento, numero):
+                    vencidos.append((vencimiento, numero, isbn))
+                else:
+                    descartados += 1
+                pendientes.extend(hijo for hijo in (2 * posicion + 1, 2 * posicion + 2) if hijo < len(monticulo))
+            # Si abundan las entradas de préstamos devueltos, se limpian para las próximas consultas
+            if descartados > len(vencidos):
+                self.__compactar_vencimientos()
+            vencidos.sort()
+            return [(self.__libros[isbn], self.__prestatarios[isbn], vencimiento) for vencimiento, _, isbn in vencidos]
+
+    def reservar_libro(self, isbn, id_usuario):
+        """
+        Añade al usuario a la cola de espera de un libro prestado.
+        Al devolverse el libro se presta automáticamente al primero de la cola.
+        Retorna False si el libro está disponible, ya lo tiene el usuario o ya lo había reservado.
+        """
+        with self.__bloquear(isbn, id_usuario):
+            libro = self.__libros.get(isbn)
+            usuario = self.__usuarios.get(id_usuario)
+            if libro is None or usuario is None or libro.disponible or usuario.tiene_libro(isbn):
+                return False
+            with self.__cerrojo_prestamos:
+                cola = self.__reservas.setdefault(isbn, collections.deque())
+                if id_usuario in cola:
+                    return False
+                cola.append(id_usuario)
+            self.__registrar("reservar_libro", isbn, id_usuario)
+            return True
+
+    def cancelar_reserva(self, isbn, id_usuario):
+        """Retira al usuario de la cola de espera del libro"""
+        with self.__bloquear(isbn, id_usuario):
+            with self.__cerrojo_prestamos:
+                cola = self.__reservas.get(isbn)
+                if not cola or id_usuario not in cola:
+                    return False
+                cola.remove(id_usuario)
+                if not cola:
+                    del self.__reservas[isbn]
+            self.__registrar("cancelar_reserva", isbn, id_usuario)
+            return True
+
+    def reservas_libro(self, isbn):
+        """Lista los IDs de usuario en espera para el libro, por orden de llegada"""
+        with self.__cerrojo_prestamos:
+            return list(self.__reservas.get(isbn, ()))
+
+    def __turno_reserva(self, isbn, id_usuario):
+        """
+        Indica si el usuario puede llevarse el libro según la cola de reservas.
+        Si es el primero de la cola, sale de ella.
+        """
+        with self.__cerrojo_prestamos:
+            primero = self.__primera_reserva(isbn)
+            if primero is None:
+                return True
+            if primero != id_usuario:
+                return False
+            cola = self.__reservas[isbn]
+            cola.popleft()
+            if not cola:
+                del self.__reservas[isbn]
+            return True
+
+    def __primera_reserva(self, isbn):
+        """Retorna el primer usuario de la cola del libro, descartando antes a los dados de baja"""
+        cola = self.__reservas.get(isbn)
+        while cola and cola[0] not in self.__usuarios:
+            cola.popleft()
+        if not cola:
+            self.__reservas.pop(isbn, None)
+            return None
+        return cola[0]
+
+    def __asignar_reserva(self, isbn):
+        """Presta el libro devuelto al primer usuario de su cola que siga dado de alta"""
+        if self.__reproduciendo:
+            return  # El registro ya contiene el préstamo resultante
+        while True:
+            with self.__cerrojo_prestamos:
+                siguiente = self.__primera_reserva(isbn)
+                libro = self.__libros.get(isbn)
+                if siguiente is None or libro is None or not libro.disponible:
+                    return
+            if self.prestar_libro(isbn, siguiente):
+                return
+
+    @staticmethod
+    def __lote_valido(isbns, motivos):
+        """Un lote es válido si no está vacío y ningún elemento tiene motivo de rechazo"""
+        if not isbns or any(motivos):
+            # Los elementos correctos de un lote rechazado tampoco se aplican
+            for i, motivo in enumerate(motivos):
+                if motivo is None:
+                    motivos[i] = "Lote cancelado por otros errores"
+            return False
+        return True
+
+    @staticmethod
+    def __resultados_lote(isbns, motivos):
+        return [(isbn, motivo is None, motivo) for isbn, motivo in zip(isbns, motivos)]
+
+    def __registrar(self, operacion, *argumentos):
+        """
+        Persiste la operación en el almacén, si lo hay, y compacta cuando corresponde.
+        Se llama con los cerrojos de las claves de la operación, pero fuera de los de las
+        estructuras, para que la escritura en el registro no detenga al resto de operaciones.
+        """
+        if self.__almacen is None or self.__reproduciendo:
+            return
+        self.__almacen.registrar(operacion, *argumentos)
+        if self.__almacen.necesita_compactar():
+            self.__compactar()
+
+    def __compactar(self, esperar=False):
+        """
+        Pide al almacén una instantánea: el estado se copia con las modificaciones detenidas y se
+        escribe en segundo plano junto con los segmentos nuevos del historial; al terminar se
+        borran los archivos que ya no se usan. En modo concurrente el hilo que registra tiene
+        cerrojos de clave, así que la copia la hace el propio hilo de la compactación.
+        """
+        def exportar():
+            estado, escrituras = self._exportar_estado()
+            historial = self.__historial_prestamos
+            nombres = [nombre for *_, nombre in estado["historial_segmentos"]["segmentos"]]
+            return (estado, lambda: historial.escribir_segmentos(escrituras),
+                    lambda: historial.limpiar_archivos(nombres))
+        self.__almacen.compactar(exportar, detener=self.__detener, esperar=esperar,
+                                 exportar_en_segundo_plano=self.__concurrente and not esperar)
+
+    def _reproducir(self, operacion, argumentos):
+        """Aplica una operación leída del registro sin volver a registrarla"""
+        self.__reproduciendo = True
+        try:
+            if operacion == "agregar_libro":
+                self.agregar_libro(Libro(*argumentos))
+            elif operacion == "agregar_libros_lote":
+                self.agregar_libros_lote([Libro(*datos) for datos in argumentos[0]])
+            elif operacion == "modificar_libro":
+                isbn, campo, valor = argumentos
+                setattr(self.__libros[isbn], campo, valor)
+            else:
+                getattr(self, operacion)(*argumentos)
+        finally:
+            self.__reproduciendo = False
+
+    def _exportar_estado(self):
+        """
+        Retorna (estado, escrituras): el estado completo de la biblioteca como estructuras
+        serializables y los segmentos del historial que deben escribirse antes de guardarlo.
+        El historial no se copia en el estado: este solo referencia los archivos de sus segmentos.
+        """
+        historial, escrituras = self.__historial_prestamos.exportar()
+        return {
+            # Por columnas: unas pocas listas en lugar de una por libro, que dispararían el recolector de basura
+            "libros_columnas": {campo: [getattr(libro, campo) for libro in self.__libros.values()]
+                                for campo in CAMPOS_CATALOGO},
+            "usuarios": [[usuario.nombre, usuario.id_usuario, [libro.isbn for libro in usuario.libros_prestados]]
+                         for usuario in self.__usuarios.values()],
+            "historial_segmentos": historial,
+            "contadores": [self.__total_prestamos, self.__total_devoluciones],
+            "vencimientos": [[isbn, vencimiento] for isbn, (vencimiento, _) in self.__vencimientos.items()],
+            "reservas": [[isbn, list(cola)] for isbn, cola in self.__reservas.items()],
+        }, escrituras
+
+    def _restaurar_estado(self, estado):
+        """Reconstruye la biblioteca a partir de un estado exportado"""
+        self.__reproduciendo = True
+        try:
+            if "libros_columnas" in estado:
+                columnas = [estado["libros_columnas"][campo] for campo in CAMPOS_CATALOGO]
+                self.agregar_libros_lote(Libro(*datos) for datos in zip(*columnas))
+            else:
+                self.agregar_libros_lote(Libro(*datos) for datos in estado["libros"])
+            for nombre, id_usuario, isbns in estado["usuarios"]:
+                self.registrar_usuario(nombre, id_usuario)
+                usuario = self.__usuarios[id_usuario]
+                for isbn in isbns:
+                    libro = self.__libros[isbn]
+                    libro.disponible = False
+                    usuario.prestar_libro(libro)
+                    self.__prestatarios[isbn] = id_usuario
+            # Las instantáneas anteriores a los vencimientos reciben el plazo por defecto desde ahora
+            vencimientos = dict(estado.get("vencimientos", []))
+            for isbn in self.__prestatarios:
+                self.__anotar_vencimiento(isbn, time.time(), vencimientos.get(isbn))
+            for isbn, ids_usuario in estado.get("reservas", []):
+                self.__reservas[isbn] = collections.deque(ids_usuario)
+            if "historial_segmentos" in estado:
+                self.__historial_prestamos.restaurar(estado["historial_segmentos"])
+            else:
+                # Instantáneas antiguas, con todos los eventos del historial copiados
+                for fecha, tipo, isbn, id_usuario in estado["historial"]:
+                    self.__historial_prestamos.registrar(tipo, isbn, id_usuario, fecha)
+            self.__total_prestamos, self.__total_devoluciones = estado["contadores"]
+        finally:
+            self.__reproduciendo = False
+
+    def guardar(self):
+        """Fuerza una instantánea del estado actual en el almacén"""
+        if self.__almacen is not None:
+            self.__compactar(esperar=True)
+            return True
+        return False
+
+    def buscar_libro_por_isbn(self, isbn):
+        """Busca un libro por su ISBN"""
+        return self.__libros.get(isbn)
+    
+    def buscar_libros_por_prefijo_isbn(self, prefijo):
+        """Busca libros cuyo ISBN empieza por el prefijo indicado (p. ej. una editorial), ordenados por ISBN"""
+        with self.__cerrojo_catalogo:
+            return [self.__libros[isbn] for isbn in self.__indice_isbn.prefijo(prefijo)]
+
+    def buscar_libros_por_rango_isbn(self, desde, hasta):
+        """Busca libros con ISBN entre desde y hasta (ambos incluidos), ordenados por ISBN"""
+        desde_clave = IndiceISBN.normalizar(desde)
+        hasta_clave = IndiceISBN.normalizar(hasta)
+        if desde_clave is None or hasta_clave is None:
+            return []
+        with self.__cerrojo_catalogo:
+            return [self.__libros[isbn] for isbn in self.__indice_isbn.rango(desde_clave, hasta_clave)]
+
+    def __consultar(self, clave, busqueda, *argumentos):
+        """Retorna el resultado de la búsqueda desde la caché, calculándolo si no está"""
+        resultado = self.__cache.obtener(clave)
+        if resultado is None:
+            resultado = tuple(busqueda(*argumentos))
+            self.__cache.guardar(clave, resultado)
+        return list(resultado)
+
+    def activar_instrumentacion(self):
+        """
+        Empieza a medir todos los métodos públicos de esta biblioteca.
+        Los métodos se envuelven solo en esta instancia; desactivada, no hay ningún coste.
+        """
+        if self.__instrumentacion is None:
+            self.__instrumentacion = Instrumentacion()
+            for nombre, valor in vars(Biblioteca).items():
+                if not nombre.startswith("_") and callable(valor) and nombre not in self.METODOS_SIN_MEDIR:
+                    setattr(self, nombre, self.__instrumentacion.envolver(nombre, getattr(self, nombre),
+                                                                          self.POSICION_DATOS.get(nombre)))
+        return self.__instrumentacion
+
+    def desactivar_instrumentacion(self):
+        """Deja de medir y retorna las mediciones acumuladas (None si no estaba activa)"""
+        instrumentacion = self.__instrumentacion
+        if instrumentacion is not None:
+            for nombre in list(vars(self)):
+                if not nombre.startswith("_"):
+                    delattr(self, nombre)
+            self.__instrumentacion = None
+        return instrumentacion
+
+    @property
+    def instrumentacion(self):
+        """Instrumentacion activa, o None"""
+        return self.__instrumentacion
+
+    def estadisticas_cache(self):
+        """Retorna los aciertos, fallos y expulsiones de la caché de búsquedas"""
+        with self.__cerrojo_catalogo:
+            return self.__cache.estadisticas()
+
+    def buscar_libros_por_titulo(self, titulo):
+        """Busca libros que contengan el título especificado"""
+        with self.__cerrojo_catalogo:
+            return self.__consultar(("titulo", titulo.lower()), self.__buscar_por_titulo, titulo)
+
+    def __buscar_por_titulo(self, titulo):
+        candidatos = self.__indice_titulos.candidatos(titulo)
+        libros = self.__libros.values() if candidatos is None else self.__libros_en_orden(candidatos)
+        return [libro for libro in libros 
+                if titulo.lower() in libro.titulo.lower()]
+    
+    def buscar_libros_por_autor(self, autor):
+        """Busca libros escritos por el autor especificado"""
+        with self.__cerrojo_catalogo:
+            return self.__consultar(("autor", autor.lower()), self.__buscar_por_autor, autor)
+
+    def __buscar_por_autor(self, autor):
+        candidatos = self.__indice_autores.candidatos(autor)
+        libros = self.__libros.values() if candidatos is None else self.__libros_en_orden(candidatos)
+        return [libro for libro in libros 
+                if autor.lower() in libro.autor.lower()]
+    
+    def buscar_libros_por_categoria(self, categoria):
+        """Busca libros de la categoría especificada"""
+        with self.__cerrojo_catalogo:
+            return self.__consultar(("categoria", categoria.lower()), self.__buscar_por_categoria, categoria)
+
+    def __buscar_por_categoria(self, categoria):
+        isbns = set()
+        for codigo in self.__codigos_categorias.codigos_sin_mayusculas(categoria):
+            isbns |= self.__categorias.get(codigo, set())
+        return self.__libros_en_orden(isbns)
+    
+    def buscar_libros_por_adaptacion(self, adaptacion):
+        """Busca libros adaptados a una serie o película específica"""
+        with self.__cerrojo_catalogo:
+            return self.__consultar(("adaptacion", adaptacion.lower()), self.__buscar_por_adaptacion, adaptacion)
+
+    def __buscar_por_adaptacion(self, adaptacion):
+        candidatos = self.__indice_adaptaciones.candidatos(adaptacion)
+        libros = self.__libros.values() if candidatos is None else self.__libros_en_orden(candidatos)
+        return [libro for libro in libros 
+                if libro.adaptacion and adaptacion.lower() in libro.adaptacion.lower()]
+    
+    def buscar_libros_aproximado(self, consulta, limite=10, umbral=0.5,
+                                 campos=("titulo", "autor", "adaptacion")):
+        """
+        Busca libros de forma aproximada en título, autor y adaptación,
+        tolerando errores de escritura y tildes ("Harri Poter", "Fundacion").
+        Retorna hasta 'limite' pares (libro, puntuación entre 0 y 1), de mayor a menor puntuación.
+        """
+        # Consultas con las mismas palabras normalizadas tienen los mismos trigramas
+        clave = ("aproximado", " ".join(IndiceTexto.palabras(consulta)), limite, umbral, tuple(campos))
+        with self.__cerrojo_catalogo:
+            return self.__consultar(clave, self.__buscar_aproximado, consulta, limite, umbral, campos)
+
+    def puntuar_aproximado(self, consulta, umbral=0.5, campos=("titulo", "autor", "adaptacion")):
+        """
+        Retorna un diccionario ISBN -> (cobertura, dice) con la mejor puntuación de cada libro
+        en los campos indicados, sin ordenar ni recortar (ver buscar_libros_aproximado).
+        """
+        with self.__cerrojo_catalogo:
+            mejores = {}
+            for campo in campos:
+                for isbn, puntuacion in self.__trigramas[campo].puntuar(consulta, umbral).items():
+                    if puntuacion > mejores.get(isbn, (0, 0)):
+                        mejores[isbn] = puntuacion
+            return mejores
+
+    def __buscar_aproximado(self, consulta, limite, umbral, campos):
+        mejores = self.puntuar_aproximado(consulta, umbral, campos)
+        # A igual puntuación, se respeta el orden del catálogo
+        seleccion = heapq.nlargest(limite, mejores.items(),
+                                   key=lambda par: (par[1], -self.__orden.numero(par[0])))
+        return [(self.__libros[isbn], round(puntuacion[0], 3)) for isbn, puntuacion in seleccion]
+
+    def historial_prestamos(self, desde=None, hasta=None):
+        """Genera los eventos de préstamo y devolución con fecha en [desde, hasta)"""
+        return self.__historial_prestamos.eventos(desde, hasta)
+
+    def historial_usuario(self, id_usuario, desde=None, hasta=None):
+        """Lista los préstamos y devoluciones de un usuario con fecha en [desde, hasta)"""
+        return self.__historial_prestamos.eventos_usuario(id_usuario, desde, hasta)
+
+    def historial_libro(self, isbn, desde=None, hasta=None):
+        """Lista los préstamos y devoluciones de un libro con fecha en [desde, hasta)"""
+        return self.__historial_prestamos.eventos_libro(isbn, desde, hasta)
+
+    def volcar_historial(self, conservar=1):
+        """Vuelca a disco los segmentos antiguos del historial (requiere un almacén)"""
+        return self.__historial_prestamos.volcar_segmentos(conservar)
+
+    def listar_libros_prestados_usuario(self, id_usuario):
+        """Lista todos los libros prestados a un usuario específico"""
+        if id_usuario in self.__usuarios:
+            return self.__usuarios[id_usuario].listar_libros_prestados()
+        return []
+    
+    def listar_todos_libros(self):
+        """Lista todos los libros de la biblioteca"""
+        return list(self.__libros.values())
+    
+    def listar_libros_disponibles(self):
+        """Lista los libros que no están prestados, en el orden del catálogo"""
+        with self.__cerrojo_catalogo, self.__cerrojo_prestamos:
+            if not self.__prestados:
+                return list(self.__libros.values())
+            return [libro for isbn, libro in self.__libros.items() if isbn not in self.__prestados]
+
+    def listar_libros_prestados(self):
+        """Lista los libros prestados actualmente, en el orden del catálogo"""
+        return self.__libros_en_orden(self.__prestados)
+
+    def contar_libros(self):
+        """Retorna el número total de libros"""
+        return len(self.__libros)
+
+    def contar_libros_prestados(self):
+        """Retorna el número de libros prestados actualmente"""
+        return len(self.__prestados)
+
+    def estadisticas(self, top=None):
+        """
+        Retorna una instantánea de las estadísticas de la biblioteca.
+        Los contadores se mantienen al añadir, eliminar, prestar y devolver,
+        por lo que el coste no depende del tamaño del catálogo.
+        Si se indica top, solo se incluyen las categorías y adaptaciones más populares.
+        """
+        with self.__cerrojo_catalogo, self.__cerrojo_prestamos:
+            total_libros = len(self.__libros)
+            prestados = len(self.__prestados)
+            categorias = ((self.__codigos_categorias.valor(codigo), len(isbns))
+                          for codigo, isbns in self.__categorias.items())
+            adaptaciones = ((self.__codigos_adaptaciones.valor(codigo), len(isbns))
+                            for codigo, isbns in self.__adaptaciones.items())
+            return {
+                "total_libros": total_libros,
+                "disponibles": total_libros - prestados,
+                "prestados": prestados,
+                "total_usuarios": len(self.__usuarios),
+                "total_prestamos": self.__total_prestamos,
+                "total_devoluciones": self.__total_devoluciones,
+                "categorias": self.__mas_populares(categorias, top),
+                "adaptaciones": self.__mas_populares(adaptaciones, top),
+            }
+
+    @staticmethod
+    def __mas_populares(conteos, top):
+        """Ordena los pares (nombre, cantidad) de mayor a menor, limitando a top si se indica"""
+        if top is None:
+            return sorted(conteos, key=lambda x: x[1], reverse=True)
+        return heapq.nlargest(top, conteos, key=lambda x: x[1])
+
+    def agrupar_por_adaptacion(self):
+        """
+        Retorna pares (adaptación, libros) ordenados por adaptación.
+        Los libros de cada grupo conservan el orden del catálogo.
+        """
+        with self.__cerrojo_catalogo:
+            grupos = [(self.__codigos_adaptaciones.valor(codigo), isbns)
+                      for codigo, isbns in self.__adaptaciones.items()]
+            return [(adaptacion, self.__libros_en_orden(isbns)) for adaptacion, isbns in sorted(grupos)]
+
+    def iterar_libros(self, cursor=None, estado=None):
+        """
+        Genera pares (cursor, libro) en el orden del catálogo sin construir listas completas.
+        estado puede ser None (todos), "disponibles" o "prestados".
+        El cursor de cualquier par permite reanudar el recorrido justo después de ese libro.
+        """
+        if estado == "prestados":
+            # Los prestados se recorren a partir de su índice, sin pasar por todo el catálogo
+            with self.__cerrojo_catalogo, self.__cerrojo_prestamos:
+                pares = sorted((self.__orden.numero(isbn), isbn) for isbn in self.__prestados)
+            inicio = 0 if cursor is None else bisect.bisect_right(pares, cursor, key=lambda par: par[0])
+            for numero, isbn in pares[inicio:]:
+                libro = self.__libros.get(isbn)
+                if libro is not None and not libro.disponible:
+                    yield numero, libro
+            return
+        for numero, isbn in self.__orden.recorrer(cursor):
+            libro = self.__libros.get(isbn)
+            if libro is None or (estado == "disponibles" and not libro.disponible):
+                continue
+            yield numero, libro
+
+    def paginar_libros(self, cursor=None, tamano=20, estado=None):
+        """
+        Retorna una página de libros y el cursor para pedir la siguiente (None si no hay más).
+        estado puede ser None (todos), "disponibles" o "prestados".
+        """
+        return self.__paginar(self.iterar_libros(cursor, estado), tamano)
+
+    def iterar_usuarios(self, cursor=None):
+        """Genera pares (cursor, usuario) en orden de registro"""
+        for numero, id_usuario in self.__orden_usuarios.recorrer(cursor):
+            usuario = self.__usuarios.get(id_usuario)
+            if usuario is not None:
+                yield numero, usuario
+
+    def paginar_usuarios(self, cursor=None, tamano=20):
+        """Retorna una página de usuarios y el cursor para pedir la siguiente (None si no hay más)"""
+        return self.__paginar(self.iterar_usuarios(cursor), tamano)
+
+    def paginar_busqueda(self, tipo, consulta, cursor=None, tamano=20):
+        """
+        Retorna una página de los resultados de buscar_libros_por_<tipo> y el cursor siguiente.
+        tipo es "titulo", "autor", "categoria" o "adaptacion".
+        """
+        resultados = getattr(self, f"buscar_libros_por_{tipo}")(consulta)
+        pares = ((self.__orden.numero(libro.isbn), libro) for libro in resultados)
+        if cursor is not None:
+            pares = ((numero, libro) for numero, libro in pares if numero > cursor)
+        return self.__paginar(pares, tamano)
+
+    @staticmethod
+    def __paginar(pares, tamano):
+        pagina = []
+        ultimo = None
+        for numero, elemento in pares:
+            if len(pagina) == tamano:
+                return pagina, ultimo
+            pagina.append(elemento)
+            ultimo = numero
+        return pagina, None
+
+    def listar_usuarios(self):
+        """Lista todos los usuarios registrados"""
+        return list(self.__usuarios.values())
+    
+    def obtener_usuario(self, id_usuario):
+        """Obtiene un usuario por su ID"""
+        return self.__usuarios.get(id_usuario)
+
+    def obtener_prestatario(self, isbn):
+        """Obtiene el usuario que tiene prestado el libro, o None si no está prestado"""
+        id_usuario = self.__prestatarios.get(isbn)
+        return self.__usuarios.get(id_usuario) if id_usuario is not None else None
+
+
+CAMPOS_CATALOGO = ("titulo", "autor", "categoria", "isbn", "adaptacion")
+
+
+def leer_catalogo(ruta, formato=None):
+    """
+    Lee un archivo de catálogo fila a fila, sin cargarlo entero en memoria.
+    Admite CSV con cabecera (titulo, autor, categoria, isbn, adaptacion) o JSON Lines
+    con objetos de esas mismas claves. Genera pares (número de fila, diccionario o None).
+    """
+    if formato is None:
+        formato = "jsonl" if ruta.lower().endswith((".jsonl", ".json")) else "csv"
+    # utf-8-sig descarta la marca BOM con la que Excel empieza los CSV exportados
+    with open(ruta, "r", encoding="utf-8-sig", newline="") as f:
+        if formato == "csv":
+            for numero, fila in enumerate(csv.DictReader(f), 2):
+                yield numero, fila
+        else:
+            for numero, linea in enumerate(f, 1):
+                if not linea.strip():
+                    continue
+                try:
+                    fila = json.loads(linea)
+                except ValueError:
+                    fila = None
+                yield numero, fila if isinstance(fila, dict) else None
+
+
+def importar_catalogo(biblioteca, ruta, formato=None, tamano_lote=10000, max_errores=100):
+    """
+    Importa libros de forma masiva desde un archivo CSV o JSON Lines.
+    Los libros se construyen y añaden por lotes, por lo que la memoria usada no
+    depende del tamaño del archivo. Retorna un informe con las filas aceptadas,
+    las rechazadas (con una muestra de los motivos) y la velocidad en filas/segundo.
+    """
+    informe = {"leidas": 0, "aceptadas": 0, "rechazadas": 0, "errores": []}
+
+    def rechazar(numero, motivo):
+        informe["rechazadas"] += 1
+        if len(informe["errores"]) < max_errores:
+            informe["errores"].append((numero, motivo))
+
+    def procesar(lote):
+        isbns_lote = {}
+        libros = []
+        for numero, libro in lote:
+            if libro.isbn in isbns_lote:
+                rechazar(numero, f"ISBN {libro.isbn} repetido en el archivo")
+                continue
+            isbns_lote[libro.isbn] = numero
+            libros.append(libro)
+        existentes = biblioteca.agregar_libros_lote(libros)
+        for libro in existentes:
+            rechazar(isbns_lote[libro.isbn], f"ISBN {libro.isbn} ya existe en la biblioteca")
+        informe["aceptadas"] += len(libros) - len(existentes)
+
+    inicio = time.perf_counter()
+    lote = []
+    for numero, fila in leer_catalogo(ruta, formato):
+        informe["leidas"] += 1
+        if fila is None:
+            rechazar(numero, "Formato inválido")
+            continue
+        valores = [fila.get(campo) for campo in CAMPOS_CATALOGO]
+        invalido = next((campo for campo, valor in zip(CAMPOS_CATALOGO, valores)
+                         if valor is not None and (isinstance(valor, bool)
+                                                   or not isinstance(valor, (str, int, float)))), None)
+        if invalido:
+            rechazar(numero, f"Valor no válido en el campo {invalido}")
+            continue
+        # Un ISBN numérico en JSON Lines se acepta como texto
+        datos = [("" if valor is None else str(valor)).strip() for valor in valores]
+        if not all(datos[:4]):
+            rechazar(numero, "Faltan título, autor, categoría o ISBN")
+            continue
+        datos[4] = datos[4] or None
+        lote.append((numero, Libro(*datos)))
+        if len(lote) >= tamano_lote:
+            procesar(lote)
+            lote = []
+    if lote:
+        procesar(lote)
+
+    informe["segundos"] = time.perf_counter() - inicio
+    informe["filas_por_segundo"] = informe["leidas"] / informe["segundos"] if informe["segundos"] else 0
+    return informe
+
+
+def libro_a_diccionario(libro):
+    """Convierte un libro en un diccionario serializable a JSON"""
+    return {
+        "titulo": libro.titulo,
+        "autor": libro.autor,
+        "categoria": libro.categoria,
+        "isbn": libro.isbn,
+        "adaptacion": libro.adaptacion,
+        "disponible": libro.disponible,
+    }
+
+
+class ServidorBiblioteca:
+    """
+    Servidor asíncrono que expone una biblioteca mediante un protocolo de líneas JSON.
+    Cada petición es un objeto con "op" y sus parámetros (y opcionalmente "id");
+    cada respuesta es un objeto {"id", "ok", "resultado" o "error"} en una línea.
+    Un cliente puede enviar varias peticiones sin esperar respuesta: se atienden en orden.
+    """
+    BUSQUEDAS = {
+        "titulo": "buscar_libros_por_titulo",
+        "autor": "buscar_libros_por_autor",
+        "categoria": "buscar_libros_por_categoria",
+        "adaptacion": "buscar_libros_por_adaptacion",
+    }
+    COLA_CONEXIONES = 4096  # Conexiones pendientes de aceptar, para picos de miles de clientes
+
+    def __init__(self, biblioteca, anfitrion="127.0.0.1", puerto=8765, ruta_socket=None):
+        self.__biblioteca = biblioteca
+        self.__anfitrion = anfitrion
+        self.__puerto = puerto
+        self.__ruta_socket = ruta_socket  # Si se indica, se usa un socket Unix en lugar de TCP
+        self.__servidor = None
+
+    async def iniciar(self):
+        """Empieza a aceptar conexiones"""
+        if self.__ruta_socket:
+            self.__servidor = await asyncio.start_unix_server(self.__atender, path=self.__ruta_socket,
+                                                              backlog=self.COLA_CONEXIONES)
+        else:
+            self.__servidor = await asyncio.start_server(self.__atender, self.__anfitrion, self.__puerto,
+                                                         backlog=self.COLA_CONEXIONES)
+        return self.__servidor
+
+    async def servir(self):
+        """Atiende conexiones hasta que se cancele la tarea"""
+        if self.__servidor is None:
+            await self.iniciar()
+        async with self.__servidor:
+            await self.__servidor.serve_forever()
+
+    async def cerrar(self):
+        if self.__servidor is not None:
+            self.__servidor.close()
+            await self.__servidor.wait_closed()
+
+    async def __atender(self, lector, escritor):
+        """Procesa las peticiones de una conexión en el orden en que llegan"""
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea:
+                    break
+                escritor.write(self.procesar(linea) + b"\n")
+                await escritor.drain()
+        except ConnectionError:
+            pass
+        finally:
+            escritor.close()
+
+    def procesar(self, linea):
+        """Procesa una línea de petición y retorna la línea de respuesta codificada"""
+        id_peticion = None
+        try:
+            peticion = json.loads(linea)
+            id_peticion = peticion.get("id")
+            resultado = self.__ejecutar(peticion)
+            respuesta = {"id": id_peticion, "ok": True, "resultado": resultado}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            respuesta = {"id": id_peticion, "ok": False, "error": f"Petición inválida: {e}"}
+        return json.dumps(respuesta, ensure_ascii=False).encode("utf-8")
+
+    def __ejecutar(self, peticion):
+        biblioteca = self.__biblioteca
+        operacion = peticion["op"]
+        if operacion == "prestar":
+            return biblioteca.prestar_libro(peticion["isbn"], peticion["id_usuario"])
+        if operacion == "devolver":
+            return biblioteca.devolver_libro(peticion["isbn"], peticion["id_usuario"])
+        if operacion in ("prestar_lote", "devolver_lote"):
+            exito, resultados = getattr(biblioteca, operacion)(peticion["isbns"], peticion["id_usuario"])
+            return {"exito": exito, "resultados": resultados}
+        if operacion == "buscar":
+            if peticion["tipo"] == "isbn":
+                libro = biblioteca.buscar_libro_por_isbn(peticion["valor"])
+                return [libro_a_diccionario(libro)] if libro else []
+            libros = getattr(biblioteca, self.BUSQUEDAS[peticion["tipo"]])(peticion["valor"])
+            return [libro_a_diccionario(libro) for libro in libros[:peticion.get("limite", 100)]]
+        if operacion == "informe":
+            tipo = peticion.get("tipo", "estadisticas")
+            if tipo == "estadisticas":
+                return biblioteca.estadisticas(peticion.get("top"))
+            if tipo == "disponibles":
+                return [libro_a_diccionario(libro) for libro in biblioteca.listar_libros_disponibles()]
+            if tipo == "prestados":
+                return [libro_a_diccionario(libro) for libro in biblioteca.listar_libros_prestados()]
+            raise ValueError(f"informe desconocido '{tipo}'")
+        raise ValueError(f"operación desconocida '{operacion}'")
+
+
+async def generar_carga(peticiones_cliente, anfitrion="127.0.0.1", puerto=8765, clientes=100, en_vuelo=8):
+    """
+    Generador de carga para ServidorBiblioteca.
+    Abre el número de clientes indicado; cada uno envía las peticiones de peticiones_cliente(n)
+    manteniendo hasta en_vuelo peticiones sin responder. Retorna latencias p50/p99 y peticiones/s.
+    """
+    latencias = []
+
+    async def cliente(numero):
+        lector, escritor = await asyncio.open_connection(anfitrion, puerto)
+        envios = {}
+        pendientes = asyncio.Semaphore(en_vuelo)
+
+        async def leer(total):
+            for _ in range(total):
+                respuesta = json.loads(await lector.readline())
+                latencias.append(time.perf_counter() - envios.pop(respuesta["id"]))
+                pendientes.release()
+
+        peticiones = list(peticiones_cliente(numero))
+        lectura = asyncio.ensure_future(leer(len(peticiones)))
+        for i, peticion in enumerate(peticiones):
+            await pendientes.acquire()
+            peticion = dict(peticion, id=i)
+            envios[i] = time.perf_counter()
+            escritor.write(json.dumps(peticion).encode("utf-8") + b"\n")
+            await escritor.drain()
+        await lectura
+        escritor.close()
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente(numero) for numero in range(clientes)))
+    duracion = time.perf_counter() - inicio
+    latencias.sort()
+
+    def percentil(p):
+        return latencias[min(int(len(latencias) * p), len(latencias) - 1)] * 1000 if latencias else 0
+
+    return {
+        "peticiones": len(latencias),
+        "peticiones_por_segundo": len(latencias) / duracion if duracion else 0,
+        "p50_ms": percentil(0.50),
+        "p99_ms": percentil(0.99),
+    }
+
+
+def _a_serializable(valor):
+    """Convierte libros y usuarios (que referencian su biblioteca) en estructuras simples"""
+    if isinstance(valor, Libro):
+        return libro_a_diccionario(valor)
+    if isinstance(valor, Usuario):
+        return {"nombre": valor.nombre, "id_usuario": valor.id_usuario,
+                "libros_prestados": [libro.isbn for libro in valor.libros_prestados]}
+    if isinstance(valor, (list, tuple)):
+        return [_a_serializable(elemento) for elemento in valor]
+    return valor
+
+
+class CatalogoCompartido:
+    """
+    Catálogo de solo lectura en memoria compartida, en formato columnar.
+    Los campos de cada libro (título, autor, categoría, ISBN y adaptación) se guardan
+    codificados en UTF-8 uno tras otro, y un array de posiciones indica dónde empieza cada uno.
+    Los procesos fragmento leen el catálogo directamente del bloque compartido, sin que
+    los libros se copien ni se serialicen a través de las tuberías.
+    """
+    CAMPOS = 5
+    SIN_ADAPTACION = b"\x00"  # Marca de un libro sin adaptación (None)
+
+    def __init__(self, memoria, propietario):
+        self.__memoria = memoria
+        self.__propietario = propietario  # Solo quien lo crea libera el bloque
+        self.__num_libros = struct.unpack_from("<q", memoria.buf)[0]
+        fin_posiciones = 8 + 8 * (self.CAMPOS * self.__num_libros + 1)
+        self.__posiciones = memoria.buf[8:fin_posiciones].cast("q")
+        self.__datos = memoria.buf[fin_posiciones:]
+
+    @classmethod
+    def crear(cls, libros):
+        """Copia los libros a un bloque de memoria compartida nuevo"""
+        posiciones = array.array("q")
+        partes = []
+        total = 0
+        for libro in libros:
+            for valor in (libro.titulo, libro.autor, libro.categoria, libro.isbn):
+                parte = valor.encode("utf-8")
+                posiciones.append(total)
+                partes.append(parte)
+                total += len(parte)
+            parte = cls.SIN_ADAPTACION if libro.adaptacion is None else libro.adaptacion.encode("utf-8")
+            posiciones.append(total)
+            partes.append(parte)
+            total += len(parte)
+        posiciones.append(total)
+        inicio_datos = 8 + 8 * len(posiciones)
+        memoria = shared_memory.SharedMemory(create=True, size=inicio_datos + total)
+        struct.pack_into("<q", memoria.buf, 0, len(posiciones) // cls.CAMPOS)
+        memoria.buf[8:inicio_datos] = posiciones.tobytes()
+        memoria.buf[inicio_datos:inicio_datos + total] = b"".join(partes)
+        return cls(memoria, propietario=True)
+
+    @classmethod
+    def adjuntar(cls, nombre):
+        """Abre desde otro proceso un catálogo creado con crear()"""
+        return cls(shared_memory.SharedMemory(name=nombre), propietario=False)
+
+    @property
+    def nombre(self):
+        return self.__memoria.name
+
+    def __len__(self):
+        return self.__num_libros
+
+    def campo(self, numero, indice):
+        """Bytes del campo indicado (0 a 4) del libro número 'numero', sin decodificar"""
+        posicion = numero * self.CAMPOS + indice
+        return self.__datos[self.__posiciones[posicion]:self.__posiciones[posicion + 1]]
+
+    def libro(self, numero):
+        """Construye el Libro guardado en la posición indicada"""
+        valores = [bytes(self.campo(numero, indice)).decode("utf-8") for indice in range(self.CAMPOS - 1)]
+        adaptacion = bytes(self.campo(numero, self.CAMPOS - 1))
+        valores.append(None if adaptacion == self.SIN_ADAPTACION else adaptacion.decode("utf-8"))
+        return Libro(*valores)
+
+    def cerrar(self):
+        """Cierra la vista de este proceso; el creador además libera el bloque"""
+        self.__posiciones.release()
+        self.__datos.release()
+        self.__memoria.close()
+        if self.__propietario:
+            self.__memoria.unlink()
+
+
+def _fragmento_de(isbn, num_fragmentos):
+    """Fragmento al que pertenece un ISBN (texto o bytes UTF-8), según un hash estable"""
+    if isinstance(isbn, str):
+        isbn = isbn.encode("utf-8")
+    return zlib.crc32(isbn) % num_fragmentos
+
+
+def _ejecutar_fragmento(conexion, fragmento, num_fragmentos, tamano_cache):
     """
-    Clase que representa a un usuario de la biblioteca.
-    Mantiene un registro de los libros prestados al usuario.
+    Bucle de un proceso fragmento: ejecuta sobre su biblioteca los métodos que recibe.
+    Cada libro lleva el número de alta global que le asigna BibliotecaDistribuida, y las
+    búsquedas retornan pares (número, libro) para poder combinarlas en el orden del catálogo.
     """
-    def __init__(self, nombre, id_usuario):
-        self.__nombre = nombre
-        self.__id_usuario = id_usuario
-        self.__libros_prestados = []  # Lista para almacenar los libros prestados
-        
-    @property
-    def nombre(self):
-        return self.__nombre
-    
-    @property
-    def id_usuario(self):
-        return self.__id_usuario
-    
-    @property
-    def libros_prestados(self):
-        return self.__libros_prestados
-    
-    def prestar_libro(self, libro):
-        """Añade un libro a la lista de libros prestados del usuario"""
-        self.__libros_prestados.append(libro)
-        
-    def devolver_libro(self, isbn):
-        """Elimina un libro de la lista de libros prestados del usuario"""
-        for i, libro in enumerate(self.__libros_prestados):
-            if libro.isbn == isbn:
-                return self.__libros_prestados.pop(i)
-        return None
-    
-    def listar_libros_prestados(self):
-        """Retorna una lista de los libros prestados al usuario"""
-        return self.__libros_prestados
-    
-    def __str__(self):
-        return f"Usuario: {self.__nombre} (ID: {self.__id_usuario}) - Libros prestados: {len(self.__libros_prestados)}"
+    biblioteca = Biblioteca("fragmento", tamano_cache=tamano_cache)
+    numeros = {}  # Diccionario ISBN -> número de alta global
 
+    def agregar_lote(libros, numeros_lote):
+        rechazados = {libro.isbn for libro in biblioteca.agregar_libros_lote(libros)}
+        for libro, numero in zip(libros, numeros_lote):
+            if libro.isbn not in rechazados:
+                numeros[libro.isbn] = numero
+        return list(rechazados)
 
-class Biblioteca:
+    while True:
+        mensaje = conexion.recv()
+        if mensaje is None:
+            break
+        metodo, argumentos = mensaje
+        try:
+            if metodo == "agregar_libro":
+                datos, numero = argumentos
+                resultado = biblioteca.agregar_libro(Libro(*datos))
+                if resultado:
+                    numeros[datos[3]] = numero
+            elif metodo == "agregar_libros_lote":
+                lote = argumentos[0]
+                resultado = agregar_lote([Libro(*datos) for datos, _ in lote], [numero for _, numero in lote])
+            elif metodo == "cargar_compartido":
+                # Solo se decodifican los libros de este fragmento
+                nombre, primer_numero = argumentos
+                catalogo = CatalogoCompartido.adjuntar(nombre)
+                resultado = []
+                libros, numeros_lote = [], []
+                for posicion in range(len(catalogo)):
+                    if _fragmento_de(catalogo.campo(posicion, 3), num_fragmentos) != fragmento:
+                        continue
+                    libros.append(catalogo.libro(posicion))
+                    numeros_lote.append(primer_numero + posicion)
+                    if len(libros) >= 10000:
+                        resultado.extend(agregar_lote(libros, numeros_lote))
+                        libros, numeros_lote = [], []
+                if libros:
+                    resultado.extend(agregar_lote(libros, numeros_lote))
+                catalogo.cerrar()
+            elif metodo.startswith("buscar_libros_por_"):
+                resultado = [(numeros[libro.isbn], libro) for libro in getattr(biblioteca, metodo)(*argumentos)]
+            elif metodo == "puntuar_aproximado":
+                # Puntuaciones completas (sin redondear) para desempatar igual que Biblioteca
+                consulta, limite, umbral = argumentos
+                mejores = heapq.nlargest(limite, biblioteca.puntuar_aproximado(consulta, umbral).items(),
+                                         key=lambda par: (par[1], -numeros[par[0]]))
+                resultado = [(numeros[isbn], biblioteca.buscar_libro_por_isbn(isbn), puntuacion)
+                             for isbn, puntuacion in mejores]
+            else:
+                resultado = getattr(biblioteca, metodo)(*argumentos)
+                if metodo == "eliminar_libro" and resultado:
+                    del numeros[argumentos[0]]
+            conexion.send((True, _a_serializable(resultado)))
+        except Exception as e:
+            conexion.send((False, f"{type(e).__name__}: {e}"))
+    conexion.close()
+
+
+class BibliotecaDistribuida:
     """
-    Clase principal que gestiona toda la biblioteca digital.
-    Utiliza diccionarios para almacenar y acceder eficientemente a los libros.
-    Utiliza conjuntos para asegurar IDs de usuario únicos.
+    Biblioteca repartida en varios procesos para aprovechar más de un núcleo.
+    Los libros se reparten entre fragmentos según un hash estable de su ISBN; los usuarios
+    se registran en todos los fragmentos. Las operaciones sobre un ISBN se envían solo al
+    fragmento que lo contiene, y las búsquedas se envían a todos a la vez y se combinan
+    en el orden del catálogo, como en una Biblioteca de un solo proceso.
+    Un catálogo grande se carga con cargar_catalogo(), a través de memoria compartida.
+    Los libros y usuarios se devuelven como diccionarios (ver libro_a_diccionario).
     """
-    def __init__(self, nombre):
-        self.__nombre = nombre
-        self.__libros = {}  # Diccionario para almacenar libros (clave: ISBN, valor: objeto Libro)
-        self.__usuarios = {}  # Diccionario para almacenar usuarios (clave: ID, valor: objeto Usuario)
-        self.__ids_usuario = set()  # Conjunto para garantizar IDs únicos
-        self.__historial_prestamos = []  # Lista para registrar el historial de préstamos
-        
+    def __init__(self, num_fragmentos=None, tamano_cache=256):
+        self.__conexiones = []
+        self.__procesos = []
+        self.__siguiente_numero = 0  # Número de alta global del próximo libro
+        num_fragmentos = num_fragmentos or os.cpu_count() or 1
+        # Los fragmentos heredan el registro de memoria compartida de este proceso, así que el
+        # bloque de cargar_catalogo() se libera una sola vez, aquí, y no al terminar cada fragmento
+        resource_tracker.ensure_running()
+        for fragmento in range(num_fragmentos):
+            local, remota = multiprocessing.Pipe()
+            proceso = multiprocessing.Process(target=_ejecutar_fragmento, daemon=True,
+                                              args=(remota, fragmento, num_fragmentos, tamano_cache))
+            proceso.start()
+            remota.close()
+            self.__conexiones.append(local)
+            self.__procesos.append(proceso)
+
     @property
-    def nombre(self):
-        return self.__nombre
-    
+    def num_fragmentos(self):
+        return len(self.__conexiones)
+
+    def __fragmento(self, isbn):
+        return _fragmento_de(isbn, len(self.__conexiones))
+
+    def __numerar(self, cantidad=1):
+        """Reserva números de alta consecutivos y retorna el primero"""
+        primero = self.__siguiente_numero
+        self.__siguiente_numero += cantidad
+        return primero
+
+    @staticmethod
+    def __respuesta(conexion):
+        correcto, resultado = conexion.recv()
+        if not correcto:
+            raise RuntimeError(f"Error en un fragmento: {resultado}")
+        return resultado
+
+    def __llamar(self, fragmento, metodo, *argumentos):
+        """Ejecuta un método en un único fragmento"""
+        conexion = self.__conexiones[fragmento]
+        conexion.send((metodo, argumentos))
+        return self.__respuesta(conexion)
+
+    def __difundir(self, metodo, *argumentos):
+        """Envía el método a todos los fragmentos antes de esperar, para que trabajen en paralelo"""
+        for conexion in self.__conexiones:
+            conexion.send((metodo, argumentos))
+        return [self.__respuesta(conexion) for conexion in self.__conexiones]
+
     def agregar_libro(self, libro):
+        datos = [libro.titulo, libro.autor, libro.categoria, libro.isbn, libro.adaptacion]
+        return self.__llamar(self.__fragmento(libro.isbn), "agregar_libro", datos, self.__numerar())
+
+    def agregar_libros_lote(self, libros):
+        """Reparte el lote entre los fragmentos; retorna los ISBNs rechazados por repetidos"""
+        libros = list(libros)
+        primero = self.__numerar(len(libros))
+        lotes = [[] for _ in self.__conexiones]
+        for posicion, libro in enumerate(libros):
+            lotes[self.__fragmento(libro.isbn)].append(
+                ([libro.titulo, libro.autor, libro.categoria, libro.isbn, libro.adaptacion], primero + posicion))
+        for conexion, lote in zip(self.__conexiones, lotes):
+            conexion.send(("agregar_libros_lote", (lote,)))
+        return [isbn for conexion in self.__conexiones for isbn in self.__respuesta(conexion)]
+
+    def cargar_catalogo(self, libros):
         """
-        Añade un nuevo libro a la biblioteca.
-        Si ya existe un libro con el mismo ISBN, devuelve False.
+        Carga muchos libros a la vez: se copian una sola vez a un CatalogoCompartido y cada
+        fragmento lee de él solo los suyos. Retorna los ISBNs rechazados por repetidos.
         """
-        if libro.isbn in self.__libros:
-            return False
-        self.__libros[libro.isbn] = libro
-        return True
-    
+        libros = list(libros)
+        catalogo = CatalogoCompartido.crear(libros)
+        try:
+            rechazados = self.__difundir("cargar_compartido", catalogo.nombre, self.__numerar(len(libros)))
+        finally:
+            catalogo.cerrar()
+        return [isbn for parcial in rechazados for isbn in parcial]
+
     def eliminar_libro(self, isbn):
-        """Elimina un libro de la biblioteca por su ISBN"""
-        if isbn in self.__libros and self.__libros[isbn].disponible:
-            del self.__libros[isbn]
-            return True
-        return False
-    
+        return self.__llamar(self.__fragmento(isbn), "eliminar_libro", isbn)
+
     def registrar_usuario(self, nombre, id_usuario):
-        """
-        Registra un nuevo usuario en la biblioteca.
-        Si ya existe un usuario con el mismo ID, devuelve False.
-        """
-        if id_usuario in self.__ids_usuario:
-            return False
-        nuevo_usuario = Usuario(nombre, id_usuario)
-        self.__usuarios[id_usuario] = nuevo_usuario
-        self.__ids_usuario.add(id_usuario)
-        return True
-    
+        return all(self.__difundir("registrar_usuario", nombre, id_usuario))
+
     def dar_baja_usuario(self, id_usuario):
-        """
-        Da de baja a un usuario de la biblioteca.
-        Solo si no tiene libros prestados.
-        """
-        if id_usuario in self.__usuarios:
-            usuario = self.__usuarios[id_usuario]
-            if not usuario.libros_prestados:
-                del self.__usuarios[id_usuario]
-                self.__ids_usuario.remove(id_usuario)
-                return True
-        return False
-    
+        """Da de baja al usuario solo si no tiene libros prestados en ningún fragmento"""
+        if any(self.__difundir("listar_libros_prestados_usuario", id_usuario)):
+            return False
+        return all(self.__difundir("dar_baja_usuario", id_usuario))
+
     def prestar_libro(self, isbn, id_usuario):
-        """
-        Realiza el préstamo de un libro a un usuario.
-        Retorna True si el préstamo fue exitoso, False en caso contrario.
-        """
-        if isbn in self.__libros and id_usuario in self.__usuarios:
-            libro = self.__libros[isbn]
-            usuario = self.__usuarios[id_usuario]
-            
-            if libro.disponible:
-                libro.disponible = False
-                usuario.prestar_libro(libro)
-                # Registrar préstamo en el historial
-                self.__historial_prestamos.append({"tipo": "préstamo", "isbn": isbn, "id_usuario": id_usuario})
-                return True
-        return False
-    
+        return self.__llamar(self.__fragmento(isbn), "prestar_libro", isbn, id_usuario)
+
     def devolver_libro(self, isbn, id_usuario):
-        """
-        Procesa la devolución de un libro prestado.
-        Retorna True si la devolución fue exitosa, False en caso contrario.
-        """
-        if isbn in self.__libros and id_usuario in self.__usuarios:
-            libro = self.__libros[isbn]
-            usuario = self.__usuarios[id_usuario]
-            
-            libro_devuelto = usuario.devolver_libro(isbn)
-            if libro_devuelto:
-                libro.disponible = True
-                # Registrar devolución en el historial
-                self.__historial_prestamos.append({"tipo": "devolución", "isbn": isbn, "id_usuario": id_usuario})
-                return True
-        return False
-    
+        return self.__llamar(self.__fragmento(isbn), "devolver_libro", isbn, id_usuario)
+
     def buscar_libro_por_isbn(self, isbn):
-        """Busca un libro por su ISBN"""
-        return self.__libros.get(isbn)
-    
+        return self.__llamar(self.__fragmento(isbn), "buscar_libro_por_isbn", isbn)
+
+    def reservar_libro(self, isbn, id_usuario):
+        return self.__llamar(self.__fragmento(isbn), "reservar_libro", isbn, id_usuario)
+
+    def prestamos_vencidos(self, ahora=None):
+        """Combina los préstamos vencidos de cada fragmento, ya ordenados por vencimiento"""
+        ahora = time.time() if ahora is None else ahora
+        return list(heapq.merge(*self.__difundir("prestamos_vencidos", ahora), key=lambda vencido: vencido[2]))
+
+    def listar_libros_prestados_usuario(self, id_usuario):
+        return [libro for parcial in self.__difundir("listar_libros_prestados_usuario", id_usuario)
+                for libro in parcial]
+
     def buscar_libros_por_titulo(self, titulo):
-        """Busca libros que contengan el título especificado"""
-        return [libro for libro in self.__libros.values() 
-                if titulo.lower() in libro.titulo.lower()]
-    
+        return self.__combinar(self.__difundir("buscar_libros_por_titulo", titulo))
+
     def buscar_libros_por_autor(self, autor):
-        """Busca libros escritos por el autor especificado"""
-        return [libro for libro in self.__libros.values() 
-                if autor.lower() in libro.autor.lower()]
-    
+        return self.__combinar(self.__difundir("buscar_libros_por_autor", autor))
+
     def buscar_libros_por_categoria(self, categoria):
-        """Busca libros de la categoría especificada"""
-        return [libro for libro in self.__libros.values() 
-                if categoria.lower() == libro.categoria.lower()]
-    
+        return self.__combinar(self.__difundir("buscar_libros_por_categoria", categoria))
+
     def buscar_libros_por_adaptacion(self, adaptacion):
-        """Busca libros adaptados a una serie o película específica"""
-        return [libro for libro in self.__libros.values() 
-                if libro.adaptacion and adaptacion.lower() in libro.adaptacion.lower()]
-    
-    def listar_libros_prestados_usuario(self, id_usuario):
-        """Lista todos los libros prestados a un usuario específico"""
-        if id_usuario in self.__usuarios:
-            return self.__usuarios[id_usuario].listar_libros_prestados()
-        return []
-    
-    def listar_todos_libros(self):
-        """Lista todos los libros de la biblioteca"""
-        return list(self.__libros.values())
-    
-    def listar_usuarios(self):
-        """Lista todos los usuarios registrados"""
-        return list(self.__usuarios.values())
-    
-    def obtener_usuario(self, id_usuario):
-        """Obtiene un usuario por su ID"""
-        return self.__usuarios.get(id_usuario)
+        return self.__combinar(self.__difundir("buscar_libros_por_adaptacion", adaptacion))
+
+    def buscar_libros_aproximado(self, consulta, limite=10, umbral=0.5):
+        """
+        Combina los mejores resultados de cada fragmento en un único ranking.
+        A igual puntuación se respeta el orden del catálogo, como en Biblioteca.
+        """
+        parciales = self.__difundir("puntuar_aproximado", consulta, limite, umbral)
+        mejores = heapq.nlargest(limite, (terna for parcial in parciales for terna in parcial),
+                                 key=lambda terna: (terna[2], -terna[0]))
+        return [(libro, round(puntuacion[0], 3)) for _, libro, puntuacion in mejores]
+
+    @staticmethod
+    def __combinar(parciales):
+        """Mezcla los resultados (número de alta, libro) de cada fragmento en el orden del catálogo"""
+        return [libro for _, libro in heapq.merge(*parciales, key=lambda par: par[0])]
+
+    def estadisticas(self, top=None):
+        """Suma las estadísticas de todos los fragmentos"""
+        parciales = self.__difundir("estadisticas")
+        resultado = {clave: sum(parcial[clave] for parcial in parciales)
+                     for clave in ("total_libros", "disponibles", "prestados", "total_prestamos", "total_devoluciones")}
+        resultado["total_usuarios"] = parciales[0]["total_usuarios"]
+        for clave in ("categorias", "adaptaciones"):
+            conteos = {}
+            for parcial in parciales:
+                for nombre, cantidad in parcial[clave]:
+                    conteos[nombre] = conteos.get(nombre, 0) + cantidad
+            ordenados = sorted(conteos.items(), key=lambda x: x[1], reverse=True)
+            resultado[clave] = ordenados if top is None else ordenados[:top]
+        return resultado
+
+    def cerrar(self):
+        """Detiene los procesos de los fragmentos"""
+        for conexion in self.__conexiones:
+            conexion.send(None)
+            conexion.close()
+        for proceso in self.__procesos:
+            proceso.join()
+        self.__conexiones = []
+        self.__procesos = []
 
 
 def mostrar_menu():
@@ -262,6 +2833,7 @@ def menu_gestion_libros(biblioteca):
         print(" 2. Eliminar un libro")
         print(" 3. Listar todos los libros")
         print(" 4. Ver detalles de un libro")
+        print(" 5. Importar catálogo desde archivo (CSV/JSONL)")
         print(" 0. Volver al menú principal")
         print("-"*50)
         
@@ -291,13 +2863,8 @@ def menu_gestion_libros(biblioteca):
                 print("\n❌ No se pudo eliminar el libro. Verifique que exista y no esté prestado.")
                 
         elif opcion == "3":
-            libros = biblioteca.listar_todos_libros()
-            if libros:
-                print("\nCATÁLOGO DE LIBROS:")
-                for i, libro in enumerate(libros, 1):
-                    print(f"{i}. {libro}")
-            else:
-                print("\n📚 No hay libros en la biblioteca.")
+            libros = (libro for _, libro in biblioteca.iterar_libros())
+            mostrar_paginado(libros, "\nCATÁLOGO DE LIBROS:", "\n📚 No hay libros en la biblioteca.")
                 
         elif opcion == "4":
             isbn = input("Ingrese el ISBN del libro: ")
@@ -311,9 +2878,30 @@ def menu_gestion_libros(biblioteca):
                 if libro.adaptacion:
                     print(f"Adaptación: {libro.adaptacion}")
                 print(f"Estado: {'Disponible' if libro.disponible else 'Prestado'}")
+                prestatario = biblioteca.obtener_prestatario(isbn)
+                if prestatario:
+                    print(f"Prestado a: {prestatario.nombre} (ID: {prestatario.id_usuario})")
             else:
                 print("\n❌ Libro no encontrado.")
                 
+        elif opcion == "5":
+            ruta = input("Ruta del archivo a importar: ")
+            try:
+                informe = importar_catalogo(biblioteca, ruta)
+            except OSError as e:
+                print(f"\n❌ No se pudo leer el archivo: {e}")
+                continue
+            except (ValueError, csv.Error) as e:
+                # Incluye UnicodeDecodeError: el archivo no está en UTF-8
+                print(f"\n❌ El archivo no tiene un formato válido: {e}")
+                continue
+            print(f"\n✅ Importación terminada: {informe['aceptadas']} libros añadidos, "
+                  f"{informe['rechazadas']} filas rechazadas ({informe['filas_por_segundo']:.0f} filas/s).")
+            for numero, motivo in informe["errores"]:
+                print(f"- Fila {numero}: {motivo}")
+            if informe["rechazadas"] > len(informe["errores"]):
+                print(f"... y {informe['rechazadas'] - len(informe['errores'])} filas rechazadas más.")
+                
         elif opcion == "0":
             break
             
@@ -353,13 +2941,8 @@ def menu_gestion_usuarios(biblioteca):
                 print("\n❌ No se pudo dar de baja al usuario. Verifique que exista y no tenga libros prestados.")
                 
         elif opcion == "3":
-            usuarios = biblioteca.listar_usuarios()
-            if usuarios:
-                print("\nUSUARIOS REGISTRADOS:")
-                for i, usuario in enumerate(usuarios, 1):
-                    print(f"{i}. {usuario}")
-            else:
-                print("\n👤 No hay usuarios registrados.")
+            usuarios = (usuario for _, usuario in biblioteca.iterar_usuarios())
+            mostrar_paginado(usuarios, "\nUSUARIOS REGISTRADOS:", "\n👤 No hay usuarios registrados.")
                 
         elif opcion == "4":
             id_usuario = input("Ingrese el ID del usuario: ")
@@ -393,6 +2976,9 @@ def menu_prestamos_devoluciones(biblioteca):
         print(" 1. Prestar un libro")
         print(" 2. Devolver un libro")
         print(" 3. Ver libros prestados a un usuario")
+        print(" 4. Ver historial de préstamos de un usuario")
+        print(" 5. Reservar un libro prestado")
+        print(" 6. Ver préstamos vencidos")
         print(" 0. Volver al menú principal")
         print("-"*50)
         
@@ -410,9 +2996,10 @@ def menu_prestamos_devoluciones(biblioteca):
             elif not libro:
                 print("\n❌ Libro no encontrado.")
             elif not libro.disponible:
-                print("\n❌ El libro no está disponible actualmente.")
+                print("\n❌ El libro no está disponible actualmente. Puede reservarlo con la opción 5.")
             elif biblioteca.prestar_libro(isbn, id_usuario):
-                print(f"\n✅ Libro '{libro.titulo}' prestado con éxito a {usuario.nombre}.")
+                vencimiento = time.strftime("%Y-%m-%d", time.localtime(biblioteca.vencimiento_prestamo(isbn)))
+                print(f"\n✅ Libro '{libro.titulo}' prestado con éxito a {usuario.nombre}. Devolver antes del {vencimiento}.")
             else:
                 print("\n❌ No se pudo realizar el préstamo.")
                 
@@ -429,6 +3016,9 @@ def menu_prestamos_devoluciones(biblioteca):
                 print("\n❌ Libro no encontrado.")
             elif biblioteca.devolver_libro(isbn, id_usuario):
                 print(f"\n✅ Libro '{libro.titulo}' devuelto con éxito por {usuario.nombre}.")
+                siguiente = biblioteca.obtener_prestatario(isbn)
+                if siguiente:
+                    print(f"📚 El libro queda prestado a {siguiente.nombre}, que lo tenía reservado.")
             else:
                 print("\n❌ No se pudo realizar la devolución. Verifique que el libro esté prestado a este usuario.")
                 
@@ -447,6 +3037,48 @@ def menu_prestamos_devoluciones(biblioteca):
             else:
                 print("\n❌ Usuario no encontrado.")
                 
+        elif opcion == "4":
+            id_usuario = input("ID del usuario: ")
+            eventos = biblioteca.historial_usuario(id_usuario)
+            
+            if eventos:
+                print(f"\nHISTORIAL DE PRÉSTAMOS DEL USUARIO {id_usuario}:")
+                for i, evento in enumerate(eventos, 1):
+                    fecha = time.strftime("%Y-%m-%d %H:%M", time.localtime(evento["fecha"]))
+                    print(f"{i}. {fecha} - {evento['tipo'].capitalize()} - ISBN: {evento['isbn']}")
+            else:
+                print("\n📚 No hay movimientos registrados para ese usuario.")
+                
+        elif opcion == "5":
+            id_usuario = input("ID del usuario: ")
+            isbn = input("ISBN del libro: ")
+            
+            usuario = biblioteca.obtener_usuario(id_usuario)
+            libro = biblioteca.buscar_libro_por_isbn(isbn)
+            
+            if not usuario:
+                print("\n❌ Usuario no encontrado.")
+            elif not libro:
+                print("\n❌ Libro no encontrado.")
+            elif libro.disponible:
+                print("\n❌ El libro está disponible: puede prestarse directamente.")
+            elif biblioteca.reservar_libro(isbn, id_usuario):
+                posicion = len(biblioteca.reservas_libro(isbn))
+                print(f"\n✅ Reserva registrada. {usuario.nombre} ocupa el puesto {posicion} de la cola.")
+            else:
+                print("\n❌ No se pudo reservar. Verifique que el usuario no tenga ya el libro o una reserva.")
+                
+        elif opcion == "6":
+            vencidos = biblioteca.prestamos_vencidos()
+            
+            if vencidos:
+                print("\nPRÉSTAMOS VENCIDOS:")
+                for i, (libro, id_usuario, vencimiento) in enumerate(vencidos, 1):
+                    fecha = time.strftime("%Y-%m-%d", time.localtime(vencimiento))
+                    print(f"{i}. {libro.titulo} (ISBN: {libro.isbn}) - Usuario: {id_usuario} - Vencido el {fecha}")
+            else:
+                print("\n📚 No hay préstamos vencidos.")
+                
         elif opcion == "0":
             break
             
@@ -465,6 +3097,8 @@ def menu_busquedas(biblioteca):
         print(" 3. Buscar por categoría")
         print(" 4. Buscar por ISBN")
         print(" 5. Buscar por adaptación")
+        print(" 6. Búsqueda aproximada (tolera errores y tildes)")
+        print(" 7. Buscar por prefijo de ISBN (editorial)")
         print(" 0. Volver al menú principal")
         print("-"*50)
         
@@ -499,6 +3133,16 @@ def menu_busquedas(biblioteca):
             resultados = biblioteca.buscar_libros_por_adaptacion(adaptacion)
             mostrar_resultados_busqueda(resultados)
                 
+        elif opcion == "6":
+            consulta = input("Ingrese el texto a buscar: ")
+            resultados = biblioteca.buscar_libros_aproximado(consulta)
+            mostrar_resultados_busqueda([libro for libro, _ in resultados])
+                
+        elif opcion == "7":
+            prefijo = input("Ingrese el prefijo de ISBN a buscar: ")
+            resultados = biblioteca.buscar_libros_por_prefijo_isbn(prefijo)
+            mostrar_resultados_busqueda(resultados)
+                
         elif opcion == "0":
             break
             
@@ -506,14 +3150,32 @@ def menu_busquedas(biblioteca):
             print("\n❌ Opción inválida, intente nuevamente.")
 
 
+TAMANO_PAGINA = 20
+
+
+def mostrar_paginado(elementos, encabezado, mensaje_vacio, tamano=TAMANO_PAGINA):
+    """
+    Muestra los elementos de un iterable numerados y por páginas.
+    Los elementos se consumen a medida que se muestran, y entre página y página
+    se pregunta al usuario si desea continuar. Retorna cuántos se mostraron.
+    """
+    mostrados = 0
+    for elemento in elementos:
+        if mostrados == 0:
+            print(encabezado)
+        elif mostrados % tamano == 0:
+            if input(f"-- {mostrados} mostrados. Enter para ver más, 'q' para terminar: ").strip().lower() == "q":
+                break
+        mostrados += 1
+        print(f"{mostrados}. {elemento}")
+    if mostrados == 0:
+        print(mensaje_vacio)
+    return mostrados
+
+
 def mostrar_resultados_busqueda(resultados):
     """Muestra los resultados de una búsqueda"""
-    if resultados:
-        print("\nRESULTADOS DE LA BÚSQUEDA:")
-        for i, libro in enumerate(resultados, 1):
-            print(f"{i}. {libro}")
-    else:
-        print("\n📚 No se encontraron resultados.")
+    mostrar_paginado(resultados, "\nRESULTADOS DE LA BÚSQUEDA:", "\n📚 No se encontraron resultados.")
 
 
 def menu_informes(biblioteca):
@@ -526,91 +3188,85 @@ def menu_informes(biblioteca):
         print(" 2. Listado de libros prestados")
         print(" 3. Estadísticas de la biblioteca")
         print(" 4. Listado de libros por adaptación")
+        print(" 5. Informe de rendimiento (instrumentación)")
         print(" 0. Volver al menú principal")
         print("-"*50)
         
         opcion = input("Seleccione una opción: ")
         
         if opcion == "1":
-            libros = biblioteca.listar_todos_libros()
-            disponibles = [libro for libro in libros if libro.disponible]
+            disponibles = (libro for _, libro in biblioteca.iterar_libros(estado="disponibles"))
             
-            if disponibles:
-                print("\nLIBROS DISPONIBLES:")
-                for i, libro in enumerate(disponibles, 1):
-                    print(f"{i}. {libro}")
-                print(f"\nTotal: {len(disponibles)} libros disponibles")
-            else:
-                print("\n📚 No hay libros disponibles.")
+            if mostrar_paginado(disponibles, "\nLIBROS DISPONIBLES:", "\n📚 No hay libros disponibles."):
+                print(f"\nTotal: {biblioteca.estadisticas()['disponibles']} libros disponibles")
                 
         elif opcion == "2":
-            libros = biblioteca.listar_todos_libros()
-            prestados = [libro for libro in libros if not libro.disponible]
+            prestados = (libro for _, libro in biblioteca.iterar_libros(estado="prestados"))
             
-            if prestados:
-                print("\nLIBROS PRESTADOS:")
-                for i, libro in enumerate(prestados, 1):
-                    print(f"{i}. {libro}")
-                print(f"\nTotal: {len(prestados)} libros prestados")
-            else:
-                print("\n📚 No hay libros prestados actualmente.")
+            if mostrar_paginado(prestados, "\nLIBROS PRESTADOS:", "\n📚 No hay libros prestados actualmente."):
+                print(f"\nTotal: {biblioteca.estadisticas()['prestados']} libros prestados")
                 
         elif opcion == "3":
-            libros = biblioteca.listar_todos_libros()
-            usuarios = biblioteca.listar_usuarios()
+            estadisticas = biblioteca.estadisticas()
             
-            total_libros = len(libros)
-            disponibles = sum(1 for libro in libros if libro.disponible)
-            prestados = total_libros - disponibles
+            total_libros = estadisticas["total_libros"]
+            prestados = estadisticas["prestados"]
             
             print("\nESTADÍSTICAS DE LA BIBLIOTECA:")
             print(f"Total de libros: {total_libros}")
-            print(f"Libros disponibles: {disponibles}")
+            print(f"Libros disponibles: {estadisticas['disponibles']}")
             print(f"Libros prestados: {prestados}")
             print(f"Porcentaje de préstamo: {(prestados/total_libros*100) if total_libros else 0:.2f}%")
-            print(f"Total de usuarios: {len(usuarios)}")
+            print(f"Total de usuarios: {estadisticas['total_usuarios']}")
             
             # Categorías más populares
-            categorias = {}
-            for libro in libros:
-                categorias[libro.categoria] = categorias.get(libro.categoria, 0) + 1
-            
-            if categorias:
+            if estadisticas["categorias"]:
                 print("\nCategorías de libros:")
-                for categoria, cantidad in sorted(categorias.items(), key=lambda x: x[1], reverse=True):
+                for categoria, cantidad in estadisticas["categorias"]:
                     print(f"- {categoria}: {cantidad} libros")
                     
             # Adaptaciones más populares
-            adaptaciones = {}
-            for libro in libros:
-                if libro.adaptacion:
-                    adaptaciones[libro.adaptacion] = adaptaciones.get(libro.adaptacion, 0) + 1
-            
-            if adaptaciones:
+            if estadisticas["adaptaciones"]:
                 print("\nLibros por adaptación:")
-                for adaptacion, cantidad in sorted(adaptaciones.items(), key=lambda x: x[1], reverse=True):
+                for adaptacion, cantidad in estadisticas["adaptaciones"]:
                     print(f"- {adaptacion}: {cantidad} libros")
                 
         elif opcion == "4":
-            libros = biblioteca.listar_todos_libros()
-            adaptados = {}
-            
-            for libro in libros:
-                if libro.adaptacion:
-                    if libro.adaptacion not in adaptados:
-                        adaptados[libro.adaptacion] = []
-                    adaptados[libro.adaptacion].append(libro)
+            adaptados = biblioteca.agrupar_por_adaptacion()
             
             if adaptados:
                 print("\nLIBROS POR ADAPTACIÓN:")
-                for adaptacion, lista_libros in sorted(adaptados.items()):
+                for adaptacion, lista_libros in adaptados:
                     print(f"\n== {adaptacion.upper()} ==")
                     for i, libro in enumerate(lista_libros, 1):
                         print(f"{i}. {libro.titulo} por {libro.autor}")
-                print(f"\nTotal: {sum(len(libros) for libros in adaptados.values())} libros adaptados")
+                print(f"\nTotal: {sum(len(libros) for _, libros in adaptados)} libros adaptados")
             else:
                 print("\n📚 No hay libros con adaptaciones registradas.")
                 
+        elif opcion == "5":
+            instrumentacion = biblioteca.instrumentacion
+            
+            if instrumentacion is None:
+                if input("\nLa instrumentación está desactivada. ¿Activarla ahora? (s/n): ").lower() == "s":
+                    biblioteca.activar_instrumentacion()
+                    print("\n✅ Instrumentación activada. Vuelva a esta opción para ver las mediciones.")
+            elif not instrumentacion.informe():
+                print("\n📚 Todavía no hay llamadas medidas.")
+            else:
+                print("\nINFORME DE RENDIMIENTO:")
+                print(instrumentacion.informe_texto())
+                ruta = input("\nRuta para exportar en JSON (Enter para omitir): ")
+                if ruta:
+                    try:
+                        with open(ruta, "w", encoding="utf-8") as archivo:
+                            json.dump(instrumentacion.informe(), archivo, indent=2, ensure_ascii=False)
+                        print(f"\n✅ Informe exportado a {ruta}.")
+                    except OSError as e:
+                        print(f"\n❌ No se pudo exportar el informe: {e}")
+                if input("¿Desactivar la instrumentación? (s/n): ").lower() == "s":
+                    biblioteca.desactivar_instrumentacion()
+                
         elif opcion == "0":
             break
             
@@ -622,10 +3278,15 @@ def main():
     """Función principal del programa"""
     print("\n¡Bienvenido al Sistema de Gestión de Biblioteca de Libros Adaptados a Series!")
     nombre_biblioteca = input("Ingrese el nombre de la biblioteca: ")
-    biblioteca = Biblioteca(nombre_biblioteca)
+    almacen = AlmacenBiblioteca("datos_biblioteca")
+    biblioteca = Biblioteca(nombre_biblioteca, almacen)
     
-    # Agregar datos de ejemplo con libros adaptados a series
-    cargar_datos_ejemplo(biblioteca)
+    if almacen.existe():
+        # Recuperar el estado guardado en la sesión anterior
+        almacen.cargar(biblioteca)
+    else:
+        # Agregar datos de ejemplo con libros adaptados a series
+        cargar_datos_ejemplo(biblioteca)
     
     while True:
         opcion = mostrar_menu()
@@ -641,6 +3302,8 @@ def main():
         elif opcion == "5":
             menu_informes(biblioteca)
         elif opcion == "0":
+            biblioteca.guardar()
+            almacen.cerrar()
             print("\n¡Gracias por utilizar el Sistema de Gestión de Biblioteca Digital!")
             break
         else:
@@ -691,5 +3354,496 @@ def cargar_datos_ejemplo(biblioteca):
     biblioteca.prestar_libro("9788448006426", "U001")  # Buenos Presagios para Ana
 
 
+SILABAS = ["ca", "lo", "mi", "ra", "to", "ne", "su", "ve", "da", "ri", "po", "la", "gen", "tor", "bel", "mar"]
+
+
+class MuestreadorZipf:
+    """
+    Elige posiciones 0..n-1 con probabilidad proporcional a 1/(posición+1)^exponente.
+    Las primeras posiciones son las más populares, como ocurre con los préstamos reales.
+    """
+    def __init__(self, n, aleatorio, exponente=1.0):
+        self.__aleatorio = aleatorio
+        self.__acumulado = array.array("d")
+        total = 0.0
+        for posicion in range(1, n + 1):
+            total += posicion ** -exponente
+            self.__acumulado.append(total)
+        self.__total = total
+
+    def muestra(self):
+        posicion = bisect.bisect(self.__acumulado, self.__aleatorio.random() * self.__total)
+        return min(posicion, len(self.__acumulado) - 1)
+
+
+def _isbn_sintetico(numero):
+    """ISBN-13 válido y único para cada número; el orden queda barajado respecto al de alta"""
+    cuerpo = "978" + f"{(numero * 1000003 + 12345) % 10 ** 9:09d}"
+    suma = sum(int(digito) * (1 if i % 2 == 0 else 3) for i, digito in enumerate(cuerpo))
+    return cuerpo + str((10 - suma % 10) % 10)
+
+
+def generar_datos(num_libros, num_usuarios, semilla=0):
+    """
+    Genera de forma determinista un catálogo sintético.
+    Retorna (libros, usuarios, vocabulario): un generador de Libro, una lista de tuplas
+    (nombre, id_usuario) y las palabras usadas en los títulos (útiles para consultas).
+    La misma semilla produce siempre los mismos datos.
+    """
+    aleatorio = random.Random(semilla)
+    vocabulario = sorted({a + b + c for a in SILABAS for b in SILABAS for c in ["", "s", "n"]})
+    autores = [f"{aleatorio.choice(vocabulario).title()} {aleatorio.choice(vocabulario).title()}"
+               for _ in range(max(10, num_libros // 20))]
+    categorias = [f"Categoría {aleatorio.choice(vocabulario).title()}" for _ in range(30)]
+    adaptaciones = [f"{aleatorio.choice(vocabulario).title()} (Serie)" for _ in range(50)]
+    usuarios = [(f"Usuario {aleatorio.choice(vocabulario).title()}", f"U{numero:08d}")
+                for numero in range(num_usuarios)]
+
+    def libros():
+        for numero in range(num_libros):
+            titulo = " ".join(aleatorio.choice(vocabulario) for _ in range(aleatorio.randint(2, 4))).capitalize()
+            adaptacion = aleatorio.choice(adaptaciones) if aleatorio.random() < 0.2 else None
+            yield Libro(titulo, aleatorio.choice(autores), aleatorio.choice(categorias),
+                        _isbn_sintetico(numero), adaptacion)
+
+    return libros(), usuarios, vocabulario
+
+
+def generar_operaciones(isbns, ids_usuarios, num_operaciones, semilla=0, exponente=1.0):
+    """
+    Genera una carga determinista de préstamos y devoluciones como tuplas (tipo, isbn, id_usuario).
+    Libros y usuarios se eligen con distribución Zipf (unos pocos concentran la actividad);
+    la mitad de las operaciones devuelve un préstamo pendiente elegido al azar.
+    Si el libro elegido ya está prestado, el préstamo se genera igualmente y fallará.
+    """
+    aleatorio = random.Random(semilla)
+    libros = MuestreadorZipf(len(isbns), aleatorio, exponente)
+    usuarios = MuestreadorZipf(len(ids_usuarios), aleatorio, exponente)
+    pendientes = []  # Préstamos pendientes (isbn, id_usuario)
+    posiciones = {}  # Diccionario ISBN -> posición en pendientes
+    for _ in range(num_operaciones):
+        if pendientes and aleatorio.random() < 0.5:
+            posicion = aleatorio.randrange(len(pendientes))
+            isbn, id_usuario = pendientes[posicion]
+            pendientes[posicion] = pendientes[-1]
+            posiciones[pendientes[posicion][0]] = posicion
+            pendientes.pop()
+            del posiciones[isbn]
+            yield "devolver", isbn, id_usuario
+        else:
+            isbn = isbns[libros.muestra()]
+            id_usuario = ids_usuarios[usuarios.muestra()]
+            if isbn not in posiciones:
+                posiciones[isbn] = len(pendientes)
+                pendientes.append((isbn, id_usuario))
+            yield "prestar", isbn, id_usuario
+
+
+def _medir(tiempos, metodo, funcion, *argumentos):
+    """
+    Ejecuta la función y acumula su duración en tiempos[metodo].
+    Si retorna un generador, se consume dentro de la medición y se retorna None.
+    """
+    inicio = time.perf_counter()
+    resultado = funcion(*argumentos)
+    if isinstance(resultado, types.GeneratorType):
+        collections.deque(resultado, maxlen=0)
+        resultado = None
+    duracion = time.perf_counter() - inicio
+    if metodo not in tiempos:
+        tiempos[metodo] = array.array("d")
+    tiempos[metodo].append(duracion)
+    return resultado
+
+
+def _resumir_tiempos(duraciones, llamadas=None):
+    """Resumen de las duraciones de un método, en microsegundos por llamada"""
+    ordenadas = sorted(duraciones)
+    total = sum(ordenadas)
+    llamadas = llamadas or len(ordenadas)
+
+    def percentil(p):
+        return ordenadas[min(int(len(ordenadas) * p), len(ordenadas) - 1)] * 1e6
+
+    return {
+        "llamadas": llamadas,
+        "total_s": round(total, 6),
+        "media_us": round(total / llamadas * 1e6, 3),
+        "p50_us": round(percentil(0.50), 3),
+        "p99_us": round(percentil(0.99), 3),
+        "max_us": round(ordenadas[-1] * 1e6, 3),
+    }
+
+
+def ejecutar_benchmark(escalas=(1000, 10000, 100000), semilla=0, consultas=200, usuarios_por_libro=0.1):
+    """
+    Mide todos los métodos públicos de Biblioteca sobre catálogos sintéticos de cada escala.
+    Retorna un diccionario serializable a JSON con, para cada escala y método, el número de
+    llamadas y la latencia media, p50, p99 y máxima en microsegundos.
+    En agregar_libros_lote las llamadas y la media son por libro, y los percentiles por lote.
+    La caché de consultas está desactivada, para medir las búsquedas y no los aciertos de caché.
+    """
+    resultado = {
+        "semilla": semilla,
+        "python": sys.version.split()[0],
+        "plataforma": sys.platform,
+        "escalas": [],
+    }
+    for num_libros in escalas:
+        num_usuarios = max(10, int(num_libros * usuarios_por_libro))
+        num_operaciones = max(1000, num_libros // 10)
+        libros, usuarios, vocabulario = generar_datos(num_libros, num_usuarios, semilla)
+        aleatorio = random.Random(semilla)
+        # Sin caché de consultas: las búsquedas repetidas del vocabulario medirían aciertos de caché
+        biblioteca = Biblioteca(f"Benchmark {num_libros}", tamano_cache=0)
+        tiempos = {}
+        llamadas_lote = 0
+
+        # Altas: la mitad una a una y la otra mitad por lotes
+        isbns = []
+        for libro in libros:
+            isbns.append(libro.isbn)
+            if len(isbns) <= num_libros // 2:
+                _medir(tiempos, "agregar_libro", biblioteca.agregar_libro, libro)
+            else:
+                lote = [libro]
+                lote.extend(itertools.islice(libros, 9999))
+                isbns.extend(otro.isbn for otro in lote[1:])
+                llamadas_lote += len(lote)
+                _medir(tiempos, "agregar_libros_lote", biblioteca.agregar_libros_lote, lote)
+        for nombre, id_usuario in usuarios:
+            _medir(tiempos, "registrar_usuario", biblioteca.registrar_usuario, nombre, id_usuario)
+        ids_usuarios = [id_usuario for _, id_usuario in usuarios]
+
+        # Carga de préstamos y devoluciones
+        metodos_carga = {"prestar": biblioteca.prestar_libro, "devolver": biblioteca.devolver_libro}
+        for tipo, isbn, id_usuario in generar_operaciones(isbns, ids_usuarios, num_operaciones, semilla):
+            _medir(tiempos, f"{tipo}_libro", metodos_carga[tipo], isbn, id_usuario)
+        for _ in range(consultas // 10):
+            id_usuario = aleatorio.choice(ids_usuarios)
+            lote = aleatorio.sample(isbns, min(5, len(isbns)))
+            if _medir(tiempos, "prestar_lote", biblioteca.prestar_lote, lote, id_usuario)[0]:
+                _medir(tiempos, "devolver_lote", biblioteca.devolver_lote, lote, id_usuario)
+
+        # Búsquedas
+        for _ in range(consultas):
+            isbn = aleatorio.choice(isbns)
+            palabra = aleatorio.choice(vocabulario)
+            libro = biblioteca.buscar_libro_por_isbn(isbn)
+            _medir(tiempos, "buscar_libro_por_isbn", biblioteca.buscar_libro_por_isbn, isbn)
+            _medir(tiempos, "buscar_libros_por_prefijo_isbn", biblioteca.buscar_libros_por_prefijo_isbn, isbn[:9])
+            _medir(tiempos, "buscar_libros_por_rango_isbn", biblioteca.buscar_libros_por_rango_isbn,
+                   isbn, str(int(isbn) + 10 ** 5))
+            _medir(tiempos, "buscar_libros_por_titulo", biblioteca.buscar_libros_por_titulo, palabra)
+            _medir(tiempos, "buscar_libros_por_autor", biblioteca.buscar_libros_por_autor, libro.autor.split()[0])
+            _medir(tiempos, "buscar_libros_por_categoria", biblioteca.buscar_libros_por_categoria, libro.categoria)
+            _medir(tiempos, "buscar_libros_por_adaptacion", biblioteca.buscar_libros_por_adaptacion,
+                   libro.adaptacion or "serie")
+            _medir(tiempos, "buscar_libros_aproximado", biblioteca.buscar_libros_aproximado,
+                   libro.titulo[:-1] if len(libro.titulo) > 5 else libro.titulo)
+            _medir(tiempos, "paginar_busqueda", biblioteca.paginar_busqueda, "titulo", palabra)
+            _medir(tiempos, "historial_libro", biblioteca.historial_libro, isbn)
+            _medir(tiempos, "obtener_prestatario", biblioteca.obtener_prestatario, isbn)
+            id_usuario = aleatorio.choice(ids_usuarios)
+            _medir(tiempos, "obtener_usuario", biblioteca.obtener_usuario, id_usuario)
+            _medir(tiempos, "historial_usuario", biblioteca.historial_usuario, id_usuario)
+            _medir(tiempos, "listar_libros_prestados_usuario", biblioteca.listar_libros_prestados_usuario, id_usuario)
+
+        # Informes y listados (recorren todo el catálogo, se repiten menos)
+        for _ in range(3):
+            for metodo in ("listar_todos_libros", "listar_libros_disponibles", "listar_libros_prestados",
+                           "contar_libros", "contar_libros_prestados", "estadisticas",
+                           "agrupar_por_adaptacion", "listar_usuarios", "historial_prestamos",
+                           "iterar_libros", "iterar_usuarios"):
+                _medir(tiempos, metodo, getattr(biblioteca, metodo))
+            _medir(tiempos, "paginar_libros", biblioteca.paginar_libros)
+            _medir(tiempos, "paginar_usuarios", biblioteca.paginar_usuarios)
+
+        # Bajas
+        for isbn in aleatorio.sample(isbns, min(consultas, len(isbns))):
+            _medir(tiempos, "eliminar_libro", biblioteca.eliminar_libro, isbn)
+        for id_usuario in aleatorio.sample(ids_usuarios, min(consultas, len(ids_usuarios))):
+            _medir(tiempos, "dar_baja_usuario", biblioteca.dar_baja_usuario, id_usuario)
+
+        metodos = {metodo: _resumir_tiempos(duraciones) for metodo, duraciones in sorted(tiempos.items())}
+        if "agregar_libros_lote" in tiempos:
+            metodos["agregar_libros_lote"] = _resumir_tiempos(tiempos["agregar_libros_lote"], llamadas_lote)
+        resultado["escalas"].append({
+            "libros": num_libros,
+            "usuarios": num_usuarios,
+            "operaciones": num_operaciones,
+            "metodos": metodos,
+        })
+    return resultado
+
+
+def ejecutar_benchmark_fragmentos(num_libros=100000, fragmentos=(1, 2, 4), consultas=500, semilla=0):
+    """
+    Mide el rendimiento de BibliotecaDistribuida según el número de fragmentos.
+    Para cada número de fragmentos carga el mismo catálogo sintético con cargar_catalogo() y
+    lanza la misma secuencia de consultas, una tras otra. Como referencia se mide también una
+    Biblioteca en este mismo proceso (fragmentos = 0).
+    Retorna un diccionario serializable a JSON con el tiempo de carga y las consultas por
+    segundo de cada tipo de búsqueda. La caché de consultas está desactivada.
+    """
+    libros, _, vocabulario = generar_datos(num_libros, 10, semilla)
+    libros = list(libros)
+    aleatorio = random.Random(semilla)
+    pruebas = []
+    for _ in range(consultas):
+        libro = aleatorio.choice(libros)
+        pruebas.append((libro.isbn, aleatorio.choice(vocabulario), libro.autor.split()[0],
+                        libro.titulo[:-1] if len(libro.titulo) > 5 else libro.titulo))
+    resultado = {
+        "libros": num_libros,
+        "consultas": consultas,
+        "semilla": semilla,
+        "python": sys.version.split()[0],
+        "nucleos": os.cpu_count(),
+        "fragmentos": [],
+    }
+    for num_fragmentos in (0,) + tuple(fragmentos):
+        inicio = time.perf_counter()
+        if num_fragmentos:
+            biblioteca = BibliotecaDistribuida(num_fragmentos, tamano_cache=0)
+            biblioteca.cargar_catalogo(libros)
+        else:
+            biblioteca = Biblioteca("Benchmark", tamano_cache=0)
+            biblioteca.agregar_libros_lote(generar_datos(num_libros, 10, semilla)[0])
+        medida = {"fragmentos": num_fragmentos, "carga_s": round(time.perf_counter() - inicio, 3)}
+        for nombre, metodo, posicion in (("buscar_libro_por_isbn", biblioteca.buscar_libro_por_isbn, 0),
+                                         ("buscar_libros_por_titulo", biblioteca.buscar_libros_por_titulo, 1),
+                                         ("buscar_libros_por_autor", biblioteca.buscar_libros_por_autor, 2),
+                                         ("buscar_libros_aproximado", biblioteca.buscar_libros_aproximado, 3)):
+            inicio = time.perf_counter()
+            for prueba in pruebas:
+                metodo(prueba[posicion])
+            medida[f"{nombre}_qps"] = round(consultas / (time.perf_counter() - inicio), 1)
+        if num_fragmentos:
+            biblioteca.cerrar()
+        resultado["fragmentos"].append(medida)
+    return resultado
+
+
+def medir_recuperacion(num_libros=100000, num_operaciones=200000, compactar_cada=50000, semilla=0,
+                       directorio=None):
+    """
+    Mide el coste de la persistencia con un catálogo sintético guardado en un AlmacenBiblioteca.
+    Aplica préstamos y devoluciones (con compactaciones en segundo plano cada 'compactar_cada'
+    operaciones) y mide la latencia de cada una, cuyo máximo incluye la parte de la compactación
+    que bloquea (la copia del estado). Después mide una instantánea forzada, y el tiempo de
+    recuperar la biblioteca desde disco con una cola de operaciones en el registro.
+    Retorna un diccionario serializable a JSON. Sin directorio se usa uno temporal.
+    """
+    temporal = directorio is None
+    directorio = tempfile.mkdtemp(prefix="biblioteca_") if temporal else directorio
+    try:
+        almacen = AlmacenBiblioteca(directorio, compactar_cada=compactar_cada)
+        biblioteca = Biblioteca("Recuperación", almacen, tamano_cache=0)
+        libros, usuarios, _ = generar_datos(num_libros, max(10, num_libros // 10), semilla)
+        libros = list(libros)
+        inicio = time.perf_counter()
+        biblioteca.agregar_libros_lote(libros)
+        for nombre, id_usuario in usuarios:
+            biblioteca.registrar_usuario(nombre, id_usuario)
+        alta = time.perf_counter() - inicio
+
+        isbns = [libro.isbn for libro in libros]
+        metodos = {"prestar": biblioteca.prestar_libro, "devolver": biblioteca.devolver_libro}
+        tiempos = {}
+        fecha = 1_700_000_000.0
+        for tipo, isbn, id_usuario in generar_operaciones(isbns, [id_usuario for _, id_usuario in usuarios],
+                                                          num_operaciones, semilla):
+            fecha += 10  # Unos 23 días de historial cada 200.000 operaciones
+            _medir(tiempos, "operacion", metodos[tipo], isbn, id_usuario, fecha)
+        inicio = time.perf_counter()
+        biblioteca.guardar()
+        instantanea = time.perf_counter() - inicio
+        # Cola de operaciones posteriores a la instantánea, que la recuperación debe reproducir
+        for tipo, isbn, id_usuario in generar_operaciones(isbns, [id_usuario for _, id_usuario in usuarios],
+                                                          min(compactar_cada // 2, num_operaciones), semilla + 1):
+            fecha += 10
+            metodos[tipo](isbn, id_usuario, fecha)
+        almacen.cerrar()
+        esperado = (biblioteca.contar_libros(), biblioteca.contar_libros_prestados(),
+                    sum(1 for _ in biblioteca.historial_prestamos()))
+
+        inicio = time.perf_counter()
+        almacen_recuperado = AlmacenBiblioteca(directorio, compactar_cada=compactar_cada)
+        recuperada = Biblioteca("Recuperación", almacen_recuperado, tamano_cache=0)
+        almacen_recuperado.cargar(recuperada)
+        recuperacion = time.perf_counter() - inicio
+        almacen_recuperado.cerrar()
+        obtenido = (recuperada.contar_libros(), recuperada.contar_libros_prestados(),
+                    sum(1 for _ in recuperada.historial_prestamos()))
+        if obtenido != esperado:
+            raise RuntimeError(f"La biblioteca recuperada no coincide: {obtenido} != {esperado}")
+        operaciones = _resumir_tiempos(tiempos["operacion"])
+        return {
+            "libros": num_libros,
+            "operaciones": num_operaciones,
+            "eventos_historial": esperado[2],
+            "compactar_cada": compactar_cada,
+            "python": sys.version.split()[0],
+            "alta_s": round(alta, 3),
+            "operacion_media_us": operaciones["media_us"],
+            "operacion_p99_us": operaciones["p99_us"],
+            "operacion_max_ms": round(operaciones["max_us"] / 1000, 3),
+            "instantanea_forzada_s": round(instantanea, 3),
+            "instantanea_mb": round(os.path.getsize(os.path.join(directorio, "biblioteca.json")) / 2 ** 20, 2),
+            "recuperacion_s": round(recuperacion, 3),
+        }
+    finally:
+        if temporal:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+
+def ejecutar_benchmark_concurrente(num_libros=20000, hilos=(1, 2, 4, 8), operaciones=8000, sincronizar=True,
+                                   semilla=0):
+    """
+    Prueba de carga concurrente de una Biblioteca(concurrente=True) con almacén.
+    Para cada número de hilos se reparte el mismo total de operaciones: la mitad búsquedas por
+    título y autor, y la otra mitad préstamos y devoluciones de libros al azar (con fsync del
+    registro si sincronizar=True, y compactaciones en segundo plano durante la carga).
+    Al terminar comprueba que contadores, préstamos e historial cuadran, también tras
+    recuperar la biblioteca desde disco, y lanza RuntimeError si no es así.
+    Retorna un diccionario serializable a JSON con las operaciones por segundo y las
+    latencias de cada tipo de operación.
+    """
+    libros, usuarios, vocabulario = generar_datos(num_libros, 200, semilla)
+    libros = list(libros)
+    resultado = {
+        "libros": num_libros,
+        "operaciones": operaciones,
+        "sincronizar": sincronizar,
+        "python": sys.version.split()[0],
+        "nucleos": os.cpu_count(),
+        "hilos": [],
+    }
+    for num_hilos in hilos:
+        directorio = tempfile.mkdtemp(prefix="biblioteca_")
+        try:
+            almacen = AlmacenBiblioteca(directorio, compactar_cada=max(100, operaciones // 4), sincronizar=sincronizar)
+            biblioteca = Biblioteca("Concurrente", almacen, concurrente=True, tamano_cache=0)
+            biblioteca.agregar_libros_lote(Libro(libro.titulo, libro.autor, libro.categoria, libro.isbn,
+                                                 libro.adaptacion) for libro in libros)
+            for nombre, id_usuario in usuarios:
+                biblioteca.registrar_usuario(nombre, id_usuario)
+            tiempos = [{} for _ in range(num_hilos)]
+            errores = []
+            barrera = threading.Barrier(num_hilos + 1)
+
+            def trabajar(numero):
+                aleatorio = random.Random(semilla * 1000 + numero)
+                propios = usuarios[numero::num_hilos]  # Cada hilo presta y devuelve con sus usuarios
+                prestados = []
+                barrera.wait()
+                try:
+                    for _ in range(operaciones // num_hilos):
+                        eleccion = aleatorio.random()
+                        if eleccion < 0.25:
+                            _medir(tiempos[numero], "buscar_libros_por_titulo", biblioteca.buscar_libros_por_titulo,
+                                   aleatorio.choice(vocabulario))
+                        elif eleccion < 0.5:
+                            _medir(tiempos[numero], "buscar_libros_por_autor", biblioteca.buscar_libros_por_autor,
+                                   aleatorio.choice(libros).autor.split()[0])
+                        elif eleccion < 0.75 or not prestados:
+                            isbn, id_usuario = aleatorio.choice(libros).isbn, aleatorio.choice(propios)[1]
+                            if _medir(tiempos[numero], "prestar_libro", biblioteca.prestar_libro, isbn, id_usuario):
+                                prestados.append((isbn, id_usuario))
+                        else:
+                            isbn, id_usuario = prestados.pop(aleatorio.randrange(len(prestados)))
+                            if not _medir(tiempos[numero], "devolver_libro", biblioteca.devolver_libro,
+                                          isbn, id_usuario):
+                                errores.append(f"No se pudo devolver {isbn} de {id_usuario}")
+                except Exception as e:
+                    errores.append(f"{type(e).__name__}: {e}")
+
+            trabajadores = [threading.Thread(target=trabajar, args=(numero,)) for numero in range(num_hilos)]
+            for trabajador in trabajadores:
+                trabajador.start()
+            barrera.wait()
+            inicio = time.perf_counter()
+            for trabajador in trabajadores:
+                trabajador.join()
+            duracion = time.perf_counter() - inicio
+            almacen.cerrar()
+
+            # Comprobaciones de consistencia, en memoria y tras recuperar desde disco
+            estadisticas = biblioteca.estadisticas()
+            prestados = sum(len(usuario.libros_prestados) for usuario in biblioteca.listar_usuarios())
+            eventos = sum(1 for _ in biblioteca.historial_prestamos())
+            if not (estadisticas["prestados"] == prestados
+                    == estadisticas["total_prestamos"] - estadisticas["total_devoluciones"]
+                    and eventos == estadisticas["total_prestamos"] + estadisticas["total_devoluciones"]):
+                errores.append(f"Contadores inconsistentes: {estadisticas}, {prestados} prestados, {eventos} eventos")
+            recuperado = AlmacenBiblioteca(directorio)
+            copia = Biblioteca("Concurrente", recuperado)
+            recuperado.cargar(copia)
+            recuperado.cerrar()
+            if (copia.estadisticas() != estadisticas
+                    or {libro.isbn for libro in copia.listar_libros_prestados()}
+                    != {libro.isbn for libro in biblioteca.listar_libros_prestados()}):
+                errores.append("La biblioteca recuperada no coincide con la original")
+            if errores:
+                raise RuntimeError(f"Prueba con {num_hilos} hilos: {errores[:5]}")
+
+            combinados = {}
+            for parcial in tiempos:
+                for metodo, duraciones in parcial.items():
+                    combinados.setdefault(metodo, array.array("d")).extend(duraciones)
+            resultado["hilos"].append({
+                "hilos": num_hilos,
+                "operaciones_por_segundo": round(sum(map(len, combinados.values())) / duracion, 1),
+                "metodos": {metodo: _resumir_tiempos(duraciones) for metodo, duraciones in sorted(combinados.items())},
+            })
+        finally:
+            shutil.rmtree(directorio, ignore_errors=True)
+    return resultado
+
+
+def servir_biblioteca(puerto=8765):
+    """Arranca la biblioteca guardada (o la de ejemplo) como servidor de red"""
+    almacen = AlmacenBiblioteca("datos_biblioteca")
+    biblioteca = Biblioteca("Biblioteca", almacen)
+    if almacen.existe():
+        almacen.cargar(biblioteca)
+    else:
+        cargar_datos_ejemplo(biblioteca)
+    print(f"Servidor de biblioteca escuchando en el puerto {puerto} (Ctrl+C para detener)")
+    try:
+        asyncio.run(ServidorBiblioteca(biblioteca, puerto=puerto).servir())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        biblioteca.guardar()
+        almacen.cerrar()
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "--servidor":
+        servir_biblioteca(int(sys.argv[2]) if len(sys.argv) > 2 else 8765)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        # Uso: --benchmark [escala ...]  (por ejemplo: --benchmark 1e3 1e5 1e7)
+        escalas = [int(float(escala)) for escala in sys.argv[2:]] or [1000, 10000, 100000]
+        json.dump(ejecutar_benchmark(escalas), sys.stdout, indent=2)
+        print()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--recuperacion":
+        # Uso: --recuperacion [libros] [operaciones]  (por ejemplo: --recuperacion 1e5 2e5)
+        argumentos = [int(float(valor)) for valor in sys.argv[2:4]]
+        json.dump(medir_recuperacion(*argumentos), sys.stdout, indent=2)
+        print()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--concurrencia":
+        # Uso: --concurrencia [hilos ...]  (por ejemplo: --concurrencia 1 2 4 8)
+        hilos = [int(valor) for valor in sys.argv[2:]] or [1, 2, 4, 8]
+        json.dump(ejecutar_benchmark_concurrente(hilos=hilos), sys.stdout, indent=2)
+        print()
+    elif len(sys.argv) > 2 and sys.argv[1] == "--shards":
+        # Uso: --shards N [libros]  (mide la biblioteca distribuida con 1, 2, 4... hasta N fragmentos)
+        maximo = int(sys.argv[2])
+        fragmentos = sorted({min(2 ** potencia, maximo) for potencia in range(maximo.bit_length() + 1)})
+        num_libros = int(float(sys.argv[3])) if len(sys.argv) > 3 else 100000
+        json.dump(ejecutar_benchmark_fragmentos(num_libros, fragmentos), sys.stdout, indent=2)
+        print()
+    else:
+        main()
\ No newline at end of file